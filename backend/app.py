@@ -1,19 +1,49 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g
 from flask_cors import CORS
 import os
+import sys
 import json
-from openai import OpenAI
-import chromadb
-from chromadb.config import Settings
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import numpy as np
 from dotenv import load_dotenv
 
 # Load environment variables from .env file (look in parent directory)
 # Get the backend directory, then go up one level to project root
 BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(BACKEND_DIR)
+
+# Allow `python backend/app.py` as well as `gunicorn backend.app:app`
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+# Before the backend modules below read their settings from the environment
 env_path = os.path.join(PROJECT_ROOT, '.env')
 load_dotenv(env_path, override=True)
-print(f"📁 Loading .env from: {env_path}", flush=True)
+
+from backend import metrics
+from backend.log import get_logger
+from backend.rule_store import RuleStore
+from backend.rule_pack import RULES_PACK_PATH
+from backend.matching import RuleIndex
+from backend.batch_match import BatchMatcher
+from backend.report_cache import (REPORT_CACHE, NAME_PLACEHOLDER, report_cache_key, get_cached_report,
+                                  store_report, template_user, fill_business_name)
+from backend.report_precompute import PrecomputedReports
+from backend.rag_cache import EMBEDDING_CACHE, ANSWER_CACHE, embedding_cache_key, answer_cache_key
+from backend.streaming import SSE_HEADERS, sse_event, iter_completion_text, iter_json_sections
+from backend.openai_pool import create_openai_client
+from backend.report_fanout import iter_fanout_sections, generate_fanout_report
+from backend.prompt_compact import PROMPT_TOKEN_BUDGET, compact_prompt_rules, encode_rules, uncompacted_tokens
+from backend.vector_store import RAG_BACKEND, open_vector_store
+from backend.lexical_index import BM25Index, reciprocal_rank_fusion
+from backend.chunk_rules import ChunkRuleFilter
+from backend.single_flight import SINGLE_FLIGHT_DIR, SingleFlight
+
+logger = get_logger("app")
+logger.info("📁 Loaded .env from: %s", env_path)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for local development
@@ -21,220 +51,826 @@ CORS(app)  # Enable CORS for local development
 # 🔑 OpenAI Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 if not OPENAI_API_KEY:
-    print(" Error: OPENAI_API_KEY not found in environment variables!", flush=True)
+    logger.error("OPENAI_API_KEY not found in environment variables!")
     # Debug: check if .env file exists and what's in it
     if os.path.exists(env_path):
-        print(f"  Debug: .env file exists at {env_path}", flush=True)
+        logger.debug(".env file exists at %s", env_path)
         with open(env_path, 'r') as f:
             first_line = f.readline().strip()
             if 'OPENAI' in first_line.upper():
-                print(f"  Debug: Found OPENAI in .env: {first_line[:30]}...", flush=True)
+                logger.debug("Found OPENAI in .env: %s...", first_line[:30])
 else:
-    print(f"✅ OpenAI API key loaded successfully (length: {len(OPENAI_API_KEY)})", flush=True)
+    logger.info("✅ OpenAI API key loaded successfully (length: %d)", len(OPENAI_API_KEY))
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Shared, connection-pooled client with a concurrency cap and jittered retries (built on first call)
+client = create_openai_client(OPENAI_API_KEY)
 
 # 📂 Paths
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "json_rules")
-CHROMA_DB_PATH = os.path.join(BASE_DIR, "chroma_db")
-COLLECTION_NAME = "rag_index"
-
-# 📚 Initialize ChromaDB
-RAG_COLLECTION = None
-CHROMA_ERROR = None
-try:
-    chroma_client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    RAG_COLLECTION = chroma_client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"}
-    )
-    count = RAG_COLLECTION.count()
-    print(f"ChromaDB collection loaded: {count} chunks.", flush=True)
-except Exception as e:
-    CHROMA_ERROR = str(e)
-    print(f" Error loading ChromaDB collection: {e}", flush=True)
-    print("  Warning: ChromaDB not initialized. Run 'build_rag_index.py' first.", flush=True)
+CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Bump whenever a prompt changes, so cached reports/answers are not reused
+REPORT_PROMPT_VERSION = "report-v3"
+RAG_PROMPT_VERSION = "rag-v1"
+# "single" = one completion, "fanout" = parallel per-category calls, "auto" = fanout for large rule sets
+# Fanout multiplies upstream calls per report, so it is opt-in
+REPORT_MODE = os.getenv("REPORT_MODE", "single")
+REPORT_FANOUT_MIN_RULES = int(os.getenv("REPORT_FANOUT_MIN_RULES", "40"))
+RULES_CHECK_INTERVAL = float(os.getenv("RULES_CHECK_INTERVAL", "2"))
+MAX_BATCH_PROFILES = int(os.getenv("MAX_BATCH_PROFILES", "200000"))
+NDJSON_MIMETYPES = {"application/x-ndjson", "application/jsonl", "application/ndjson"}
+NDJSON_BLOCK_LINES = 1000
+# "hybrid" = BM25 + vectors (RRF), "vector" = embeddings only, "lexical" = BM25 only (no OpenAI call)
+RAG_RETRIEVAL_MODE = os.getenv("RAG_RETRIEVAL_MODE", "hybrid")
+# In hybrid mode, answer from lexical results if the query embedding takes longer than this
+RAG_EMBED_TIMEOUT = float(os.getenv("RAG_EMBED_TIMEOUT", "3"))
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "20"))
+# Chunks given to the model per question; fewer when a business profile narrows the search,
+# i.e. leaves out at least RAG_PROFILE_MIN_EXCLUDED of the chunks
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "4"))
+RAG_PROFILE_TOP_K = int(os.getenv("RAG_PROFILE_TOP_K", "3"))
+RAG_PROFILE_MIN_EXCLUDED = float(os.getenv("RAG_PROFILE_MIN_EXCLUDED", "0.25"))
+RAG_LEXICAL_CHECK_INTERVAL = float(os.getenv("RAG_LEXICAL_CHECK_INTERVAL", "30"))
+# /api/rag/batch: questions per request, and answers generated at once per worker
+RAG_MAX_BATCH_QUESTIONS = int(os.getenv("RAG_MAX_BATCH_QUESTIONS", "100"))
+RAG_BATCH_CONCURRENCY = int(os.getenv("RAG_BATCH_CONCURRENCY", "16"))
+# Endpoints whose per-request timing line is logged at DEBUG only (health checks, scrapes)
+QUIET_ENDPOINTS = {"health", "metrics_endpoint", "cache_stats"}
+
+# 📜 Rules are loaded once per worker (from the compiled rules.pack when it is current) and hot-reloaded
+RULE_STORE = RuleStore(DATA_DIR, check_interval=RULES_CHECK_INTERVAL, pack_path=RULES_PACK_PATH)
+RULE_INDEX = None
+BATCH_MATCHER = None
+# Reports pre-generated per profile class by report_precompute.py (optional)
+PRECOMPUTED_REPORTS = PrecomputedReports()
+CACHES = {
+    "report": REPORT_CACHE,
+    "embedding": EMBEDDING_CACHE,
+    "answer": ANSWER_CACHE,
+    "precomputed_reports": PRECOMPUTED_REPORTS,
+}
+
+
+def _cache_lookups():
+    counts = {}
+    for name, cache in CACHES.items():
+        stats = cache.stats()
+        counts[(name, "hit")] = stats["hits"]
+        counts[(name, "miss")] = stats["misses"]
+    return counts
+
+
+# 🤝 Identical concurrent requests share one upstream call; report/answer calls also across
+# workers, which then read the leader's result from the shared (SQLite) cache
+# Waiting on another worker only pays off when its result lands in a cache shared by the workers
+REPORT_FLIGHT = SingleFlight("report", lock_dir=SINGLE_FLIGHT_DIR if REPORT_CACHE.disk is not None else None)
+ANSWER_FLIGHT = SingleFlight("answer", lock_dir=SINGLE_FLIGHT_DIR if ANSWER_CACHE.disk is not None else None)
+EMBEDDING_FLIGHT = SingleFlight("embedding")
+FLIGHTS = [REPORT_FLIGHT, ANSWER_FLIGHT, EMBEDDING_FLIGHT]
+
+# Read from the caches' own counters at scrape time; hit rate = hit / (hit + miss)
+metrics.Counter("licensing_cache_lookups_total", "Cache lookups by result", ["cache", "result"],
+                collect=_cache_lookups)
+
+
+def _compile_rule_index(ruleset):
+    """Rebuilds the matching indexes whenever the rule store swaps in a new rule set."""
+    global RULE_INDEX, BATCH_MATCHER
+    index = RuleIndex(ruleset.rules, version=ruleset.version)
+    BATCH_MATCHER = BatchMatcher(index)
+    RULE_INDEX = index
+
+
+RULE_STORE.add_listener(_compile_rule_index)
+
+# 📚 Retrieval backend (RAG_BACKEND=chroma|numpy), opened on first use
+VECTOR_STORE = None
+VECTOR_STORE_ERROR = None
+_VECTOR_STORE_LOCK = threading.Lock()
+
+# 🔤 BM25 index over the same chunks, built lazily from the vector store
+LEXICAL_INDEX = None
+# Chunk -> rule links of the same chunks (stored at index time), for profile-filtered retrieval
+CHUNK_FILTER = None
+_LEXICAL_REVISION = None
+_LEXICAL_CHECKED_AT = 0.0
+# Threads become greenlets under the gevent worker
+_EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="rag-embed")
+_ANSWER_EXECUTOR = ThreadPoolExecutor(max_workers=RAG_BATCH_CONCURRENCY, thread_name_prefix="rag-answer")
+
+
+@metrics.span("rules_load")
+def current_ruleset():
+    """Returns the current RuleSet (re-checks the rule files every RULES_CHECK_INTERVAL seconds)."""
+    return RULE_STORE.get()
 
 
 def load_rules():
-    rules = []
-    if not os.path.exists(DATA_DIR):
-        return rules
-    for filename in os.listdir(DATA_DIR):
-        if filename.endswith(".json"):
-            with open(os.path.join(DATA_DIR, filename), encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict) and "rules" in data:
-                    rules.extend(data["rules"])
-                elif isinstance(data, list):
-                    rules.extend(data)
-    return rules
-
-
-def rule_matches(rule, user):
-    cond = rule.get("applies_when", {})
-
-    # Business Type
-    if cond.get("business_type"):
-        if user.get("business_type") not in cond["business_type"]:
-            return False
-
-    # Food Type
-    if cond.get("food_type"):
-        if user.get("food_type", "כל סוגי המזון") not in cond["food_type"]:
-            return False
-
-    # Area
-    area = user.get("area_sqm")
-    if cond.get("min_area") and area is not None and area < cond["min_area"]:
-        return False
-    if cond.get("max_area") and area is not None and area > cond["max_area"]:
-        return False
-
-    # Seating
-    seats = user.get("seating_capacity")
-    if cond.get("seating_capacity") and seats is not None:
-        try:
-            if isinstance(cond["seating_capacity"], int) and seats > cond["seating_capacity"]:
-                return False
-            if isinstance(cond["seating_capacity"], str) and "עד" in cond["seating_capacity"]:
-                limit = int(cond["seating_capacity"].replace("עד", "").strip())
-                if seats > limit:
-                    return False
-        except Exception:
-            pass
-
-    # Boolean fields
-    for field in ["has_gas", "serves_meat", "has_delivery", "has_alcohol"]:
-        if field in cond:
-            if user.get(field) not in cond[field]:
-                return False
-
-    return True
-
-
-def retrieve_relevant_chunks(question, top_k=5):
-    """Retrieves top-k relevant chunks using ChromaDB vector search."""
-    if not RAG_COLLECTION:
-        if CHROMA_ERROR:
-            raise Exception(f"ChromaDB error: {CHROMA_ERROR}")
-        return []
+    """Returns the rules of the current rule set (cached, reloaded on file change)."""
+    return list(current_ruleset().rules)
+
+
+def get_rule_index():
+    """Returns the compiled RuleIndex of the current rule set."""
+    current_ruleset()
+    return RULE_INDEX
+
+
+def get_batch_matcher():
+    """Returns the vectorized matcher of the current rule set (its .index has the version)."""
+    current_ruleset()
+    return BATCH_MATCHER
+
+
+def build_user_profile(data):
+    """Normalizes request data into the profile shape the rule matching works on."""
+    return {
+        "business_name": data.get("business_name", "עסק ללא שם"),
+        "business_type": data.get("business_type", "לא מוגדר"),
+        "area_sqm": int(data.get("area_sqm")) if str(data.get("area_sqm")).isdigit() else None,
+        "seating_capacity": int(data.get("seating_capacity")) if str(data.get("seating_capacity")).isdigit() else None,
+        "food_type": data.get("food_type", "כל סוגי המזון"),
+        "has_gas": bool(data.get("has_gas")),
+        "serves_meat": bool(data.get("serves_meat")),
+        "has_delivery": bool(data.get("has_delivery")),
+        "has_alcohol": bool(data.get("has_alcohol")),
+    }
+
+
+def embed_question(question):
+    """Returns the question's embedding as float32, from the embedding cache when possible."""
+    key = embedding_cache_key(question, EMBEDDING_MODEL)
+    embedding = EMBEDDING_CACHE.get(key)
+    if embedding is None:
+        def embed():
+            resp = client.embeddings.create(
+                input=question,
+                model=EMBEDDING_MODEL
+            )
+            vector = np.asarray(resp.data[0].embedding, dtype=np.float32)
+            EMBEDDING_CACHE.set(key, vector)
+            return vector
+
+        embedding, _ = EMBEDDING_FLIGHT.do(key, embed)
+    return embedding
+
+
+def embed_questions(questions):
+    """embed_question for several questions: the ones not in the cache are embedded in one call."""
+    keys = [embedding_cache_key(q, EMBEDDING_MODEL) for q in questions]
+    vectors = {}
+    missing = {}
+    for key, question in zip(keys, questions):
+        if key in vectors or key in missing:
+            continue
+        vector = EMBEDDING_CACHE.get(key)
+        if vector is None:
+            missing[key] = question
+        else:
+            vectors[key] = vector
 
-    try:
-        # 1. Embed the question
+    if missing:
         resp = client.embeddings.create(
-            input=question,
-            model="text-embedding-3-small"
+            input=list(missing.values()),
+            model=EMBEDDING_MODEL
         )
-        query_embedding = resp.data[0].embedding
+        for key, item in zip(missing, sorted(resp.data, key=lambda d: d.index)):
+            vector = np.asarray(item.embedding, dtype=np.float32)
+            EMBEDDING_CACHE.set(key, vector)
+            vectors[key] = vector
+    return [vectors[key] for key in keys]
+
+
+def get_vector_store():
+    """Opens the vector store on first use. Returns None (and sets VECTOR_STORE_ERROR) if that fails."""
+    global VECTOR_STORE, VECTOR_STORE_ERROR
+    if VECTOR_STORE is None and VECTOR_STORE_ERROR is None:
+        with _VECTOR_STORE_LOCK:
+            if VECTOR_STORE is None and VECTOR_STORE_ERROR is None:
+                try:
+                    store = open_vector_store(RAG_BACKEND)
+                    logger.info("Vector store '%s' loaded: %d chunks.", RAG_BACKEND, store.count())
+                    VECTOR_STORE = store
+                except Exception as e:
+                    VECTOR_STORE_ERROR = str(e)
+                    logger.error("Error loading vector store '%s': %s", RAG_BACKEND, e)
+                    logger.warning("Vector store not initialized. Run 'build_rag_index.py' first.")
+    return VECTOR_STORE
+
+
+def get_lexical_index():
+    """Returns the BM25 index of the vector store's chunks, rebuilt when the store changes."""
+    global LEXICAL_INDEX, CHUNK_FILTER, _LEXICAL_REVISION, _LEXICAL_CHECKED_AT
+    now = time.monotonic()
+    if LEXICAL_INDEX is not None and now - _LEXICAL_CHECKED_AT < RAG_LEXICAL_CHECK_INTERVAL:
+        return LEXICAL_INDEX
+    _LEXICAL_CHECKED_AT = now
+    store = get_vector_store()
+    revision = store.revision()
+    if LEXICAL_INDEX is None or revision != _LEXICAL_REVISION:
+        ids, documents, metadatas = store.get_documents()
+        LEXICAL_INDEX = BM25Index([
+            {"id": i, "chunk": d, "metadata": m} for i, d, m in zip(ids, documents, metadatas)
+        ])
+        CHUNK_FILTER = ChunkRuleFilter(ids, metadatas)
+        _LEXICAL_REVISION = revision
+        logger.info("🔤 Lexical index built: %d chunks.", len(LEXICAL_INDEX))
+    return LEXICAL_INDEX
+
+
+def vector_search(question, top_k, chunk_ids=None):
+    # Embed the question (cached by normalized question), then query the vector store
+    embedding = embed_question(question)
+    with metrics.span("vector_query"):
+        return get_vector_store().query(embedding, top_k=top_k, ids=chunk_ids)
+
+
+def vector_search_many(questions, top_k, chunk_ids=None):
+    # One embeddings call and one vector query for all the questions
+    embeddings = embed_questions(questions)
+    with metrics.span("vector_query"):
+        return get_vector_store().query_many(embeddings, top_k=top_k, ids=chunk_ids)
+
+
+def lexical_search(question, top_k, candidates, chunk_ids=None):
+    """Returns (section-number hits, BM25 hits) for a question. Sections asked for by number are never filtered."""
+    index = get_lexical_index()
+    with metrics.span("lexical_search"):
+        return index.lookup_sections(question, top_k=top_k), index.search(question, top_k=candidates, ids=chunk_ids)
+
+
+def vector_results(future, default):
+    """The vector search's result, or default if it fails or exceeds RAG_EMBED_TIMEOUT."""
+    if future is None:
+        return default
+    try:
+        return future.result(timeout=RAG_EMBED_TIMEOUT)
+    except FutureTimeout:
+        logger.warning("Vector search took over %ss, using lexical results", RAG_EMBED_TIMEOUT)
+    except Exception as e:
+        logger.warning("Vector search failed (%s), using lexical results", e)
+    return default
+
+
+def fuse_hits(section_hits, lexical_hits, vector_hits, top_k):
+    """Section-number hits first, then BM25 and vector hits merged by reciprocal rank."""
+    section_ids = {hit["id"] for hit in section_hits}
+    fused = reciprocal_rank_fusion([vector_hits, lexical_hits], top_k=top_k + len(section_hits))
+    return (section_hits + [c for c in fused if c["id"] not in section_ids])[:top_k]
+
+
+def hybrid_search(question, top_k, use_vectors=True, chunk_ids=None):
+    """
+    Section-number hits first, then BM25 and vector results merged by
+    reciprocal rank. Vector search runs concurrently with the lexical search
+    and is skipped if it fails or exceeds RAG_EMBED_TIMEOUT.
+    """
+    candidates = max(RAG_CANDIDATES, top_k)
+    vector_future = None
+    if use_vectors:
+        vector_future = metrics.submit_traced(_EMBED_EXECUTOR, vector_search, question, candidates, chunk_ids)
+    section_hits, lexical_hits = lexical_search(question, top_k, candidates, chunk_ids)
+    return fuse_hits(section_hits, lexical_hits, vector_results(vector_future, []), top_k)
+
+
+@metrics.span("retrieval")
+def retrieve_relevant_chunks(question, top_k=RAG_TOP_K, chunk_ids=None):
+    """Retrieves top-k relevant chunks (RAG_RETRIEVAL_MODE=hybrid|vector|lexical), only among chunk_ids if given."""
+    if get_vector_store() is None:
+        if VECTOR_STORE_ERROR:
+            raise Exception(f"Vector store error ({RAG_BACKEND}): {VECTOR_STORE_ERROR}")
+        return []
 
-        # 2. Query ChromaDB for similar chunks
-        results = RAG_COLLECTION.query(
-            query_embeddings=[query_embedding],
-            n_results=top_k
-        )
+    try:
+        # Results are [{"id", "chunk", "score"}], best first
+        if RAG_RETRIEVAL_MODE == "vector":
+            chunks = vector_search(question, top_k, chunk_ids)
+        else:
+            chunks = hybrid_search(question, top_k, use_vectors=RAG_RETRIEVAL_MODE != "lexical", chunk_ids=chunk_ids)
 
-        # 3. Format results
-        chunks = []
-        if results["ids"] and len(results["ids"][0]) > 0:
-            for i in range(len(results["ids"][0])):
-                chunk_id = results["ids"][0][i]
-                chunk_text = results["documents"][0][i]
-                distance = results["distances"][0][i] if "distances" in results else None
-                
-                # Convert distance to similarity score (ChromaDB uses distance, lower is better)
-                # For cosine similarity, similarity = 1 - distance
-                score = 1 - distance if distance is not None else None
-                
-                chunks.append({
-                    "id": chunk_id,
-                    "chunk": chunk_text,
-                    "score": score
-                })
-                
-                # Log retrieval results
-                print(f"   - Score: {score:.4f} | Chunk ID: {chunk_id}", flush=True)
-        
-        print(f"🔍 Found {len(chunks)} relevant chunks from ChromaDB.", flush=True)
+        # Log retrieval results (formatted only when DEBUG is on)
+        if logger.isEnabledFor(logging.DEBUG):
+            for chunk in chunks:
+                logger.debug("   - Score: %.4f | Chunk ID: %s", chunk["score"], chunk["id"])
+            logger.debug("🔍 Found %d relevant chunks (%s, %s).", len(chunks), RAG_RETRIEVAL_MODE, RAG_BACKEND)
         return chunks
 
     except Exception as e:
-        print(f" Retrieval error: {e}", flush=True)
+        logger.error("Retrieval error: %s", e)
         return []
 
 
+@metrics.span("retrieval")
+def retrieve_relevant_chunks_batch(questions, top_k=RAG_TOP_K, chunk_ids=None):
+    """retrieve_relevant_chunks for several questions, sharing one embeddings call and one vector query."""
+    if get_vector_store() is None:
+        if VECTOR_STORE_ERROR:
+            raise Exception(f"Vector store error ({RAG_BACKEND}): {VECTOR_STORE_ERROR}")
+        return [[] for _ in questions]
+
+    try:
+        if RAG_RETRIEVAL_MODE == "vector":
+            return vector_search_many(questions, top_k, chunk_ids)
+
+        candidates = max(RAG_CANDIDATES, top_k)
+        vector_future = None
+        if RAG_RETRIEVAL_MODE != "lexical":
+            vector_future = metrics.submit_traced(_EMBED_EXECUTOR, vector_search_many, questions, candidates, chunk_ids)
+        lexical = [lexical_search(q, top_k, candidates, chunk_ids) for q in questions]
+        vectors = vector_results(vector_future, [[] for _ in questions])
+        return [
+            fuse_hits(section_hits, lexical_hits, vector_hits, top_k)
+            for (section_hits, lexical_hits), vector_hits in zip(lexical, vectors)
+        ]
+
+    except Exception as e:
+        logger.error("Retrieval error: %s", e)
+        return [[] for _ in questions]
+
+
+def profile_chunk_filter(profile):
+    """
+    Narrows RAG retrieval to a business: its questionnaire answers (as sent to
+    /api/generate-report) are matched against the rules, and only chunks
+    linked to a matched rule, or to no rule, are searched.
+    Returns (chunk IDs or None for no filtering, summary for the response).
+    """
+    with metrics.span("matching"):
+        matched = get_rule_index().match(build_user_profile(profile))
+    summary = {
+        "matched_rules": len(matched),
+        "categories": sorted({r["category"] for r in matched if r.get("category")}),
+        "chunks": None,
+    }
+    if not matched:
+        # Unknown or incomplete profile: filtering would only drop every rule-linked chunk
+        logger.debug("ℹ️ RAG profile matched no rules; searching all chunks")
+        return None, summary
+    if get_vector_store() is None:
+        return None, summary
+
+    get_lexical_index()
+    chunk_ids = CHUNK_FILTER.allowed_ids(r["id"] for r in matched)
+    if chunk_ids is None:
+        logger.warning("Chunks are not linked to rules; run build_rag_index.py to filter RAG by profile")
+        return None, summary
+    summary.update(chunks=len(chunk_ids), total_chunks=CHUNK_FILTER.total)
+    return chunk_ids, summary
+
+
+def read_rag_profile(data):
+    """
+    The optional "profile" of a RAG request. Returns (chunk IDs, top_k,
+    summary); raises ValueError if it is not an object. top_k is only
+    lowered to RAG_PROFILE_TOP_K when the profile leaves out a meaningful
+    share of the chunks.
+    """
+    profile = data.get("profile") if isinstance(data, dict) else None
+    if profile is None:
+        return None, RAG_TOP_K, None
+    if not isinstance(profile, dict):
+        raise ValueError("profile must be a JSON object")
+    chunk_ids, summary = profile_chunk_filter(profile)
+    narrowed = (chunk_ids is not None
+                and len(chunk_ids) <= (1 - RAG_PROFILE_MIN_EXCLUDED) * summary["total_chunks"])
+    return chunk_ids, RAG_PROFILE_TOP_K if narrowed else RAG_TOP_K, summary
+
+
+def warm_up():
+    """
+    Builds the read-only state requests would otherwise build on first use:
+    rule indexes, the numpy vector index, the BM25 index and the precomputed
+    reports. gunicorn.conf.py calls it in the master when preloading, so
+    workers share it copy-on-write. ChromaDB is not fork-safe, so with
+    RAG_BACKEND=chroma the store (and BM25 index) still open in each worker.
+    """
+    started = time.perf_counter()
+    current_ruleset()
+    PRECOMPUTED_REPORTS.stats()
+    if RAG_BACKEND == "numpy" and get_vector_store() is not None and RAG_RETRIEVAL_MODE != "vector":
+        get_lexical_index()
+    logger.info("🔥 Warm-up done in %.0fms", (time.perf_counter() - started) * 1000)
+
+
+def build_report_prompt(user, matched):
+    return f"""
+    צור דוח רישוי לעסק בשם "{user['business_name']}".
+    בכל מקום שבו מוזכר שם העסק, כתוב בדיוק {NAME_PLACEHOLDER} במקום השם.
+    סוג העסק: {user['business_type']}, שטח: {user['area_sqm'] or "לא צויין"} מ"ר, מקומות ישיבה: {user['seating_capacity'] or "לא צויין"}.
+
+    דרישות רגולטוריות שנמצאו:
+    {encode_rules(matched)}
+
+    החזר את התשובה אך ורק כ־JSON תקין עם המבנה הבא:
+    {{
+    "executive_summary": "תקציר מנהלים...",
+    "recommendations": {{
+        "before_opening": ["שלב 1: ...", "שלב 2: ..."],
+        "during_setup": ["שלב 3: ..."],
+        "after_opening": ["שלב 4: ..."]
+    }},
+    "requirements_by_priority": [
+        {{ "category": "...", "title": "...", "priority": "...", "actions": ["..."], "estimated_cost": "...", "estimated_time": "..." }}
+    ],
+    "estimated_cost": "...",
+    "estimated_time": "..."
+    }}
+    """
+
+
+def generate_ai_report(user, matched):
+    """Asks the model for the AI sections of the report (summary, recommendations, costs)."""
+    with metrics.span("prompt_build"):
+        prompt = build_report_prompt(user, matched)
+    response = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"}
+    )
+
+    with metrics.span("json_parse"):
+        return json.loads(response.choices[0].message.content)
+
+
+def iter_ai_report_sections(user, matched):
+    """Streams the AI report and yields each top-level (section, value) as soon as it is complete."""
+    with metrics.span("prompt_build"):
+        prompt = build_report_prompt(user, matched)
+    stream = client.chat.completions.create(
+        model=CHAT_MODEL,
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"},
+        stream=True,
+        stream_options={"include_usage": True}
+    )
+    yield from iter_json_sections(iter_completion_text(stream))
+
+
+def choose_report_mode(data, matched):
+    """Picks "single" or "fanout" from the request's report_mode (or REPORT_MODE)."""
+    mode = data.get("report_mode") or REPORT_MODE
+    if mode == "auto":
+        return "fanout" if len(matched) >= REPORT_FANOUT_MIN_RULES else "single"
+    return "fanout" if mode == "fanout" else "single"
+
+
+def build_ai_report(user, matched, mode):
+    """The AI part of the report as a template: the name is left as NAME_PLACEHOLDER."""
+    user = template_user(user)
+    if mode == "fanout":
+        return generate_fanout_report(client, CHAT_MODEL, user, matched)
+    return generate_ai_report(user, matched)
+
+
+def build_ai_report_once(user, matched, mode, cache_key):
+    """
+    build_ai_report shared by identical concurrent requests (same cache key).
+    The report is shared as a template, so each request gets its own business name.
+    Returns (ai_data, coalesced).
+    """
+    def build():
+        template = build_ai_report(user, matched, mode)
+        store_report(cache_key, template)
+        return template
+
+    template, coalesced = REPORT_FLIGHT.do(cache_key, build, recheck=lambda: REPORT_CACHE.get(cache_key))
+    return fill_business_name(template, user["business_name"]), coalesced
+
+
+def iter_report_sections(user, matched, mode):
+    """Streams the report's (section, template) pairs, name left as NAME_PLACEHOLDER."""
+    user = template_user(user)
+    if mode == "fanout":
+        return iter_fanout_sections(client, CHAT_MODEL, user, matched)
+    return iter_ai_report_sections(user, matched)
+
+
+def wants_stream(data):
+    """Streaming is opt-in: {"stream": true} in the body or Accept: text/event-stream."""
+    return bool(data.get("stream")) or "text/event-stream" in request.headers.get("Accept", "")
+
+
+def sse_response(events):
+    return Response(events, mimetype="text/event-stream", headers=SSE_HEADERS)
+
+
+def build_rag_messages(question, relevant_chunks):
+    """Builds the strict, context-only chat messages for a RAG question."""
+    context_text = "\n\n".join([f"--- מקור {c['id']} ---\n{c['chunk']}" for c in relevant_chunks])
+
+    # RAG strict, best-practice
+    system_message = """
+        אתה עוזר מומחה לרישוי עסקים בישראל.
+
+        כללים מחייבים:
+        1) אתה עונה אך ורק לפי המידע שמופיע ב-Context שמסופק לך.
+        2) אסור לך להשתמש בידע חיצוני, לנחש, להשלים פרטים, או להמציא תקנות.
+        3) אם המידע לא מופיע ב-Context, עליך לענות בדיוק:
+        "לא נמצא מידע רלוונטי במאגר"
+
+        סגנון תשובה:
+        - עברית בלבד
+        - תשובה קצרה וברורה
+        - אם מתאים: רשימת נקודות
+        - אל תזכיר "Context", "embedding", "RAG", או פרטים פנימיים של המערכת
+    """
+
+    user_prompt = f"""
+        כותרת: קטעי רגולציה רלוונטיים (Context)
+        {context_text}
+
+        כותרת: שאלת המשתמש
+        {question}
+
+        הנחיה:
+        ענה רק לפי הקטעים שצורפו למעלה. אם אין שם תשובה — כתוב בדיוק:
+        "לא נמצא מידע רלוונטי במאגר"
+    """
+
+    return [
+        {"role": "system", "content": system_message},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def rag_sources(relevant_chunks):
+    return [{"id": c["id"], "preview": c["chunk"][:200] + "..."} for c in relevant_chunks]
+
+
+def answer_question(question, relevant_chunks, answer_key):
+    """Answers from the retrieved chunks, once for identical concurrent questions. Returns (answer, coalesced)."""
+    def ask():
+        with metrics.span("prompt_build"):
+            messages = build_rag_messages(question, relevant_chunks)
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.0  # Low temperature for factual accuracy
+        )
+
+        answer = response.choices[0].message.content.strip()
+        if relevant_chunks:  # never cache an answer given without context
+            ANSWER_CACHE.set(answer_key, answer)
+        return answer
+
+    # Answers without context are never cached, so they only coalesce within the worker
+    recheck = (lambda: ANSWER_CACHE.get(answer_key)) if relevant_chunks else None
+    return ANSWER_FLIGHT.do(answer_key, ask, recheck=recheck)
+
+
+@app.before_request
+def start_request_trace():
+    metrics.ensure_writer()
+    g.request_trace = metrics.start_request(request.endpoint or "unknown")
+
+
+@app.after_request
+def finish_request_trace(response):
+    trace = g.pop("request_trace", None)
+    if trace is not None:
+        level = logging.DEBUG if trace.endpoint in QUIET_ENDPOINTS else logging.INFO
+
+        # On close, so a streamed response is timed until its last event
+        def finish():
+            trace.finish(response.status_code)
+            logger.log(level, "%s", trace.summary())
+
+        response.call_on_close(finish)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus metrics: request/stage latency histograms, OpenAI calls and tokens, cache lookups."""
+    return Response(metrics.render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/")
 def health():
-    return jsonify({"status": "ok", "message": "Licensing API is running!"})
+    return jsonify({
+        "status": "ok",
+        "message": "Licensing API is running!",
+        "rules_version": RULE_STORE.get().version
+    })
+
+
+@app.route("/api/cache-stats")
+def cache_stats():
+    return jsonify({
+        "report_cache": REPORT_CACHE.stats(),
+        "embedding_cache": EMBEDDING_CACHE.stats(),
+        "answer_cache": ANSWER_CACHE.stats(),
+        "precomputed_reports": PRECOMPUTED_REPORTS.stats(),
+        "single_flight": {flight.name: flight.stats() for flight in FLIGHTS}
+    })
 
 
 @app.route("/api/generate-report", methods=["POST"])
 def generate_report():
     try:
         data = request.json or {}
-        business_name = data.get("business_name", "עסק ללא שם")
-
-        user = {
-            "business_name": business_name,
-            "business_type": data.get("business_type", "לא מוגדר"),
-            "area_sqm": int(data.get("area_sqm")) if str(data.get("area_sqm")).isdigit() else None,
-            "seating_capacity": int(data.get("seating_capacity")) if str(data.get("seating_capacity")).isdigit() else None,
-            "food_type": data.get("food_type", "כל סוגי המזון"),
-            "has_gas": bool(data.get("has_gas")),
-            "serves_meat": bool(data.get("serves_meat")),
-            "has_delivery": bool(data.get("has_delivery")),
-            "has_alcohol": bool(data.get("has_alcohol")),
-        }
-
-        print("Report Request:", user, flush=True)
-
-        rules = load_rules()
-        matched = [r for r in rules if rule_matches(r, user)]
-
-        prompt = f"""
-        צור דוח רישוי לעסק בשם "{user['business_name']}".
-        סוג העסק: {user['business_type']}, שטח: {user['area_sqm'] or "לא צויין"} מ"ר, מקומות ישיבה: {user['seating_capacity'] or "לא צויין"}.
-
-        דרישות רגולטוריות שנמצאו בקבצי JSON:
-        {json.dumps(matched, ensure_ascii=False, indent=2)}
-
-        החזר את התשובה אך ורק כ־JSON תקין עם המבנה הבא:
-        {{
-        "executive_summary": "תקציר מנהלים...",
-        "recommendations": {{
-            "before_opening": ["שלב 1: ...", "שלב 2: ..."],
-            "during_setup": ["שלב 3: ..."],
-            "after_opening": ["שלב 4: ..."]
-        }},
-        "requirements_by_priority": [
-            {{ "category": "...", "title": "...", "priority": "...", "actions": ["..."], "estimated_cost": "...", "estimated_time": "..." }}
-        ],
-        "estimated_cost": "...",
-        "estimated_time": "..."
-        }}
-        """
-
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": prompt}],
-            response_format={"type": "json_object"}
-        )
-
-        ai_data = json.loads(response.choices[0].message.content)
+        user = build_user_profile(data)
+
+        logger.debug("Report Request: %s", user)
+
+        rule_index = get_rule_index()
+        with metrics.span("matching"):
+            matched = rule_index.match(user)
+
+        # Only the compacted, budget-trimmed rules go into the prompt
+        with metrics.span("prompt_build"):
+            prompt_rules, prompt_stats = compact_prompt_rules(matched)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🧮 Prompt rules: %d -> %d tokens, %d trimmed", uncompacted_tokens(matched),
+                         prompt_stats["tokens_after"], len(prompt_stats["rules_trimmed"]))
+
+        mode = choose_report_mode(data, prompt_rules)
+        prompt_version = f"{REPORT_PROMPT_VERSION}:{mode}:{PROMPT_TOKEN_BUDGET}"
+        cache_key = report_cache_key(user, [r.get("id") for r in matched], CHAT_MODEL, prompt_version)
+        ai_data = get_cached_report(cache_key, user["business_name"])
+        report_source = "cache" if ai_data is not None else "model"
+        if ai_data is not None:
+            logger.debug("⚡ Report cache hit (%s)", cache_key[:12])
+        else:
+            # Same matched rules as every profile of its class: reuse the class's pre-generated report
+            ai_data = PRECOMPUTED_REPORTS.lookup(user, rule_index.version, CHAT_MODEL, prompt_version)
+            if ai_data is not None:
+                report_source = "precomputed"
+                logger.debug("⚡ Precomputed report for the profile class")
+        cache_hit = ai_data is not None
+
+        if wants_stream(data):
+            return sse_response(stream_report(user, rule_index.version, matched, prompt_rules, prompt_stats,
+                                              mode, cache_key, ai_data))
+
+        if not cache_hit:
+            ai_data, coalesced = build_ai_report_once(user, prompt_rules, mode, cache_key)
+            if coalesced:
+                report_source = "coalesced"
 
         return jsonify({
             **user,
+            "rules_version": rule_index.version,
             "matched_rules_count": len(matched),
             "matched_rules": matched,
+            "report_mode": mode,
+            "prompt_stats": prompt_stats,
+            "cache_hit": cache_hit,
+            "report_source": report_source,
             **ai_data
         })
 
     except Exception as e:
-        print(" Error:", str(e), flush=True)
+        logger.exception("Report error: %s", e)
         return jsonify({"error": str(e)}), 500
 
 
+def stream_report(user, rules_version, matched, prompt_rules, prompt_stats, mode, cache_key, cached_ai_data):
+    """
+    SSE stream of a report: the deterministic part ("profile") first, then one
+    "section" event per AI section as it completes, then "done".
+    """
+    yield sse_event("profile", {
+        **user,
+        "rules_version": rules_version,
+        "matched_rules_count": len(matched),
+        "matched_rules": matched,
+        "report_mode": mode,
+        "prompt_stats": prompt_stats
+    })
+    try:
+        if cached_ai_data is not None:
+            for name, value in cached_ai_data.items():
+                yield sse_event("section", {"name": name, "value": value})
+        else:
+            template = {}
+            for name, value in iter_report_sections(user, prompt_rules, mode):
+                template[name] = value
+                yield sse_event("section", {"name": name, "value": fill_business_name(value, user["business_name"])})
+            store_report(cache_key, template)
+        yield sse_event("done", {"cache_hit": cached_ai_data is not None})
+
+    except Exception as e:
+        logger.exception("Report stream error: %s", e)
+        yield sse_event("error", {"error": str(e)})
+
+
+def read_batch_profiles():
+    """
+    Reads the profiles of a batch request: a JSON list, {"profiles": [...]},
+    or an NDJSON body with one profile per line.
+    Returns (profiles, error message).
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        profiles = []
+        # In one read: iterating request.stream reads the body a byte at a time
+        for line_no, line in enumerate(request.get_data(cache=False).splitlines(), start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                profiles.append(json.loads(line))
+            except ValueError:
+                return None, f"Invalid JSON on line {line_no}"
+    else:
+        profiles = request.get_json(silent=True)
+        if isinstance(profiles, dict):
+            profiles = profiles.get("profiles")
+
+    if not isinstance(profiles, list):
+        return None, "Expected a list of profiles"
+    if not all(isinstance(p, dict) for p in profiles):
+        return None, "Every profile must be a JSON object"
+    return profiles, None
+
+
+def ndjson_blocks(items, lines_per_block=NDJSON_BLOCK_LINES):
+    """NDJSON lines joined into blocks: the server writes (and chunk-encodes) each yielded string separately."""
+    block = []
+    for item in items:
+        block.append(json.dumps(item, ensure_ascii=False))
+        if len(block) >= lines_per_block:
+            yield "\n".join(block) + "\n"
+            block = []
+    if block:
+        yield "\n".join(block) + "\n"
+
+
+@app.route("/api/match-batch", methods=["POST"])
+def match_batch_endpoint():
+    """Matches many business profiles against the rules, without calling the LLM."""
+    try:
+        payload, error = read_batch_profiles()
+        if error:
+            return jsonify({"error": error}), 400
+        if len(payload) > MAX_BATCH_PROFILES:
+            return jsonify({"error": f"Too many profiles (max {MAX_BATCH_PROFILES})"}), 413
+
+        profiles = [build_user_profile(p) for p in payload]
+        matcher = get_batch_matcher()
+        with metrics.span("matching"):
+            matched_ids = matcher.match_ids(profiles)
+        version = matcher.index.version
+        logger.info("📦 Batch match: %d profiles (rules %s)", len(profiles), version)
+
+        results = (
+            {
+                "business_name": user["business_name"],
+                "matched_rules_count": len(ids),
+                "matched_rule_ids": ids,
+            }
+            for user, ids in zip(profiles, matched_ids)
+        )
+
+        if request.mimetype in NDJSON_MIMETYPES:
+            return Response(ndjson_blocks(results), mimetype="application/x-ndjson",
+                            headers={"X-Rules-Version": version})
+
+        return jsonify({
+            "rules_version": version,
+            "count": len(profiles),
+            "results": list(results)
+        })
+
+    except Exception as e:
+        logger.exception("Batch error: %s", e)
+        return jsonify({"error": str(e)}), 500
+
+
+def stream_rag_answer(question, relevant_chunks, sources, answer_key, cached_answer, profile_filter=None):
+    """SSE stream of a RAG answer: "sources" (and profile_filter) first, then "token" events, then "done"."""
+    yield sse_event("sources", {"sources": sources, **({"profile_filter": profile_filter} if profile_filter else {})})
+    try:
+        if cached_answer is not None:
+            yield sse_event("token", {"text": cached_answer})
+            yield sse_event("done", {"answer": cached_answer, "cache_hit": True})
+            return
+
+        with metrics.span("prompt_build"):
+            messages = build_rag_messages(question, relevant_chunks)
+        stream = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=messages,
+            temperature=0.0,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        parts = []
+        for text in iter_completion_text(stream):
+            parts.append(text)
+            yield sse_event("token", {"text": text})
+
+        answer = "".join(parts).strip()
+        if relevant_chunks:
+            ANSWER_CACHE.set(answer_key, answer)
+        yield sse_event("done", {"answer": answer, "cache_hit": False})
+
+    except Exception as e:
+        logger.exception("RAG stream error: %s", e)
+        yield sse_event("error", {"error": str(e)})
+
+
 @app.route("/api/rag", methods=["POST"])
 def rag_endpoint():
     try:
@@ -244,72 +880,57 @@ def rag_endpoint():
         if not question:
             return jsonify({"error": "No question provided"}), 400
 
-        print(f"🤔 RAG Question: {question}", flush=True)
+        logger.debug("🤔 RAG Question: %s", question)
 
-        # 1. Retrieve Context
-        relevant_chunks = retrieve_relevant_chunks(question, top_k=5)
-        
-        context_text = "\n\n".join([f"--- מקור {c['id']} ---\n{c['chunk']}" for c in relevant_chunks])
-        sources = [{"id": c["id"], "preview": c["chunk"][:200] + "..."} for c in relevant_chunks]
-
-        # 2. Build Prompt with Protection
-       # 2. Build Prompt (RAG strict, best-practice)
-        system_message = """
-            אתה עוזר מומחה לרישוי עסקים בישראל.
-
-            כללים מחייבים:
-            1) אתה עונה אך ורק לפי המידע שמופיע ב-Context שמסופק לך.
-            2) אסור לך להשתמש בידע חיצוני, לנחש, להשלים פרטים, או להמציא תקנות.
-            3) אם המידע לא מופיע ב-Context, עליך לענות בדיוק:
-            "לא נמצא מידע רלוונטי במאגר"
-
-            סגנון תשובה:
-            - עברית בלבד
-            - תשובה קצרה וברורה
-            - אם מתאים: רשימת נקודות
-            - אל תזכיר "Context", "embedding", "RAG", או פרטים פנימיים של המערכת
-        """
-
-        user_prompt = f"""
-            כותרת: קטעי רגולציה רלוונטיים (Context)
-            {context_text}
-
-            כותרת: שאלת המשתמש
-            {question}
-
-            הנחיה:
-            ענה רק לפי הקטעים שצורפו למעלה. אם אין שם תשובה — כתוב בדיוק:
-            "לא נמצא מידע רלוונטי במאגר"
-        """
-        # 3. Call AI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": user_prompt}
-            ],
-            temperature=0.0  # Low temperature for factual accuracy
-        )
+        # 1. Retrieve Context (among the chunks relevant to the business, if a profile is given)
+        try:
+            chunk_ids, top_k, profile_filter = read_rag_profile(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        relevant_chunks = retrieve_relevant_chunks(question, top_k, chunk_ids)
+        sources = rag_sources(relevant_chunks)
+
+        answer_key = answer_cache_key(question, [c["id"] for c in relevant_chunks], CHAT_MODEL, RAG_PROMPT_VERSION)
+        cached_answer = ANSWER_CACHE.get(answer_key)
+        if cached_answer is not None:
+            logger.debug("⚡ RAG answer cache hit (%s)", answer_key[:12])
+
+        if wants_stream(data):
+            return sse_response(stream_rag_answer(question, relevant_chunks, sources, answer_key, cached_answer,
+                                                  profile_filter))
+
+        extra = {"profile_filter": profile_filter} if profile_filter else {}
+        if cached_answer is not None:
+            return jsonify({
+                "answer": cached_answer,
+                "sources": sources,
+                "cache_hit": True,
+                **extra
+            })
 
-        answer = response.choices[0].message.content.strip()
+        # 2. Call AI (once for identical concurrent questions)
+        answer, coalesced = answer_question(question, relevant_chunks, answer_key)
 
         return jsonify({
             "answer": answer,
-            "sources": sources
+            "sources": sources,
+            "cache_hit": False,
+            "coalesced": coalesced,
+            **extra
         })
 
     except Exception as e:
         error_msg = str(e)
-        print(f" RAG Error: {error_msg}", flush=True)
+        logger.error("RAG error: %s", error_msg)
         
         # Provide more helpful error messages
         if "401" in error_msg or "API key" in error_msg.lower():
             return jsonify({
                 "error": "OpenAI API key is missing or invalid. Please set OPENAI_API_KEY environment variable."
             }), 500
-        elif "disturbed" in error_msg.lower() or "locked" in error_msg.lower() or "chromadb" in error_msg.lower():
+        elif "disturbed" in error_msg.lower() or "locked" in error_msg.lower() or "chromadb" in error_msg.lower() or "vector store" in error_msg.lower():
             return jsonify({
-                "error": f"ChromaDB database error: {error_msg}. Try restarting the server or rebuilding the index."
+                "error": f"Vector store error: {error_msg}. Try restarting the server or rebuilding the index."
             }), 500
         elif "empty" in error_msg.lower() or "no chunks" in error_msg.lower():
             return jsonify({
@@ -321,6 +942,71 @@ def rag_endpoint():
             }), 500
 
 
+@app.route("/api/rag/batch", methods=["POST"])
+def rag_batch_endpoint():
+    """
+    Answers a list of questions: one embeddings call and one vector query for
+    all of them, then the answers concurrently. Results keep the input order;
+    chunks retrieved for several questions are listed once under "sources".
+    """
+    try:
+        data = request.get_json(silent=True)
+        questions = data.get("questions") if isinstance(data, dict) else data
+
+        if not isinstance(questions, list) or not questions:
+            return jsonify({"error": "Expected a non-empty list of questions"}), 400
+        if not all(isinstance(q, str) and q.strip() for q in questions):
+            return jsonify({"error": "Every question must be a non-empty string"}), 400
+        if len(questions) > RAG_MAX_BATCH_QUESTIONS:
+            return jsonify({"error": f"Too many questions (max {RAG_MAX_BATCH_QUESTIONS})"}), 413
+        questions = [q.strip() for q in questions]
+        try:
+            chunk_ids, top_k, profile_filter = read_rag_profile(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        chunk_lists = retrieve_relevant_chunks_batch(questions, top_k, chunk_ids)
+
+        sources = {}
+        results = []
+        pending = []
+        for question, chunks in zip(questions, chunk_lists):
+            for source in rag_sources(chunks):
+                sources.setdefault(source["id"], source)
+            result = {"question": question, "source_ids": [c["id"] for c in chunks]}
+            results.append(result)
+
+            answer_key = answer_cache_key(question, result["source_ids"], CHAT_MODEL, RAG_PROMPT_VERSION)
+            cached_answer = ANSWER_CACHE.get(answer_key)
+            if cached_answer is not None:
+                result.update(answer=cached_answer, cache_hit=True, coalesced=False)
+            else:
+                future = metrics.submit_traced(_ANSWER_EXECUTOR, answer_question, question, chunks, answer_key)
+                pending.append((result, future))
+
+        # A failed answer fails only its own question
+        for result, future in pending:
+            try:
+                answer, coalesced = future.result()
+                result.update(answer=answer, cache_hit=False, coalesced=coalesced)
+            except Exception as e:
+                logger.error("RAG batch answer error: %s", e)
+                result["error"] = str(e)
+
+        logger.info("📦 RAG batch: %d questions, %d answered by the model, %d distinct chunks",
+                    len(questions), len(pending), len(sources))
+        return jsonify({
+            "count": len(results),
+            "results": results,
+            "sources": list(sources.values()),
+            **({"profile_filter": profile_filter} if profile_filter else {})
+        })
+
+    except Exception as e:
+        logger.exception("RAG batch error: %s", e)
+        return jsonify({"error": f"An error occurred: {e}"}), 500
+
+
 if __name__ == "__main__":
     port = int(os.getenv("FLASK_RUN_PORT", 5001))
     app.run(host="0.0.0.0", port=port, debug=True)
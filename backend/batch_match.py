@@ -0,0 +1,131 @@
+import numpy as np
+
+from backend.matching import RuleIndex, SET_FIELDS, profile_values, rule_matches
+
+# Upper bound on profiles x rules cells evaluated at once (bytes of the bool matrix)
+CHUNK_CELLS = 8_000_000
+
+
+def mask_to_array(mask, size):
+    """Converts a rule bitmap (Python int) into a bool vector of length `size`."""
+    nbytes = max(1, (size + 7) // 8)
+    raw = np.frombuffer(mask.to_bytes(nbytes, "little"), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder="little")[:size].astype(bool)
+
+
+class BatchMatcher:
+    """
+    Vectorized counterpart of RuleIndex.match for many profiles at once.
+    Builds a profiles x rules boolean matrix: one table lookup per set-valued
+    field plus broadcast comparisons against the per-rule area/seating bounds.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.size = len(index.rules)
+        self.regular = mask_to_array(index.indexed_mask, self.size)
+
+        min_area = np.full(self.size, -np.inf)
+        max_area = np.full(self.size, np.inf)
+        seating = np.full(self.size, np.inf)
+        for pos, compiled in enumerate(index.compiled):
+            if compiled is None:
+                continue
+            if compiled["min_area"] is not None:
+                min_area[pos] = compiled["min_area"]
+            if compiled["max_area"] is not None:
+                max_area[pos] = compiled["max_area"]
+            if compiled["seating"] is not None:
+                seating[pos] = compiled["seating"]
+        self.min_area = min_area
+        self.max_area = max_area
+        self.seating = seating
+
+    def _field_tables(self, values):
+        """Encodes each set-valued field as (codes per profile, allowed-rules table per code)."""
+        tables = []
+        for field in SET_FIELDS:
+            codes = {}
+            column = np.empty(len(values), dtype=np.int32)
+            for i, v in enumerate(values):
+                column[i] = codes.setdefault(v[field], len(codes))
+            table = np.stack([mask_to_array(self.index.field_mask(field, v), self.size) for v in codes])
+            tables.append((column, table))
+        return tables
+
+    def match_matrix(self, values):
+        """Returns a (profiles, rules) bool matrix for profiles already passed through profile_values."""
+        result = np.repeat(self.regular[None, :], len(values), axis=0)
+        if not len(values):
+            return result
+        for column, table in self._field_tables(values):
+            result &= table[column]
+
+        area = np.array([np.nan if v["area"] is None else v["area"] for v in values], dtype=float)
+        seats = np.array([np.nan if v["seats"] is None else v["seats"] for v in values], dtype=float)
+        # NaN (no value) compares False, so missing area/seating never rejects
+        result &= ~(area[:, None] < self.min_area[None, :])
+        result &= ~(area[:, None] > self.max_area[None, :])
+        result &= ~(seats[:, None] > self.seating[None, :])
+        return result
+
+    def _match_rows(self, rows, representatives):
+        """Matches distinct profile values; returns the matching positions per row."""
+        fallback = self.index.fallback_positions
+        rows_per_chunk = max(1, CHUNK_CELLS // max(1, self.size))
+        results = []
+        for start in range(0, len(rows), rows_per_chunk):
+            chunk = rows[start:start + rows_per_chunk]
+            matrix = self.match_matrix(chunk)
+            for pos in fallback:
+                rule = self.index.rules[pos]
+                matrix[:, pos] = [rule_matches(rule, user) for user in representatives[start:start + rows_per_chunk]]
+
+            row_ids, cols = np.nonzero(matrix)
+            bounds = np.searchsorted(row_ids, np.arange(len(chunk) + 1)).tolist()
+            cols = cols.tolist()
+            results.extend(cols[bounds[k]:bounds[k + 1]] for k in range(len(chunk)))
+        return results
+
+    def _match(self, profiles, labels):
+        """
+        Matches `profiles` and maps positions through `labels`. Profiles with
+        identical matched-on values are evaluated once and share the result.
+        """
+        results = [None] * len(profiles)
+        row_of = {}
+        rows, representatives, pending = [], [], []
+        for i, user in enumerate(profiles):
+            values = profile_values(user)
+            if values is None:
+                results[i] = [labels[pos] for pos in self.index.match_positions(user)]
+                continue
+            key = tuple(values.values())
+            row = row_of.get(key)
+            if row is None:
+                row = row_of[key] = len(rows)
+                rows.append(values)
+                representatives.append(user)
+            pending.append((i, row))
+
+        row_labels = [[labels[pos] for pos in positions] for positions in self._match_rows(rows, representatives)]
+        for i, row in pending:
+            results[i] = list(row_labels[row])
+        return results
+
+    def match_positions(self, profiles):
+        """Returns, per profile, the positions of its matching rules in rule-set order."""
+        return self._match(list(profiles), range(self.size))
+
+    def match_ids(self, profiles):
+        """Returns, per profile, the IDs of its matching rules in rule-set order."""
+        return self._match(list(profiles), self.index.ids)
+
+
+def match_batch(profiles, rules):
+    """
+    Matches many profiles (shaped like generate_report's `user` dict) in one pass.
+    `rules` is a RuleIndex or a list of rules. Returns a list of matched rule IDs per profile.
+    """
+    index = rules if isinstance(rules, RuleIndex) else RuleIndex(rules)
+    return BatchMatcher(index).match_ids(list(profiles))
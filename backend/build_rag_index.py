@@ -2,16 +2,7 @@ import os
 import json
 import re
 import sys
-import math
-from docx import Document
-from openai import OpenAI
-from docx.document import Document as _Document
-from docx.oxml.text.paragraph import CT_P
-from docx.oxml.table import CT_Tbl
-from docx.table import _Cell, Table
-from docx.text.paragraph import Paragraph
-import chromadb
-from chromadb.config import Settings
+import hashlib
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -24,12 +15,11 @@ print(f"📁 Loading .env from: {env_path}", flush=True)
 # Configuration
 # Use absolute path based on project root
 DOCX_PATH = os.path.join(PROJECT_ROOT, "regulations.docx")
-CHROMA_DB_PATH = os.path.join(BACKEND_DIR, "chroma_db")
+RULES_DIR = os.path.join(BACKEND_DIR, "json_rules")
 PREVIEW_OUTPUT_PATH = os.path.join(BACKEND_DIR, "rag_preview.txt")
 EMBEDDING_MODEL = "text-embedding-3-small"
-MIN_CHARS = 500
-MAX_CHARS = 2000
-COLLECTION_NAME = "rag_index"
+# Bump whenever extraction/sectioning/chunking changes, to force a full re-index
+CHUNKER_VERSION = "chunker-v2"
 
 # Initialize OpenAI
 api_key = os.getenv("OPENAI_API_KEY")
@@ -39,85 +29,61 @@ if not api_key:
 else:
     print(f"✅ OpenAI API key loaded (length: {len(api_key)})", flush=True)
 
-client = OpenAI(api_key=api_key)
+# Allow `python backend/build_rag_index.py` from the project root
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
+
+from backend.vector_store import (RAG_BACKEND, CHROMA_DB_PATH, NUMPY_INDEX_PATH, open_vector_store,
+                                  export_chroma_to_numpy)
+from backend.openai_pool import create_openai_client
+from backend.embed_pipeline import embed_items
+from backend.docx_stream import iter_docx_lines
+from backend.chunking import CHUNK_MAX_TOKENS, CHUNK_MAX_CHARS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_CHARS, chunk_sections
+from backend.chunk_rules import CHUNK_RULE_LINKS, CHUNK_RULE_MIN_SCORE, RuleLinker
+
+# Pooled client: retries 429/5xx with backoff, shared by the embedding threads
+client = create_openai_client(api_key)
 
 # Regex to identify section starts like "1. ", "1.2. ", "12.3.4"
 # Must match start of line, optional whitespace, digits+dots, then space or end
 SECTION_RE = re.compile(r'^\s*(\d+(\.\d+)*)\.?\s+')
 
-def iter_block_items(parent):
-    """
-    Yields each paragraph and table child within *parent*, in document order.
-    Each item is either a Paragraph or a Table instance.
-    """
-    if isinstance(parent, _Document):
-        parent_elm = parent.element.body
-    elif isinstance(parent, _Cell):
-        parent_elm = parent._tc
-    else:
-        raise ValueError("Something's not right")
-
-    for child in parent_elm.iterchildren():
-        if isinstance(child, CT_P):
-            yield Paragraph(child, parent)
-        elif isinstance(child, CT_Tbl):
-            yield Table(child, parent)
-
 def extract_docx(path):
     """
-    Reads DOCX content in strict document order.
-    Returns a single string with all text.
+    Streams DOCX text lines in strict document order (paragraphs and
+    " | "-joined table rows) without loading the whole document.
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found: {path}")
 
-    document = Document(path)
-    lines = []
-
-    def process_block(block):
-        if isinstance(block, Paragraph):
-            text = block.text.strip()
-            if text:
-                lines.append(text)
-        elif isinstance(block, Table):
-            for row in block.rows:
-                # Extract text from each cell
-                cell_texts = [cell.text.strip() for cell in row.cells]
-                # Join with pipe if any content exists
-                row_content = " | ".join(cell_texts)
-                # Only add if row has some non-empty content
-                if any(c for c in cell_texts):
-                    lines.append(row_content)
-
-    # Iterate over main document body
-    for block in iter_block_items(document):
-        process_block(block)
-
-    full_text = "\n".join(lines)
-    print(f"Extracted {len(full_text)} characters from {path}")
-    return full_text
-
-def split_into_sections(full_text):
+    chars = 0
+    for line in iter_docx_lines(path):
+        chars += len(line) + 1
+        yield line
+    print(f"Extracted {max(chars - 1, 0)} characters from {path}")
+
+def split_into_sections(lines):
     """
-    Splits text into logical sections based on numbering.
-    Returns a list of dicts: {"section_id": "...", "text": "..."}
+    Groups streamed lines into logical sections based on numbering.
+    Yields dicts: {"section_id": "...", "text": "..."}
     """
-    lines = full_text.split('\n')
-    sections = []
-    
+    count = 0
     current_id = "intro" # For text before the first numbered section
     current_lines = []
 
+    def section():
+        # Skip empty sections (e.g. an empty intro)
+        text = "\n".join(current_lines).strip()
+        return {"section_id": current_id, "text": text} if text else None
+
     for line in lines:
         match = SECTION_RE.match(line)
         if match:
             # Found a new section start
-            # Save previous section if it has content
-            if current_lines:
-                sections.append({
-                    "section_id": current_id,
-                    "text": "\n".join(current_lines).strip()
-                })
+            # Emit previous section if it has content
+            if current_lines and section():
+                count += 1
+                yield section()
             
             # Start new section
             current_id = match.group(1) # Extract the numbering (e.g., "6.7.4")
@@ -126,73 +92,92 @@ def split_into_sections(full_text):
             # Continue current section
             current_lines.append(line)
 
-    # Add the last section
-    if current_lines:
-        sections.append({
-            "section_id": current_id,
-            "text": "\n".join(current_lines).strip()
-        })
+    # Emit the last section
+    if current_lines and section():
+        count += 1
+        yield section()
 
-    # Filter out empty intro if it's empty
-    sections = [s for s in sections if s['text'].strip()]
-    
-    print(f"  Identified {len(sections)} logical sections.")
-    return sections
-
-def split_large_section(section_id, text, max_chars=1200):
-    # פיצול גס לפי תווים (פשוט ומהיר). אפשר לשפר לפי טוקנים בהמשך.
-    if len(text) <= max_chars:
-        return [{"id": section_id, "chunk": text}]
-    parts = []
-    for idx in range(0, len(text), max_chars):
-        part_num = idx // max_chars + 1
-        parts.append({
-            "id": f"{section_id}_part{part_num}",
-            "chunk": text[idx:idx+max_chars]
-        })
-    return parts
-
-
-def sections_to_items(sections, max_chars=1200):
-    items = []
-    for s in sections:
-        items.extend(split_large_section(s["section_id"], s["text"], max_chars=max_chars))
-    print(f" Created {len(items)} items (sections + split parts).")
-    return items
-
-
-def get_chroma_collection():
-    """Initialize and return ChromaDB collection."""
-    client = chromadb.PersistentClient(path=CHROMA_DB_PATH)
-    collection = client.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"}
-    )
-    return collection
+    print(f"  Identified {count} logical sections.")
 
+def sections_to_items(sections):
+    """Yields chunks (merged small sections, split large ones) as sections stream in."""
+    count = 0
+    for item in chunk_sections(sections):
+        count += 1
+        yield item
+    print(f" Created {count} chunks (max {CHUNK_MAX_TOKENS} tokens, {CHUNK_OVERLAP_TOKENS} overlap).")
+
+
+def get_vector_store():
+    """Opens the configured vector store (RAG_BACKEND=chroma|numpy)."""
+    return open_vector_store(RAG_BACKEND)
+
+
+def manifest_path(backend=RAG_BACKEND):
+    """Kept inside the index it describes, so the two are persisted (and deleted) together."""
+    index_dir = NUMPY_INDEX_PATH if backend == "numpy" else CHROMA_DB_PATH
+    return os.path.join(index_dir, "rag_manifest.json")
+
+
+def legacy_manifest_path(backend=RAG_BACKEND):
+    """Where manifests were written before they moved into the index directory."""
+    return os.path.join(BACKEND_DIR, f"rag_manifest.{backend}.json")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
 
-def load_existing_ids(collection):
-    """Load existing IDs from ChromaDB collection."""
-    try:
-        results = collection.get()
-        existing_ids = set(results.get("ids", []))
-        return existing_ids
-    except Exception as e:
-        print(f"  Warning: Could not load existing IDs: {e}")
-        return set()
 
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
 
-def add_items_to_chroma(collection, items):
-    """Add items to ChromaDB collection."""
+
+def load_manifest(path=None):
+    """Reads the index manifest ({} if missing or unreadable)."""
+    paths = [path] if path else [manifest_path(), legacy_manifest_path()]
+    for candidate in paths:
+        try:
+            with open(candidate, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            continue
+    return {}
+
+
+def save_manifest(manifest, path=None):
+    path = path or manifest_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def index_settings():
+    """Settings that invalidate every stored embedding when they change."""
+    return {
+        "chunker_version": CHUNKER_VERSION,
+        "chunk_limits": [CHUNK_MAX_TOKENS, CHUNK_MAX_CHARS, CHUNK_OVERLAP_TOKENS, CHUNK_MIN_CHARS],
+        "embedding_model": EMBEDDING_MODEL,
+        "backend": RAG_BACKEND,
+    }
+
+
+def add_items_to_store(store, items):
+    """Add (or replace) items in the vector store."""
     if not items:
         return
     
     ids = [item["id"] for item in items]
     embeddings = [item["embedding"] for item in items]
     documents = [item["chunk"] for item in items]
-    metadatas = [{"id": item["id"]} for item in items]
+    metadatas = [dict(item.get("metadata", {}), id=item["id"], content_hash=item["content_hash"]) for item in items]
     
-    collection.add(
+    store.upsert(
         ids=ids,
         embeddings=embeddings,
         documents=documents,
@@ -200,65 +185,134 @@ def add_items_to_chroma(collection, items):
     )
 
 
-def embed_items_incremental(collection, items, existing_ids, batch_size=5):
-    todo = [it for it in items if it["id"] not in existing_ids]
-    print(f" Remaining to embed: {len(todo)} (skipping {len(items)-len(todo)} already embedded)")
+def load_ruleset():
+    from backend.rule_store import RuleStore
+    from backend.rule_pack import RULES_PACK_PATH
 
-    embedded = []
-    for i in range(0, len(todo), batch_size):
-        batch = todo[i:i+batch_size]
-        texts = [b["chunk"] for b in batch]
+    return RuleStore(RULES_DIR, pack_path=RULES_PACK_PATH).get()
 
-        try:
-            resp = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
-        except Exception as e:
-            print(f" Embedding failed at batch {i//batch_size + 1}: {e}")
-            # Save partial progress before exiting
-            if embedded:
-                add_items_to_chroma(collection, embedded)
-                print(f" Saved partial progress: +{len(embedded)} items")
-            raise
-
-        for j, r in enumerate(resp.data):
-            embedded.append({
-                "id": batch[j]["id"],
-                "chunk": batch[j]["chunk"],
-                "embedding": r.embedding
-            })
-
-        # checkpoint save every batch to ChromaDB
-        if embedded:
-            # Check for duplicates within the batch
-            batch_ids = [item["id"] for item in embedded]
-            if len(batch_ids) != len(set(batch_ids)):
-                duplicates = [id for id in batch_ids if batch_ids.count(id) > 1]
-                print(f"  Warning: Found duplicate IDs in batch: {set(duplicates)}")
-                # Remove duplicates, keeping first occurrence
-                seen = set()
-                unique_embedded = []
-                for item in embedded:
-                    if item["id"] not in seen:
-                        seen.add(item["id"])
-                        unique_embedded.append(item)
-                embedded = unique_embedded
-                print(f"  Deduplicated: {len(embedded)} unique items")
-            
-            add_items_to_chroma(collection, embedded)
-            # Update existing_ids to avoid re-adding
-            existing_ids.update([item["id"] for item in embedded])
-            embedded = []  # clear buffer after saving
 
-        print(f"   Batch {i//batch_size + 1}/{(len(todo)+batch_size-1)//batch_size}")
+def rule_link_settings(ruleset):
+    """What the stored chunk -> rule links were computed from."""
+    return {"rules_version": ruleset.version, "links": CHUNK_RULE_LINKS, "min_score": CHUNK_RULE_MIN_SCORE}
+
 
-    return []  # because we already saved incrementally
+def link_chunks_to_rules(store, manifest, ruleset):
+    """
+    Stores the rules each chunk is about, and their categories, in the
+    chunk's metadata ("rules", "categories"), so retrieval can be filtered by
+    the rules a business matches. Only metadata that changed is rewritten;
+    embeddings are kept.
+    """
+    linker = RuleLinker(ruleset.rules)
+    ids, documents, metadatas = store.get_documents()
+    changed_ids, changed_metadatas = [], []
+    linked = 0
+    for chunk_id, document, metadata in zip(ids, documents, metadatas):
+        links = linker.metadata(document)
+        linked += bool(links["rules"])
+        updated = dict(metadata or {}, **links)
+        if updated != metadata:
+            changed_ids.append(chunk_id)
+            changed_metadatas.append(updated)
+    store.update_metadatas(changed_ids, changed_metadatas)
+    manifest["rule_links"] = rule_link_settings(ruleset)
+    save_manifest(manifest)
+    print(f"🔗 Linked {linked} of {len(ids)} chunks to rules ({len(ruleset)} rules, version {ruleset.version}); "
+          f"{len(changed_ids)} updated")
+
+
+def sync_numpy_index(manifest, settings):
+    """Keeps the NumPy index in sync with ChromaDB so workers can serve with RAG_BACKEND=numpy."""
+    if RAG_BACKEND == "chroma":
+        export_chroma_to_numpy()
+        save_manifest(
+            dict(manifest, settings=dict(settings, backend="numpy")),
+            manifest_path("numpy")
+        )
+
+
+def embed_items_incremental(store, items, manifest, reuse_batch=100):
+    """
+    Brings the store in line with the streamed `items`, keyed by content hash:
+    unchanged chunks are skipped, new/changed chunks are embedded (or copy the
+    stored embedding of an identical chunk under another ID), and chunks not
+    seen in the stream are deleted at the end. `manifest["chunks"]`
+    ({id: content_hash}) is saved after every write.
+    Returns the items that failed to embed.
+    """
+    chunks = manifest["chunks"]
+    stored_ids = store.get_ids()
+    # Entries the store no longer has (or never confirmed) are not trusted
+    for chunk_id in list(chunks):
+        if chunk_id not in stored_ids:
+            del chunks[chunk_id]
+    # Renumbered chunks: the same text may already be stored under another ID
+    by_hash = {h: chunk_id for chunk_id, h in chunks.items()}
+
+    seen = set()
+    stats = {"unchanged": 0, "changed": 0, "reused": 0}
+
+    def write(embedded):
+        add_items_to_store(store, embedded)
+        chunks.update((item["id"], item["content_hash"]) for item in embedded)
+        save_manifest(manifest)
+        print(f"   Saved {len(embedded)} items to {RAG_BACKEND} store", flush=True)
+
+    def reuse(candidates):
+        """Copies stored embeddings for `candidates`; returns those that still need embedding."""
+        # The source must still hold the same text (it may have been overwritten in this run)
+        sources = {it["id"]: by_hash[it["content_hash"]] for it in candidates
+                   if chunks.get(by_hash[it["content_hash"]]) == it["content_hash"]}
+        stored = store.get_embeddings(set(sources.values())) if sources else {}
+        reused = [dict(it, embedding=stored[sources[it["id"]]]) for it in candidates
+                  if sources.get(it["id"]) in stored]
+        if reused:
+            write(reused)
+            stats["reused"] += len(reused)
+        return [it for it in candidates if sources.get(it["id"]) not in stored]
+
+    def to_embed():
+        candidates = []
+        for it in items:
+            # Duplicate IDs: first occurrence wins
+            if it["id"] in seen:
+                continue
+            seen.add(it["id"])
+            it["content_hash"] = content_hash(it["chunk"])
+            if chunks.get(it["id"]) == it["content_hash"]:
+                stats["unchanged"] += 1
+                continue
+            stats["changed"] += 1
+            if it["content_hash"] in by_hash:
+                candidates.append(it)
+                if len(candidates) >= reuse_batch:
+                    yield from reuse(candidates)
+                    candidates = []
+            else:
+                yield it
+        yield from reuse(candidates)
+
+    failed = embed_items(client, EMBEDDING_MODEL, to_embed(), write)
+
+    removed = stored_ids - seen
+    if removed:
+        store.delete(removed)
+        for chunk_id in removed:
+            chunks.pop(chunk_id, None)
+        save_manifest(manifest)
+    print(f" Index diff: {stats['unchanged']} unchanged, {stats['changed']} new or changed "
+          f"({stats['reused']} reused stored embeddings), {len(removed)} removed")
+    return failed
 
 def save_preview(items):
-    """Saves a text preview of items for manual inspection."""
+    """Writes a text preview of items for manual inspection as they stream through."""
     with open(PREVIEW_OUTPUT_PATH, "w", encoding="utf-8") as f:
         for it in items:
             f.write(f"=== ITEM ID: {it['id']} ===\n")
             f.write(it["chunk"])
             f.write("\n\n" + "-"*50 + "\n\n")
+            yield it
     print(f" Preview saved to {PREVIEW_OUTPUT_PATH}")
 
 
@@ -266,10 +320,8 @@ def main():
     print(" Starting RAG Index Build Process...")
 
     try:
-        # 0) Initialize ChromaDB collection
-        collection = get_chroma_collection()
-        existing_ids = load_existing_ids(collection)
-        print(f"  Found {len(existing_ids)} existing items in ChromaDB")
+        # 0) Initialize the vector store
+        store = get_vector_store()
 
         # 1) Extract
         if not os.path.exists(DOCX_PATH):
@@ -279,49 +331,63 @@ def main():
                 f"Project root: {PROJECT_ROOT}\n"
                 f"Backend dir: {BACKEND_DIR}"
             )
-        print(f"📄 Reading DOCX from: {DOCX_PATH}", flush=True)
-        raw_text = extract_docx(DOCX_PATH)
-
-        # 2) Sectioning
-        sections = split_into_sections(raw_text)
-
-        # ---- PARTITION (run in 3 parts) ----
-        part = int(sys.argv[1]) if len(sys.argv) > 1 else 1     # 1..3
-        parts = int(sys.argv[2]) if len(sys.argv) > 2 else 3    # default 3
-
-        total = len(sections)
-        chunk_size = math.ceil(total / parts)
-        start = (part - 1) * chunk_size
-        end = min(part * chunk_size, total)
-
-        print(f" Running part {part}/{parts}: sections[{start}:{end}] out of {total}")
-        sections = sections[start:end]
-        # ------------------------------------
 
-        # 3) Convert sections -> items (split big sections if needed)
-        items = sections_to_items(sections, max_chars=1200)
+        # Manifest: a different chunker/model/backend invalidates every stored embedding
+        doc_hash = file_sha256(DOCX_PATH)
+        ruleset = load_ruleset()
+        manifest = load_manifest()
+        settings = index_settings()
+        if manifest.get("settings") != settings:
+            existing_ids = store.get_ids()
+            if existing_ids:
+                print(f"  Index settings changed ({manifest.get('settings')} -> {settings}), full rebuild")
+                store.delete(existing_ids)
+            manifest = {"settings": settings, "doc_hash": None, "chunks": {}}
+            save_manifest(manifest)
+        elif manifest.get("doc_hash") == doc_hash and store.count() == len(manifest.get("chunks", {})):
+            if manifest.get("rule_links") == rule_link_settings(ruleset):
+                print(f"  {DOCX_PATH} unchanged since the last build ({store.count()} chunks), nothing to do")
+                return
+            print(f"  {DOCX_PATH} unchanged since the last build, re-linking chunks to the changed rules")
+            link_chunks_to_rules(store, manifest, ruleset)
+            sync_numpy_index(manifest, settings)
+            return
+        print(f"  Found {store.count()} existing items in {RAG_BACKEND} store")
 
-        # 4) Preview (Sanity Check)
-        save_preview(items)
-
-        
-        # 5) Embed only missing items (saves incrementally to ChromaDB)
-        embed_items_incremental(collection, items, existing_ids, batch_size=10)
-
-        # 6) Reload final count from ChromaDB
-        final_count = collection.count()
-        print(f"Total saved items in ChromaDB: {final_count}")
+        print(f"📄 Reading DOCX from: {DOCX_PATH}", flush=True)
+        # 1-4) Extract -> sections -> items -> preview, streamed straight into embedding
+        lines = extract_docx(DOCX_PATH)
+        sections = split_into_sections(lines)
+        items = sections_to_items(sections)
+        items = save_preview(items)
+
+        # 5) Embed new/changed items, delete removed ones (bulk writes to the vector store)
+        failed = embed_items_incremental(store, items, manifest)
+        if failed:
+            raise RuntimeError(f"{len(failed)} chunks could not be embedded; re-run to resume.")
+        manifest["doc_hash"] = doc_hash
+        save_manifest(manifest)
+
+        # 5b) Link chunks to the rules they are about (metadata only)
+        link_chunks_to_rules(store, manifest, ruleset)
+
+        # 6) Reload final count from the vector store
+        final_count = store.count()
+        print(f"Total saved items in {RAG_BACKEND} store: {final_count}")
 
         # 7) Final Verification
         print("Sanity Check: Verifying output...")
         if final_count == 0:
-            raise RuntimeError("ChromaDB collection is empty after embedding. Something went wrong.")
+            raise RuntimeError("Vector store is empty after embedding. Something went wrong.")
         
         # Get a sample item
-        sample_results = collection.get(limit=1)
-        if sample_results["ids"]:
-            print(f"   - Sample ID: {sample_results['ids'][0]}")
-            print(f"   - Has embedding? yes (stored in ChromaDB)")
+        sample_ids = sorted(store.get_ids())
+        if sample_ids:
+            print(f"   - Sample ID: {sample_ids[0]}")
+            print(f"   - Has embedding? yes (stored in {RAG_BACKEND} store)")
+
+        # 8) Keep the NumPy index in sync so workers can serve with RAG_BACKEND=numpy
+        sync_numpy_index(manifest, settings)
 
         print(" RAG Index built successfully!")
 
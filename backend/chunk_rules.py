@@ -0,0 +1,80 @@
+import os
+
+from backend.lexical_index import BM25Index
+
+# A chunk is linked to at most CHUNK_RULE_LINKS rules, each scoring at least
+# CHUNK_RULE_MIN_SCORE of what the rule's own text scores against it
+CHUNK_RULE_LINKS = int(os.getenv("CHUNK_RULE_LINKS", "3"))
+CHUNK_RULE_MIN_SCORE = float(os.getenv("CHUNK_RULE_MIN_SCORE", "0.35"))
+
+
+def rule_text(rule):
+    return "\n".join([rule.get("title") or "", *(rule.get("actions") or [])])
+
+
+class RuleLinker:
+    """
+    Finds the rules a regulation chunk is about: the chunk's text is searched
+    against the rule texts with BM25, and each rule's score is divided by the
+    score of the rule's own text, so long rules do not win by length alone.
+    """
+
+    def __init__(self, rules, links=CHUNK_RULE_LINKS, min_score=CHUNK_RULE_MIN_SCORE):
+        self.rules = {rule["id"]: rule for rule in rules}
+        self.links = links
+        self.min_score = min_score
+        self.index = BM25Index([{"id": rule_id, "chunk": rule_text(rule)} for rule_id, rule in self.rules.items()])
+        self.self_scores = {}
+        for rule_id, rule in self.rules.items():
+            hits = self.index.search(rule_text(rule), top_k=len(self.rules))
+            self.self_scores[rule_id] = next((h["score"] for h in hits if h["id"] == rule_id), 0.0)
+
+    def link(self, text):
+        """IDs of the rules the text is about, best first."""
+        scored = [
+            (hit["id"], hit["score"] / self.self_scores[hit["id"]])
+            for hit in self.index.search(text, top_k=len(self.rules))
+            if self.self_scores.get(hit["id"])
+        ]
+        scored.sort(key=lambda item: -item[1])
+        return [rule_id for rule_id, score in scored[:self.links] if score >= self.min_score]
+
+    def metadata(self, text):
+        """The chunk metadata fields: {"rules", "categories"}, comma-separated like "sections"."""
+        rule_ids = self.link(text)
+        categories = dict.fromkeys(self.rules[r].get("category") for r in rule_ids if self.rules[r].get("category"))
+        return {"rules": ",".join(rule_ids), "categories": ",".join(categories)}
+
+
+class ChunkRuleFilter:
+    """
+    Which chunks to search for a business, from the "rules" metadata stored
+    at index time: chunks linked to a rule that applies to the business, and
+    chunks not linked to any rule (general text). Chunks about rules that
+    only apply to other businesses are left out.
+    """
+
+    def __init__(self, ids, metadatas):
+        self.total = len(ids)
+        self.unlinked = set()
+        self.by_rule = {}
+        # Indexes built before chunks were linked have no "rules" field at all
+        self.linked = False
+        for chunk_id, metadata in zip(ids, metadatas):
+            metadata = metadata or {}
+            self.linked = self.linked or "rules" in metadata
+            rule_ids = metadata.get("rules")
+            if not rule_ids:
+                self.unlinked.add(chunk_id)
+                continue
+            for rule_id in rule_ids.split(","):
+                self.by_rule.setdefault(rule_id, set()).add(chunk_id)
+
+    def allowed_ids(self, rule_ids):
+        """Chunk IDs to search given the business's matched rule IDs, or None if chunks were never linked."""
+        if not self.linked:
+            return None
+        allowed = set(self.unlinked)
+        for rule_id in rule_ids:
+            allowed.update(self.by_rule.get(rule_id, ()))
+        return allowed
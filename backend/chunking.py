@@ -0,0 +1,180 @@
+import os
+import re
+
+from backend.prompt_compact import count_tokens
+
+# Chunk size limits (both apply) and overlap between consecutive parts of a split section
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "400"))
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "2000"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# Adjacent sections of the same chapter are merged until a chunk reaches this size
+CHUNK_MIN_CHARS = int(os.getenv("CHUNK_MIN_CHARS", "500"))
+
+# Sentence ends: . ! ? ; followed by whitespace
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?;])\s+")
+# Pieces this short ("1.", "א.", "(ב)") are list markers, not sentences
+_MIN_SENTENCE_CHARS = 12
+_WORD_RE = re.compile(r"\S+\s*")
+
+
+def chapter_of(section_id):
+    """Top-level chapter of a section ID ("6.7.4" -> "6", "intro" -> "intro")."""
+    return section_id.split(".")[0]
+
+
+def parent_of(section_id):
+    """Immediate parent section ("6.7.4" -> "6.7"; "" for top-level sections)."""
+    return section_id.rsplit(".", 1)[0] if "." in section_id else ""
+
+
+def split_sentences(line):
+    pieces = []
+    for piece in _SENTENCE_END_RE.split(line):
+        if pieces and len(pieces[-1]) < _MIN_SENTENCE_CHARS:
+            pieces[-1] = f"{pieces[-1]} {piece}"
+        else:
+            pieces.append(piece)
+    return [p for p in pieces if p.strip()]
+
+
+def _hard_split(text, max_tokens, max_chars):
+    """Splits an over-long sentence/row on word boundaries."""
+    parts, current = [], ""
+    for word in _WORD_RE.findall(text):
+        candidate = current + word
+        if current and (count_tokens(candidate) > max_tokens or len(candidate) > max_chars):
+            parts.append(current.rstrip())
+            current = word
+        else:
+            current = candidate
+    if current.strip():
+        parts.append(current.rstrip())
+    return parts
+
+
+def split_units(text, max_tokens=CHUNK_MAX_TOKENS, max_chars=CHUNK_MAX_CHARS):
+    """
+    Splits section text into units that are never cut: whole table rows
+    (lines with " | ") and sentences. Units larger than the limits are split
+    on word boundaries.
+    """
+    units = []
+    for line in text.split("\n"):
+        if not line.strip():
+            continue
+        pieces = [line] if " | " in line else split_sentences(line)
+        for piece in pieces:
+            if count_tokens(piece) > max_tokens or len(piece) > max_chars:
+                units.extend(_hard_split(piece, max_tokens, max_chars))
+            else:
+                units.append(piece)
+    return units
+
+
+def _join(units, separators):
+    return "".join(unit + sep for unit, sep in zip(units, separators)).strip()
+
+
+def pack_units(text, max_tokens=CHUNK_MAX_TOKENS, max_chars=CHUNK_MAX_CHARS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """
+    Packs a section's units into parts within the token/char limits. Each part
+    after the first starts with the last whole units of the previous part, up
+    to `overlap_tokens`. Returns a list of part texts.
+    """
+    # Remember whether each unit ended a line (table rows, paragraphs) or a sentence
+    units, separators = [], []
+    for line in text.split("\n"):
+        line_units = split_units(line, max_tokens, max_chars)
+        units.extend(line_units)
+        separators.extend([" "] * (len(line_units) - 1) + ["\n"] if line_units else [])
+
+    parts = []
+    start = 0
+    while start < len(units):
+        end = start + 1
+        while end < len(units):
+            candidate = _join(units[start:end + 1], separators[start:end + 1])
+            if count_tokens(candidate) > max_tokens or len(candidate) > max_chars:
+                break
+            end += 1
+        parts.append(_join(units[start:end], separators[start:end]))
+        if end >= len(units):
+            break
+        # Overlap: step back over trailing units that fit in the overlap budget
+        next_start = end
+        while (overlap_tokens and next_start - 1 > start
+               and count_tokens(_join(units[next_start - 1:end], separators[next_start - 1:end])) <= overlap_tokens):
+            next_start -= 1
+        start = next_start
+    return parts
+
+
+def _section_metadata(section_ids):
+    first = section_ids[0]
+    return {
+        "section": first,
+        "sections": ",".join(section_ids),
+        "parent": parent_of(first),
+        "chapter": chapter_of(first),
+    }
+
+
+def chunk_sections(sections, max_tokens=CHUNK_MAX_TOKENS, max_chars=CHUNK_MAX_CHARS,
+                   overlap_tokens=CHUNK_OVERLAP_TOKENS, min_chars=CHUNK_MIN_CHARS):
+    """
+    Turns streamed {"section_id", "text"} sections into chunks
+    {"id", "chunk", "metadata"}:
+    - small adjacent sections of the same chapter are merged until the chunk
+      reaches `min_chars` (the chunk takes the first section's ID);
+    - sections over the limits are split on sentence/table-row boundaries
+      into "<id>_partN" chunks with `overlap_tokens` of overlap;
+    - repeated section numbers get unique IDs ("1.3", "1.3~2", ...);
+    - metadata carries the section, merged sections, parent and chapter.
+    """
+    seen = {}
+    buffer = []  # [(unique_id, section_id, text)]
+
+    def unique_id(section_id):
+        seen[section_id] = seen.get(section_id, 0) + 1
+        return section_id if seen[section_id] == 1 else f"{section_id}~{seen[section_id]}"
+
+    def flush():
+        if not buffer:
+            return None
+        text = "\n".join(t for _, _, t in buffer)
+        chunk = {
+            "id": buffer[0][0],
+            "chunk": text,
+            "metadata": _section_metadata([section_id for _, section_id, _ in buffer]),
+        }
+        buffer.clear()
+        return chunk
+
+    for section in sections:
+        section_id, text = section["section_id"], section["text"]
+        chunk_id = unique_id(section_id)
+
+        if count_tokens(text) > max_tokens or len(text) > max_chars:
+            merged = flush()
+            if merged:
+                yield merged
+            parts = pack_units(text, max_tokens, max_chars, overlap_tokens)
+            for n, part in enumerate(parts, start=1):
+                yield {
+                    "id": f"{chunk_id}_part{n}" if len(parts) > 1 else chunk_id,
+                    "chunk": part,
+                    "metadata": dict(_section_metadata([section_id]), part=n, parts=len(parts)),
+                }
+            continue
+
+        if buffer:
+            buffer_text = "\n".join(t for _, _, t in buffer)
+            combined = f"{buffer_text}\n{text}"
+            if (chapter_of(buffer[0][1]) != chapter_of(section_id) or len(buffer_text) >= min_chars
+                    or count_tokens(combined) > max_tokens or len(combined) > max_chars):
+                yield flush()
+        buffer.append((chunk_id, section_id, text))
+
+    merged = flush()
+    if merged:
+        yield merged
@@ -0,0 +1,331 @@
+import os
+import re
+import sys
+import json
+import random
+import hashlib
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.lexical_index import normalize_text, strip_prefixes
+from backend.matching import (
+    BOOLEAN_FIELDS, DEFAULT_FOOD_TYPE, SET_FIELDS, IrregularRule, compile_conditions, profile_values,
+    random_profile, rule_matches, _outcome, _thresholds,
+)
+from backend.prompt_compact import priority_rank
+
+# Estimated Jaccard similarity (of action word 3-shingles) above which two rules are near-duplicates
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32  # 32 bands x 4 rows: pairs above ~0.45 similarity become candidates
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_WORD_RE = re.compile(r"[^\W_]+")
+
+
+def normalize_action(text):
+    """Action text as comparable words: normalized, punctuation-free, Hebrew prefixes stripped."""
+    return " ".join(strip_prefixes(w) for w in _WORD_RE.findall(normalize_text(text)))
+
+
+def actions_key(rule):
+    """Exact-duplicate key: hash of the rule's normalized actions, order-insensitive."""
+    actions = sorted({normalize_action(a) for a in rule.get("actions") or []})
+    return hashlib.sha256("\n".join(actions).encode("utf-8")).hexdigest()
+
+
+def action_shingles(rule, size=3):
+    """Word `size`-grams of all actions (the title when there are none)."""
+    texts = rule.get("actions") or [rule.get("title", "")]
+    shingles = set()
+    for text in texts:
+        words = normalize_action(text).split()
+        if len(words) < size:
+            shingles.add(" ".join(words))
+        for i in range(len(words) - size + 1):
+            shingles.add(" ".join(words[i:i + size]))
+    shingles.discard("")
+    return shingles
+
+
+class MinHasher:
+    """MinHash signatures with universal hashing ((a*x + b) mod p) over 31-bit shingle hashes."""
+
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles):
+        if not shingles:
+            return np.full(len(self.a), _MERSENNE_PRIME, dtype=np.uint64)
+        x = np.array(
+            [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") % _MERSENNE_PRIME
+             for s in shingles],
+            dtype=np.uint64
+        )
+        return ((np.outer(x, self.a) + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+
+def candidate_pairs(signatures, bands=LSH_BANDS):
+    """LSH banding: pairs of rule positions sharing at least one identical band."""
+    rows = len(signatures[0]) // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        for position, signature in enumerate(signatures):
+            key = signature[band * rows:(band + 1) * rows].tobytes()
+            buckets.setdefault(key, []).append(position)
+        for members in buckets.values():
+            for i in range(len(members)):
+                for j in range(i + 1, len(members)):
+                    pairs.add((members[i], members[j]))
+    return pairs
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def _bound(values, pick):
+    """Union of bounds: unbounded (None) wins, otherwise the loosest."""
+    return None if any(v is None for v in values) else pick(values)
+
+
+def merge_conditions(a, b):
+    """
+    Exact union of two compiled conditions (see matching.compile_conditions),
+    or None when the union is not expressible as one applies_when: the rules
+    may differ in a single dimension only, and area ranges must overlap.
+    """
+    differing = [f for f in SET_FIELDS if a["sets"][f] != b["sets"][f]]
+    area_differs = (a["min_area"], a["max_area"]) != (b["min_area"], b["max_area"])
+    seating_differs = a["seating"] != b["seating"]
+    if len(differing) + area_differs + seating_differs > 1:
+        return None
+
+    if area_differs and a["min_area"] != b["min_area"] and a["max_area"] != b["max_area"]:
+        low = max(v if v is not None else float("-inf") for v in (a["min_area"], b["min_area"]))
+        high = min(v if v is not None else float("inf") for v in (a["max_area"], b["max_area"]))
+        if low > high:
+            return None  # disjoint ranges
+
+    sets = {}
+    for field in SET_FIELDS:
+        if a["sets"][field] is None or b["sets"][field] is None:
+            sets[field] = None
+        else:
+            sets[field] = a["sets"][field] | b["sets"][field]
+    return {
+        "sets": sets,
+        "min_area": _bound([a["min_area"], b["min_area"]], min),
+        "max_area": _bound([a["max_area"], b["max_area"]], max),
+        "seating": _bound([a["seating"], b["seating"]], max),
+    }
+
+
+def _ordered(values, *preferred):
+    """Set values in the order they first appear in the preferred lists."""
+    order = []
+    for listed in preferred:
+        for value in listed or []:
+            if value in values and value not in order:
+                order.append(value)
+    return order + sorted((v for v in values if v not in order), key=repr)
+
+
+def conditions_to_applies_when(compiled, rules):
+    """Writes merged conditions back in the rules' applies_when format."""
+    applies_when = dict(rules[0].get("applies_when") or {})
+    for field in SET_FIELDS:
+        values = compiled["sets"][field]
+        preferred = [(r.get("applies_when") or {}).get(field) for r in rules]
+        if values is None:
+            if field in BOOLEAN_FIELDS:
+                applies_when.pop(field, None)  # absent = unconstrained
+            elif field in applies_when:
+                applies_when[field] = None
+        else:
+            applies_when[field] = _ordered(values, *preferred)
+    applies_when["min_area"] = compiled["min_area"]
+    applies_when["max_area"] = compiled["max_area"]
+    applies_when["seating_capacity"] = compiled["seating"]
+    return applies_when
+
+
+def merge_group(rules):
+    """
+    One rule standing for `rules` (highest priority first): the first rule's
+    fields, every distinct action, and applies_when covering all of them.
+    """
+    merged = dict(rules[0])
+    actions = []
+    seen = set()
+    for rule in rules:
+        for action in rule.get("actions") or []:
+            key = normalize_action(action)
+            if key not in seen:
+                seen.add(key)
+                actions.append(action)
+    merged["actions"] = actions
+    if len(rules) > 1:
+        compiled = compile_conditions(rules[0])
+        for rule in rules[1:]:
+            compiled = merge_conditions(compiled, compile_conditions(rule))
+        if compiled != compile_conditions(rules[0]):
+            merged["applies_when"] = conditions_to_applies_when(compiled, rules)
+    return merged
+
+
+def dedupe_rules(rules, threshold=DEDUPE_THRESHOLD):
+    """
+    Merges duplicate rules: identical normalized actions, or MinHash-similar
+    actions within the same category. A cluster is split wherever the union
+    of applies_when would not be exact, so matching never widens.
+    Returns (new rules numbered R0001..., {old id: new id}, stats).
+    """
+    clusters = _UnionFind(len(rules))
+
+    exact = {}
+    for position, rule in enumerate(rules):
+        exact.setdefault(actions_key(rule), []).append(position)
+    exact_pairs = 0
+    for members in exact.values():
+        for position in members[1:]:
+            clusters.union(members[0], position)
+            exact_pairs += 1
+
+    hasher = MinHasher()
+    signatures = [hasher.signature(action_shingles(rule)) for rule in rules]
+    near_pairs = 0
+    for i, j in candidate_pairs(signatures):
+        if rules[i].get("category") != rules[j].get("category"):
+            continue
+        if float(np.mean(signatures[i] == signatures[j])) >= threshold:
+            if clusters.find(i) != clusters.find(j):
+                near_pairs += 1
+            clusters.union(i, j)
+
+    members = {}
+    for position in range(len(rules)):
+        members.setdefault(clusters.find(position), []).append(position)
+
+    # Within a cluster, fold rules into groups whose merged conditions stay exact
+    groups = []
+    for root in sorted(members):
+        cluster_groups = []
+        for position in sorted(members[root], key=lambda p: (priority_rank(rules[p].get("priority")), p)):
+            try:
+                conditions = compile_conditions(rules[position])
+            except IrregularRule:
+                cluster_groups.append({"positions": [position], "conditions": None})
+                continue
+            for group in cluster_groups:
+                if group["conditions"] is None:
+                    continue
+                union = merge_conditions(group["conditions"], conditions)
+                if union is not None:
+                    group["positions"].append(position)
+                    group["conditions"] = union
+                    break
+            else:
+                cluster_groups.append({"positions": [position], "conditions": conditions})
+        groups.extend(cluster_groups)
+
+    groups.sort(key=lambda g: min(g["positions"]))
+    new_rules = []
+    id_map = {}
+    for number, group in enumerate(groups, start=1):
+        merged = merge_group([rules[p] for p in group["positions"]])
+        merged["id"] = f"R{number:04d}"
+        new_rules.append(merged)
+        for position in group["positions"]:
+            id_map[str(rules[position].get("id"))] = merged["id"]
+
+    stats = {
+        "rules_before": len(rules),
+        "rules_after": len(new_rules),
+        "exact_duplicates": exact_pairs,
+        "near_duplicates": near_pairs,
+        "merged_groups": sum(1 for g in groups if len(g["positions"]) > 1),
+    }
+    return new_rules, id_map, stats
+
+
+def verify_dedupe(old_rules, new_rules, id_map, profiles):
+    """
+    Returns the profiles for which the deduped rules match differently: every
+    profile must match exactly the new IDs of the old rules it matched (and
+    rules that raise on a profile must still raise the same error).
+    """
+    mismatches = []
+    for user in profiles:
+        expected = {(id_map[str(r.get("id"))], _outcome(lambda: rule_matches(r, user))) for r in old_rules}
+        actual = {(r["id"], _outcome(lambda: rule_matches(r, user))) for r in new_rules}
+        expected = {entry for entry in expected if entry[1] is not False}
+        actual = {entry for entry in actual if entry[1] is not False}
+        if expected != actual:
+            mismatches.append(user)
+    return mismatches
+
+
+def random_profiles(rules, count=3000, seed=0):
+    """Numeric random profiles probing every threshold of `rules` (see matching.random_profile)."""
+    rng = random.Random(seed)
+    business_types = ["cafe", "food_truck", "restaurant", "bar", "bakery", "catering"]
+    food_types = ["בשר", "חלב", "פרווה", DEFAULT_FOOD_TYPE]
+    thresholds = _thresholds(rules)
+    profiles = []
+    while len(profiles) < count:
+        user = random_profile(rng, business_types, food_types, thresholds)
+        if profile_values(user) is not None:
+            profiles.append(user)
+    return profiles
+
+
+def main(argv):
+    """python backend/dedupe_rules.py [input.json] [output.json] [id_map.json]"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    input_path = argv[0] if len(argv) > 0 else os.path.join(backend_dir, "json_rules", "rules.json")
+    output_path = argv[1] if len(argv) > 1 else "rules.dedup.json"
+    map_path = argv[2] if len(argv) > 2 else "rules.dedup.map.json"
+
+    with open(input_path, encoding="utf-8") as f:
+        data = json.load(f)
+    rules = data["rules"] if isinstance(data, dict) else data
+
+    new_rules, id_map, stats = dedupe_rules(rules)
+    mismatches = verify_dedupe(rules, new_rules, id_map, random_profiles(rules))
+    print(f"{stats['rules_before']} -> {stats['rules_after']} rules "
+          f"({stats['exact_duplicates']} exact, {stats['near_duplicates']} near duplicates, "
+          f"{stats['merged_groups']} merged groups); {len(mismatches)} matching mismatches")
+    if mismatches:
+        for user in mismatches[:5]:
+            print(f"   - {user}")
+        return 1
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump({"rules": new_rules}, f, ensure_ascii=False, indent=2)
+    with open(map_path, "w", encoding="utf-8") as f:
+        json.dump(id_map, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {output_path} and {map_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
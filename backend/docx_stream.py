@@ -0,0 +1,135 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_P, _TBL, _TR, _TC, _R = W + "p", W + "tbl", W + "tr", W + "tc", W + "r"
+_HYPERLINK, _BODY = W + "hyperlink", W + "body"
+
+# Depths in word/document.xml: w:document=1, w:body=2, body blocks=3, top-level table rows=4
+_BLOCK_DEPTH = 3
+_ROW_DEPTH = 4
+
+
+def _run_text(run):
+    """Text of a w:r, with the same translations as python-docx (tabs, breaks, hyphens)."""
+    parts = []
+    for e in run:
+        if e.tag == W + "t":
+            parts.append(e.text or "")
+        elif e.tag in (W + "tab", W + "ptab"):
+            parts.append("\t")
+        elif e.tag == W + "br":
+            parts.append("\n" if e.get(W + "type", "textWrapping") == "textWrapping" else "")
+        elif e.tag == W + "cr":
+            parts.append("\n")
+        elif e.tag == W + "noBreakHyphen":
+            parts.append("-")
+    return "".join(parts)
+
+
+def paragraph_text(p):
+    parts = []
+    for child in p:
+        if child.tag == _R:
+            parts.append(_run_text(child))
+        elif child.tag == _HYPERLINK:
+            parts.extend(_run_text(r) for r in child if r.tag == _R)
+    return "".join(parts)
+
+
+def _cell_props(tc):
+    """(grid span, vMerge value or None) of a w:tc."""
+    span, merge = 1, None
+    props = tc.find(W + "tcPr")
+    if props is not None:
+        grid_span = props.find(W + "gridSpan")
+        if grid_span is not None:
+            span = int(grid_span.get(W + "val", "1"))
+        v_merge = props.find(W + "vMerge")
+        if v_merge is not None:
+            merge = v_merge.get(W + "val", "continue")
+    return span, merge
+
+
+def _grid_before(tr):
+    props = tr.find(W + "trPr")
+    grid_before = props.find(W + "gridBefore") if props is not None else None
+    return int(grid_before.get(W + "val", "0")) if grid_before is not None else 0
+
+
+def row_cells(tr, above):
+    """
+    Cell texts of a w:tr laid out like python-docx's `_Row.cells`: a cell
+    spanning N grid columns appears N times and a vertically merged
+    continuation repeats the cell it continues. `above` maps the previous
+    row's grid offsets to (text, span); returns (texts, mapping for this row).
+    """
+    texts = []
+    current = {}
+    offset = _grid_before(tr)
+    for tc in tr:
+        if tc.tag != _TC:
+            continue
+        span, merge = _cell_props(tc)
+        if merge == "continue" and offset in above:
+            text, shown_span = above[offset]
+        else:
+            text = "\n".join(paragraph_text(p) for p in tc if p.tag == _P)
+            shown_span = span
+        texts.extend([text] * shown_span)
+        current[offset] = (text, shown_span)
+        offset += span
+    return texts, current
+
+
+def iter_docx_blocks(path):
+    """
+    Streams the body of a DOCX in document order without building the whole
+    tree: yields ("paragraph", text) for top-level paragraphs and ("row",
+    [cell texts]) for each row of top-level tables. Parsed elements are
+    dropped as soon as they are yielded, so memory stays flat.
+    """
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        depth = 0
+        body = None
+        table = None
+        above = {}
+        for event, elem in ET.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if elem.tag == _BODY:
+                    body = elem
+                elif depth == _BLOCK_DEPTH and elem.tag == _TBL:
+                    table, above = elem, {}
+                continue
+
+            if depth == _ROW_DEPTH and table is not None and elem.tag == _TR:
+                texts, above = row_cells(elem, above)
+                yield "row", texts
+                table.remove(elem)
+            elif depth == _BLOCK_DEPTH and body is not None:
+                if elem.tag == _P:
+                    yield "paragraph", paragraph_text(elem)
+                elif elem.tag == _TBL:
+                    table = None
+                body.remove(elem)
+            depth -= 1
+
+
+def iter_docx_lines(path):
+    """
+    Yields the text lines of a DOCX, same as joining python-docx paragraphs
+    and " | "-joined table rows and splitting on newlines. Empty paragraphs
+    and rows are skipped.
+    """
+    for kind, content in iter_docx_blocks(path):
+        if kind == "paragraph":
+            text = content.strip()
+            if not text:
+                continue
+        else:
+            cell_texts = [cell.strip() for cell in content]
+            if not any(cell_texts):
+                continue
+            text = " | ".join(cell_texts)
+        yield from text.split("\n")
@@ -0,0 +1,147 @@
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from backend.prompt_compact import count_tokens
+
+# Max tokens / inputs per embeddings request (API limits: 300k tokens, 2048 inputs)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "40000"))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "512"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))
+# Tokens-per-minute budget of the embedding model for this key
+EMBED_TPM = int(os.getenv("EMBED_TPM", "1000000"))
+# Extra passes over batches that still failed after the client's own retries
+EMBED_RETRY_ROUNDS = int(os.getenv("EMBED_RETRY_ROUNDS", "2"))
+# Embedded items are written to the store in chunks of this size
+EMBED_WRITE_BATCH = int(os.getenv("EMBED_WRITE_BATCH", "500"))
+
+
+class TokenRateLimiter:
+    """Token bucket refilled at `tokens_per_minute`; acquire() blocks until the tokens are available."""
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.capacity)  # an oversized request waits for a full bucket
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def iter_batches(items, max_tokens=EMBED_BATCH_TOKENS, max_items=EMBED_BATCH_MAX_ITEMS):
+    """
+    Groups streamed items into request batches of at most `max_tokens` tokens
+    and `max_items` inputs. Yields (batch, token_count).
+    """
+    batch, batch_tokens = [], 0
+    for item in items:
+        tokens = count_tokens(item["chunk"])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_items):
+            yield batch, batch_tokens
+            batch, batch_tokens = [], 0
+        batch.append(item)
+        batch_tokens += tokens
+    if batch:
+        yield batch, batch_tokens
+
+
+class EmbeddingProgress:
+    def __init__(self):
+        self.items = 0
+        self.tokens = 0
+        self.requests = 0
+        self.started = time.monotonic()
+
+    def update(self, items, tokens):
+        self.items += items
+        self.tokens += tokens
+        self.requests += 1
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        print(
+            f"   Embedded {self.items} chunks ({self.tokens:,} tokens, {self.requests} requests) - "
+            f"{self.items / elapsed:.1f} chunks/s, {self.tokens / elapsed:,.0f} tokens/s",
+            flush=True
+        )
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        return (
+            f"{self.items} chunks / {self.tokens:,} tokens in {self.requests} requests, {elapsed:.1f}s "
+            f"({self.tokens / max(elapsed, 1e-6):,.0f} tokens/s)"
+        )
+
+
+def embed_items(client, model, items, write, concurrency=EMBED_CONCURRENCY, tokens_per_minute=EMBED_TPM,
+                retry_rounds=EMBED_RETRY_ROUNDS, write_batch=EMBED_WRITE_BATCH):
+    """
+    Embeds streamed {"id", "chunk"} items with concurrent, token-packed
+    requests under a tokens-per-minute limit. Items are consumed lazily (at
+    most 2 x `concurrency` requests are queued), and embedded items
+    ({"id", "chunk", "embedding"}) are passed to `write` in bulk from the
+    calling thread. Failed requests are retried for `retry_rounds` more passes.
+    Returns the items that could not be embedded.
+    """
+    limiter = TokenRateLimiter(tokens_per_minute)
+    progress = EmbeddingProgress()
+    pending = []
+    print(f" Embedding chunks (concurrency {concurrency}, {tokens_per_minute:,} TPM)", flush=True)
+
+    def embed_batch(batch, tokens):
+        limiter.acquire(tokens)
+        resp = client.embeddings.create(model=model, input=[item["chunk"] for item in batch])
+        return [dict(item, embedding=r.embedding) for item, r in zip(batch, resp.data)]
+
+    def collect(futures, done, failed):
+        nonlocal pending
+        for future in done:
+            batch, tokens = futures.pop(future)
+            try:
+                embedded = future.result()
+            except Exception as e:
+                print(f"  Embedding request failed ({len(batch)} chunks): {e}", flush=True)
+                failed.append((batch, tokens))
+                continue
+            pending.extend(embedded)
+            progress.update(len(batch), tokens)
+            if len(pending) >= write_batch:
+                write(pending)
+                pending = []
+
+    def run(batches):
+        futures = {}
+        failed = []
+        for batch, tokens in batches:
+            if len(futures) >= 2 * concurrency:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(futures, done, failed)
+            futures[executor.submit(embed_batch, batch, tokens)] = (batch, tokens)
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            collect(futures, done, failed)
+        return failed
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed") as executor:
+        failed = run(iter_batches(items))
+        for round_number in range(1, retry_rounds + 1):
+            if not failed:
+                break
+            print(f" Retrying {len(failed)} failed requests (round {round_number}/{retry_rounds})", flush=True)
+            failed = run(failed)
+
+    if pending:
+        write(pending)
+    print(f" Embedding done: {progress.summary()}", flush=True)
+    return [item for batch, _ in failed for item in batch]
@@ -0,0 +1,58 @@
+import gc
+import os
+import sys
+import shutil
+import tempfile
+
+# Gunicorn settings: gunicorn -c backend/gunicorn.conf.py backend.app:app
+#
+# The default "gevent" worker class serves each request on a greenlet, so a
+# worker blocked on a multi-second OpenAI call keeps accepting requests; one
+# process can hold hundreds of in-flight report/RAG calls (capped by
+# OPENAI_MAX_CONCURRENCY in backend/openai_pool.py). Set
+# GUNICORN_WORKER_CLASS=sync to get the classic one-request-per-worker model.
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gevent")
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "500"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Import the app once in the master and fork the workers from it: the rule
+# indexes, numpy vector index and BM25 index are built once (see warm_up in
+# backend/app.py) and shared copy-on-write, and workers boot without imports.
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+
+if worker_class == "gevent":
+    if preload_app:
+        # The app's locks and thread pools are created at import, in the master:
+        # patch before that, as the gevent worker would only patch after the fork.
+        # Nothing may import ssl (the OpenAI SDK, httpx) before this.
+        from gevent import monkey
+
+        monkey.patch_all()
+
+    # httpcore picks its async backend by importing trio when it is installed,
+    # and trio's import fails once gevent has removed select.epoll. The app only
+    # uses the sync client, so httpcore is told trio is missing.
+    sys.modules.setdefault("trio", None)
+
+# Workers write metric snapshots here, so /metrics on any worker reports all of them
+metrics_dir = os.environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "licensing-metrics"))
+
+
+def on_starting(server):
+    # Counters restart from zero with the server; drop the previous run's worker snapshots
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+def when_ready(server):
+    if not server.cfg.preload_app:
+        return
+    from backend.app import warm_up
+
+    warm_up()
+    # Keep the garbage collector from touching (and so copying) the shared objects in every worker
+    gc.freeze()
@@ -0,0 +1,147 @@
+import re
+import math
+import unicodedata
+from collections import Counter
+
+# Single-letter Hebrew prefixes: ו ה ב ל מ ש כ ("ובהתאם" -> "התאם")
+HEBREW_PREFIXES = "והבלמשכ"
+MAX_PREFIX_LETTERS = 3
+MIN_STEM_CHARS = 2
+
+SECTION_ID_RE = re.compile(r"\d+(?:\.\d+)+")
+# Acronym quotes inside words: ת"י, מ"ר, ק'
+_ACRONYM_RE = re.compile(r"(?<=\w)[\"'׳״](?=\w)")
+_TOKEN_RE = re.compile(r"\d+(?:\.\d+)+|[^\W_]+")
+_HEBREW_RE = re.compile(r"^[א-ת]+$")
+
+
+def normalize_text(text):
+    """NFKC, lowercase, without niqqud/cantillation marks and acronym quotes."""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    text = "".join(ch for ch in text if unicodedata.category(ch) != "Mn")
+    return _ACRONYM_RE.sub("", text)
+
+
+def strip_prefixes(token):
+    """Removes up to MAX_PREFIX_LETTERS leading Hebrew prefix letters, keeping MIN_STEM_CHARS."""
+    if not _HEBREW_RE.match(token):
+        return token
+    stripped = 0
+    while (stripped < MAX_PREFIX_LETTERS and token[0] in HEBREW_PREFIXES
+           and len(token) - 1 >= MIN_STEM_CHARS):
+        token = token[1:]
+        stripped += 1
+    return token
+
+
+def tokenize(text):
+    """
+    Index terms of a text. Each Hebrew word yields its surface form and, when
+    different, its prefix-stripped form, so "בעסק" matches "העסק" while exact
+    forms still score higher. Section numbers ("6.7.4") are kept whole.
+    """
+    terms = []
+    for token in _TOKEN_RE.findall(normalize_text(text)):
+        terms.append(token)
+        stem = strip_prefixes(token)
+        if stem != token:
+            terms.append(stem)
+    return terms
+
+
+def section_of(chunk_id):
+    """Section ID of a chunk ID ("6.7.4_part2" -> "6.7.4", repeated "6.7.4~2" -> "6.7.4")."""
+    return str(chunk_id).split("_part")[0].split("~")[0]
+
+
+def _natural_key(chunk_id):
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", str(chunk_id))]
+
+
+class BM25Index:
+    """
+    In-memory BM25 (Okapi) inverted index over {"id", "chunk"[, "metadata"]} items, plus a
+    section-ID table for direct "סעיף 6.7.4" lookups.
+    """
+
+    def __init__(self, items, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids = [item["id"] for item in items]
+        self.docs = [item["chunk"] for item in items]
+        self.postings = {}
+        self.doc_lengths = []
+        self.sections = {}
+
+        for position, item in enumerate(items):
+            terms = tokenize(item["chunk"])
+            self.doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings.setdefault(term, []).append((position, tf))
+            # Merged chunks list every section they contain in metadata
+            sections = (item.get("metadata") or {}).get("sections")
+            for section_id in (sections.split(",") if sections else [section_of(item["id"])]):
+                self.sections.setdefault(section_id, []).append(position)
+
+        for positions in self.sections.values():
+            positions.sort(key=lambda p: _natural_key(self.ids[p]))
+
+        n = len(self.ids)
+        self.avg_length = (sum(self.doc_lengths) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _result(self, position, score):
+        return {"id": self.ids[position], "chunk": self.docs[position], "score": score}
+
+    def search(self, query, top_k=5, ids=None):
+        """Returns [{"id", "chunk", "score"}] ranked by BM25 score; `ids` restricts the search to those chunks."""
+        scores = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for position, tf in postings:
+                if ids is not None and self.ids[position] not in ids:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[position] / (self.avg_length or 1.0))
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:top_k]
+        return [self._result(position, score) for position, score in ranked]
+
+    def lookup_sections(self, query, top_k=5):
+        """
+        Chunks of section numbers mentioned in the query: the section's own
+        chunks in order, or its sub-sections when it has no chunk of its own.
+        """
+        positions = []
+        for section_id in SECTION_ID_RE.findall(query):
+            section_id = section_id.rstrip(".")
+            found = self.sections.get(section_id)
+            if not found:
+                prefix = section_id + "."
+                found = sorted(
+                    (p for s, ps in self.sections.items() if s.startswith(prefix) for p in ps),
+                    key=lambda p: _natural_key(self.ids[p])
+                )
+            positions.extend(p for p in found if p not in positions)
+        return [self._result(position, 1.0) for position in positions[:top_k]]
+
+
+def reciprocal_rank_fusion(result_lists, top_k=5, k=60):
+    """
+    Merges ranked result lists by reciprocal rank (sum of 1 / (k + rank)).
+    The fused value replaces "score"; earlier lists win ties.
+    """
+    fused = {}
+    for results in result_lists:
+        for rank, result in enumerate(results, start=1):
+            entry = fused.setdefault(result["id"], {"id": result["id"], "chunk": result["chunk"], "score": 0.0})
+            entry["score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda r: -r["score"])[:top_k]
@@ -0,0 +1,54 @@
+import os
+import sys
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+# DEBUG also logs every retrieved chunk and each request's stage timings
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s")
+
+_LISTENER = None
+
+
+def setup_logging(level=LOG_LEVEL):
+    """
+    Routes the "licensing" loggers through a queue: request threads only
+    enqueue records, and one background thread formats and writes them.
+    """
+    global _LISTENER
+    root = logging.getLogger("licensing")
+    root.setLevel(level)
+    if _LISTENER is not None:
+        return root
+
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(logging.Formatter(LOG_FORMAT))
+    records = queue.SimpleQueue()
+    root.addHandler(QueueHandler(records))
+    root.propagate = False
+    _LISTENER = QueueListener(records, stream, respect_handler_level=True)
+    _LISTENER.start()
+    atexit.register(_LISTENER.stop)  # drain what is still queued on exit
+    return root
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork (e.g. gunicorn --preload)
+    global _LISTENER
+    if _LISTENER is not None:
+        root = logging.getLogger("licensing")
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        _LISTENER = None
+        setup_logging(logging.getLevelName(root.level))
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def get_logger(name):
+    """Logger under the "licensing" namespace, e.g. get_logger("app")."""
+    setup_logging()
+    return logging.getLogger(f"licensing.{name}")
@@ -0,0 +1,357 @@
+import math
+from bisect import bisect_left, bisect_right
+
+DEFAULT_FOOD_TYPE = "כל סוגי המזון"
+BOOLEAN_FIELDS = ["has_gas", "serves_meat", "has_delivery", "has_alcohol"]
+SET_FIELDS = ["business_type", "food_type"] + BOOLEAN_FIELDS
+
+
+def rule_matches(rule, user):
+    cond = rule.get("applies_when", {})
+
+    # Business Type
+    if cond.get("business_type"):
+        if user.get("business_type") not in cond["business_type"]:
+            return False
+
+    # Food Type
+    if cond.get("food_type"):
+        if user.get("food_type", DEFAULT_FOOD_TYPE) not in cond["food_type"]:
+            return False
+
+    # Area
+    area = user.get("area_sqm")
+    if cond.get("min_area") and area is not None and area < cond["min_area"]:
+        return False
+    if cond.get("max_area") and area is not None and area > cond["max_area"]:
+        return False
+
+    # Seating
+    seats = user.get("seating_capacity")
+    if cond.get("seating_capacity") and seats is not None:
+        try:
+            if isinstance(cond["seating_capacity"], int) and seats > cond["seating_capacity"]:
+                return False
+            if isinstance(cond["seating_capacity"], str) and "עד" in cond["seating_capacity"]:
+                limit = int(cond["seating_capacity"].replace("עד", "").strip())
+                if seats > limit:
+                    return False
+        except Exception:
+            pass
+
+    # Boolean fields
+    for field in BOOLEAN_FIELDS:
+        if field in cond:
+            if user.get(field) not in cond[field]:
+                return False
+
+    return True
+
+
+class IrregularRule(Exception):
+    """Raised while compiling a rule whose conditions the index can't represent."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not (isinstance(value, float) and math.isnan(value))
+
+
+def _is_hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+def _value_set(values):
+    """Turns a condition list into a set, keeping Python `in` semantics."""
+    if not isinstance(values, (list, tuple, set, frozenset)):
+        raise IrregularRule(f"not a list: {values!r}")
+    if not all(_is_hashable(v) for v in values):
+        raise IrregularRule(f"unhashable value in {values!r}")
+    return set(values)
+
+
+def seating_limit(value):
+    """
+    Parses a seating_capacity condition the same way rule_matches does.
+    Returns the maximum number of seats, or None when there is no limit.
+    """
+    if not value:
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and "עד" in value:
+        try:
+            return int(value.replace("עד", "").strip())
+        except Exception:
+            return None
+    return None
+
+
+def compile_conditions(rule):
+    """
+    Precompiles a rule's applies_when into
+    {"sets": {field: set | None}, "min_area", "max_area", "seating"}.
+    A None set means the field is unconstrained.
+    """
+    if not isinstance(rule, dict):
+        raise IrregularRule("rule is not a dict")
+    cond = rule.get("applies_when", {})
+    if not isinstance(cond, dict):
+        raise IrregularRule("applies_when is not a dict")
+
+    sets = {}
+    for field in ["business_type", "food_type"]:
+        sets[field] = _value_set(cond[field]) if cond.get(field) else None
+    for field in BOOLEAN_FIELDS:
+        sets[field] = _value_set(cond[field]) if field in cond else None
+
+    bounds = {}
+    for field in ["min_area", "max_area"]:
+        value = cond.get(field)
+        if value and not _is_number(value):
+            raise IrregularRule(f"{field} is not a number: {value!r}")
+        bounds[field] = value if value else None
+
+    return {
+        "sets": sets,
+        "min_area": bounds["min_area"],
+        "max_area": bounds["max_area"],
+        "seating": seating_limit(cond.get("seating_capacity")),
+    }
+
+
+def profile_values(user):
+    """Extracts the matched-on values of a profile, or None if the index can't handle them."""
+    values = {
+        "business_type": user.get("business_type"),
+        "food_type": user.get("food_type", DEFAULT_FOOD_TYPE),
+    }
+    for field in BOOLEAN_FIELDS:
+        values[field] = user.get(field)
+    if not _is_hashable(tuple(values.values())):
+        return None
+    area = user.get("area_sqm")
+    seats = user.get("seating_capacity")
+    if (area is not None and not _is_number(area)) or (seats is not None and not _is_number(seats)):
+        return None
+    values["area"] = area
+    values["seats"] = seats
+    return values
+
+
+def iter_bits(mask):
+    """Yields the positions of the set bits of `mask`, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class _ThresholdIndex:
+    """
+    Sorted distinct thresholds with cumulative rule bitmaps, so "rules whose
+    threshold is below/above x" is one bisect plus one lookup.
+    """
+
+    def __init__(self, entries):
+        by_value = {}
+        for value, pos in entries:
+            by_value[value] = by_value.get(value, 0) | (1 << pos)
+        self.values = sorted(by_value)
+        masks = [by_value[v] for v in self.values]
+
+        self.prefix = [0]  # prefix[k] = rules with one of the k smallest thresholds
+        for m in masks:
+            self.prefix.append(self.prefix[-1] | m)
+        self.suffix = [0] * (len(masks) + 1)  # suffix[k] = rules with threshold index >= k
+        for k in range(len(masks) - 1, -1, -1):
+            self.suffix[k] = self.suffix[k + 1] | masks[k]
+
+    def below(self, x):
+        """Rules whose threshold is < x."""
+        return self.prefix[bisect_left(self.values, x)]
+
+    def above(self, x):
+        """Rules whose threshold is > x."""
+        return self.suffix[bisect_right(self.values, x)]
+
+
+class RuleIndex:
+    """
+    Precompiled rule matcher. Every rule is a bit position; each field keeps an
+    inverted index value -> bitmap plus a bitmap of rules that don't constrain
+    it, and area/seating limits live in sorted threshold indexes. A profile is
+    resolved by intersecting one bitmap per field.
+
+    Rules whose conditions can't be indexed (unexpected types) are evaluated
+    with rule_matches, so results are always identical to the linear scan.
+    """
+
+    def __init__(self, rules, version=None):
+        self.rules = tuple(rules)
+        self.version = version
+        self.ids = tuple(r.get("id") if isinstance(r, dict) else None for r in self.rules)
+        self.compiled = [None] * len(self.rules)
+
+        self._wild = {field: 0 for field in SET_FIELDS}
+        self._index = {field: {} for field in SET_FIELDS}
+        self._fallback = []
+        self._all = 0
+        min_area, max_area, seating = [], [], []
+
+        for pos, rule in enumerate(self.rules):
+            try:
+                compiled = compile_conditions(rule)
+            except IrregularRule:
+                self._fallback.append(pos)
+                continue
+            self.compiled[pos] = compiled
+            bit = 1 << pos
+            self._all |= bit
+            for field, values in compiled["sets"].items():
+                if values is None:
+                    self._wild[field] |= bit
+                else:
+                    index = self._index[field]
+                    for v in values:
+                        index[v] = index.get(v, 0) | bit
+            if compiled["min_area"] is not None:
+                min_area.append((compiled["min_area"], pos))
+            if compiled["max_area"] is not None:
+                max_area.append((compiled["max_area"], pos))
+            if compiled["seating"] is not None:
+                seating.append((compiled["seating"], pos))
+
+        self._min_area = _ThresholdIndex(min_area)
+        self._max_area = _ThresholdIndex(max_area)
+        self._seating = _ThresholdIndex(seating)
+
+    def __len__(self):
+        return len(self.rules)
+
+    @property
+    def fallback_positions(self):
+        """Positions of the rules evaluated with rule_matches instead of the index."""
+        return tuple(self._fallback)
+
+    @property
+    def indexed_mask(self):
+        """Bitmap of the rules handled by the index."""
+        return self._all
+
+    def field_mask(self, field, value):
+        """Bitmap of indexed rules that accept `value` for a set-valued field."""
+        return self._wild[field] | self._index[field].get(value, 0)
+
+    def match_mask(self, user):
+        """Returns the bitmap of matching rules (bit i = self.rules[i])."""
+        values = profile_values(user)
+        if values is None:
+            mask = 0
+            for pos, rule in enumerate(self.rules):
+                if rule_matches(rule, user):
+                    mask |= 1 << pos
+            return mask
+
+        mask = self._all
+        for field in SET_FIELDS:
+            mask &= self.field_mask(field, values[field])
+            if not mask:
+                break
+
+        area = values["area"]
+        if mask and area is not None:
+            mask &= ~self._min_area.above(area)
+            mask &= ~self._max_area.below(area)
+        seats = values["seats"]
+        if mask and seats is not None:
+            mask &= ~self._seating.below(seats)
+
+        for pos in self._fallback:
+            if rule_matches(self.rules[pos], user):
+                mask |= 1 << pos
+        return mask
+
+    def match_positions(self, user):
+        return list(iter_bits(self.match_mask(user)))
+
+    def match(self, user):
+        """Returns the matching rules in rule-set order, like the linear scan."""
+        return [self.rules[pos] for pos in iter_bits(self.match_mask(user))]
+
+    def match_ids(self, user):
+        return [self.ids[pos] for pos in iter_bits(self.match_mask(user))]
+
+
+# ---------------------------------------------------------------------------
+# Profile/rule generators for checking RuleIndex against the linear
+# rule_matches scan (tests/test_matching.py) and rule dedupe (dedupe_rules.py)
+# ---------------------------------------------------------------------------
+
+def random_profile(rng, business_types, food_types, thresholds):
+    """Builds a profile that probes every threshold and some invalid values."""
+    def number():
+        roll = rng.random()
+        if roll < 0.15:
+            return None
+        if roll < 0.6 and thresholds:
+            return rng.choice(thresholds) + rng.choice([-1, 0, 1])
+        return rng.randint(0, 600)
+
+    profile = {
+        "business_name": "בדיקה",
+        "business_type": rng.choice(business_types + ["לא מוגדר", None]),
+        "area_sqm": number(),
+        "seating_capacity": number(),
+        "has_gas": rng.choice([True, False, None]),
+        "serves_meat": rng.choice([True, False]),
+        "has_delivery": rng.choice([True, False]),
+        "has_alcohol": rng.choice([True, False, 0, 1]),
+    }
+    if rng.random() < 0.8:
+        profile["food_type"] = rng.choice(food_types + [DEFAULT_FOOD_TYPE, None])
+    if rng.random() < 0.02:
+        profile["area_sqm"] = "80"  # forces the linear path
+    return profile
+
+
+def random_rule(rng, pos, business_types, food_types):
+    """Builds a synthetic rule, including the odd shapes found in extracted rule files."""
+    cond = {
+        "business_type": rng.sample(business_types, rng.randint(0, len(business_types))),
+        "min_area": rng.choice([None, 0, 30, 50, 100.5, 200]),
+        "max_area": rng.choice([None, 0, 80, 150, 300]),
+        "seating_capacity": rng.choice([None, 0, 20, 200, "עד 50", "עד ", "מעל 100", 75.0, True]),
+    }
+    if rng.random() < 0.5:
+        cond["food_type"] = rng.sample(food_types, rng.randint(0, len(food_types)))
+    for field in BOOLEAN_FIELDS:
+        if rng.random() < 0.7:
+            cond[field] = rng.choice([[True, False], [True], [False], []])
+    if rng.random() < 0.03:
+        cond["business_type"] = "restaurant"  # substring semantics -> fallback
+    return {"id": f"S{pos:05d}", "applies_when": cond}
+
+
+def _outcome(fn):
+    try:
+        return fn()
+    except Exception as e:
+        return type(e)
+
+
+def _thresholds(rules):
+    values = set()
+    for r in rules:
+        cond = r.get("applies_when") or {}
+        for field in ["min_area", "max_area"]:
+            if _is_number(cond.get(field)):
+                values.add(cond[field])
+        limit = seating_limit(cond.get("seating_capacity"))
+        if limit is not None:
+            values.add(limit)
+    return sorted(values)
+
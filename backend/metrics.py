@@ -0,0 +1,323 @@
+import os
+import glob
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# When set, every process writes its metrics here and /metrics merges them,
+# so a scrape of any gunicorn worker reports all workers
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000)
+
+_METRICS = {}
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), collect=None):
+        if name in _METRICS:
+            raise ValueError(f"Duplicate metric: {name}")
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        # collect() -> {label values tuple: value}, read at scrape time instead of stored values
+        self.collect = collect
+        self._values = {}
+        self._lock = threading.Lock()
+        _METRICS[name] = self
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        if self.collect is not None:
+            return {tuple(str(v) for v in k): v for k, v in self.collect().items()}
+        with self._lock:
+            return {k: (list(v) if isinstance(v, list) else v) for k, v in self._values.items()}
+
+    def reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # [per-bucket counts (last = +Inf), sum, count]
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+
+REQUEST_SECONDS = Histogram("licensing_request_seconds", "HTTP request latency", ["endpoint", "status"])
+REQUESTS_IN_FLIGHT = Gauge("licensing_requests_in_flight", "HTTP requests being served", ["endpoint"])
+STAGE_SECONDS = Histogram("licensing_stage_seconds", "Latency of each request stage", ["stage"])
+OPENAI_CALLS = Counter("licensing_openai_calls_total", "OpenAI API calls", ["stage", "outcome"])
+OPENAI_IN_FLIGHT = Gauge("licensing_openai_in_flight", "OpenAI API calls in flight")
+OPENAI_RETRIES = Counter("licensing_openai_retries_total", "OpenAI API call retries")
+OPENAI_TOKENS = Counter("licensing_openai_tokens_total", "OpenAI tokens used", ["model", "type"])
+REQUEST_TOKENS = Histogram("licensing_request_openai_tokens", "OpenAI tokens used per HTTP request",
+                           ["endpoint"], buckets=TOKEN_BUCKETS)
+
+
+class RequestTrace:
+    """Stage timings and token usage of one HTTP request, shared with the threads it fans out to."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.tokens = 0
+        self.status = None
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def add_tokens(self, tokens):
+        with self._lock:
+            self.tokens += tokens
+
+    def finish(self, status):
+        if self.seconds is not None:
+            return self
+        self.status = status
+        self.seconds = time.perf_counter() - self.started
+        REQUESTS_IN_FLIGHT.dec(endpoint=self.endpoint)
+        REQUEST_SECONDS.observe(self.seconds, endpoint=self.endpoint, status=status)
+        if self.tokens:
+            REQUEST_TOKENS.observe(self.tokens, endpoint=self.endpoint)
+        return self
+
+    def summary(self):
+        stages = " ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in self.stages.items())
+        return f"{self.endpoint} {self.status} {self.seconds * 1000:.1f}ms tokens={self.tokens} {stages}".rstrip()
+
+
+_TRACE = contextvars.ContextVar("licensing_request_trace", default=None)
+
+
+def start_request(endpoint):
+    """Starts tracing the current request; stages and tokens recorded in this context add up in it."""
+    REQUESTS_IN_FLIGHT.inc(endpoint=endpoint)
+    trace = RequestTrace(endpoint)
+    _TRACE.set(trace)
+    return trace
+
+
+def submit_traced(executor, fn, *args, **kwargs):
+    """executor.submit that keeps recording into the submitting request's trace."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+@contextmanager
+def span(stage):
+    """Times a block (or, as a decorator, a function) into licensing_stage_seconds and the request trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add_stage(stage, seconds)
+
+
+def record_usage(model, usage):
+    """Counts the tokens of an OpenAI response's usage (chat or embeddings)."""
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    OPENAI_TOKENS.inc(prompt, model=model, type="prompt")
+    if completion:
+        OPENAI_TOKENS.inc(completion, model=model, type="completion")
+    trace = _TRACE.get()
+    if trace is not None:
+        trace.add_tokens(prompt + completion)
+
+
+# 📤 Prometheus text format
+
+def snapshot():
+    return {
+        name: {
+            "kind": metric.kind,
+            "help": metric.help,
+            "labelnames": list(metric.labelnames),
+            "buckets": list(getattr(metric, "buckets", [])),
+            "samples": [[list(k), v] for k, v in metric.samples().items()],
+        }
+        for name, metric in _METRICS.items()
+    }
+
+
+def _add(total, value):
+    if total is None:
+        return value
+    if isinstance(value, list):
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1], total[2] + value[2]]
+    return total + value
+
+
+def merge(snapshots):
+    """Sums snapshots of several processes; gauges count only the live ones (snapshots are (alive, snap))."""
+    merged = {}
+    for alive, snap in snapshots:
+        for name, metric in snap.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                target["samples"][key] = _add(target["samples"].get(key), value)
+    return merged
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in list(zip(names, values)) + list(extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for labels, value in sorted(metric["samples"].items()):
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_labels(names, labels)} {_number(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, n in zip(metric["buckets"] + ["+Inf"], counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(names, labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(names, labels)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# 🗂️ Multi-process aggregation (METRICS_DIR)
+
+_WRITER_PID = None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def write_snapshot(metrics_dir=METRICS_DIR):
+    os.makedirs(metrics_dir, exist_ok=True)
+    path = os.path.join(metrics_dir, f"{os.getpid()}.json")
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(snapshot(), f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _writer_loop(metrics_dir, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot(metrics_dir)
+        except OSError:
+            pass
+
+
+def ensure_writer():
+    """Starts this process's snapshot writer (once per process, so it also runs after a fork)."""
+    global _WRITER_PID
+    if not METRICS_DIR or _WRITER_PID == os.getpid():
+        return
+    _WRITER_PID = os.getpid()
+    threading.Thread(target=_writer_loop, args=(METRICS_DIR, METRICS_FLUSH_INTERVAL),
+                     name="metrics-writer", daemon=True).start()
+
+
+def render_metrics():
+    """The /metrics payload: this process alone, or every process that wrote to METRICS_DIR."""
+    if not METRICS_DIR:
+        return render(merge([(True, snapshot())]))
+    write_snapshot()
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        pid = int(os.path.basename(path).split(".")[0])
+        try:
+            with open(path, encoding="utf-8") as f:
+                snapshots.append((_pid_alive(pid), json.load(f)))
+        except (OSError, ValueError):
+            continue  # being replaced right now; next scrape has it
+    return render(merge(snapshots))
+
+
+def _reset_after_fork():
+    # A forked worker starts from zero; what the parent counted is the parent's
+    for metric in _METRICS.values():
+        metric.reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
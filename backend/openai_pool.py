@@ -0,0 +1,192 @@
+import os
+import time
+import random
+import threading
+
+from backend import metrics
+from backend.log import get_logger
+
+logger = get_logger("openai")
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONNECT_TIMEOUT = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "200"))
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "100"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+
+
+def is_retryable(error):
+    """429s, 5xx responses, timeouts and connection errors are worth retrying."""
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait (Retry-After header), if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Endpoint:
+    def __init__(self, pool, path, stage):
+        self._pool = pool
+        self._path = path
+        self._stage = stage
+
+    def create(self, **kwargs):
+        create = self._pool.raw
+        for name in self._path:
+            create = getattr(create, name)
+        return self._pool.call(create.create, kwargs, self._stage)
+
+
+class _Chat:
+    def __init__(self, completions):
+        self.completions = completions
+
+
+class PooledOpenAI:
+    """
+    Drop-in wrapper exposing client.chat.completions.create and
+    client.embeddings.create over one shared, connection-pooled OpenAI client.
+    Calls are capped at `max_concurrency` in flight per process and retried
+    with full-jitter exponential backoff on 429/5xx/connection errors.
+    Works unchanged under gevent workers (the semaphore is monkey-patched).
+
+    `factory` builds the underlying client on first use, so importing the app
+    does not import the openai SDK, and a process forked after import (gunicorn
+    --preload) opens its own connections.
+    """
+
+    def __init__(self, factory, max_concurrency=OPENAI_MAX_CONCURRENCY, max_retries=OPENAI_MAX_RETRIES,
+                 backoff_base=OPENAI_BACKOFF_BASE, backoff_max=OPENAI_BACKOFF_MAX):
+        self._factory = factory
+        self._raw = None
+        self._raw_pid = None
+        self._build_lock = threading.Lock()
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.retries = 0
+
+        self.chat = _Chat(_Endpoint(self, ("chat", "completions"), "chat_completion"))
+        self.embeddings = _Endpoint(self, ("embeddings",), "embedding")
+
+    @property
+    def raw(self):
+        """The underlying OpenAI client, built on first use in each process."""
+        if self._raw is None or self._raw_pid != os.getpid():
+            with self._build_lock:
+                if self._raw is None or self._raw_pid != os.getpid():
+                    self._raw = self._factory()
+                    self._raw_pid = os.getpid()
+        return self._raw
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            delay = max(delay, min(server_delay, self.backoff_max))
+        return delay
+
+    def _with_retry(self, create, kwargs):
+        attempt = 0
+        while True:
+            try:
+                return create(**kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning("OpenAI call failed (%s), retry %d/%d in %.2fs",
+                               type(e).__name__, attempt + 1, self.max_retries, delay)
+                with self._lock:
+                    self.retries += 1
+                metrics.OPENAI_RETRIES.inc()
+                time.sleep(delay)
+                attempt += 1
+
+    def _acquire(self):
+        self._slots.acquire()
+        with self._lock:
+            self.in_flight += 1
+        metrics.OPENAI_IN_FLIGHT.inc()
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+        metrics.OPENAI_IN_FLIGHT.dec()
+        self._slots.release()
+
+    def _release_after(self, stream, stage, model, started):
+        """Keeps the concurrency slot (and the stage timer) until a streamed response is fully consumed."""
+        outcome = "error"
+        try:
+            for chunk in stream:
+                # Only sent with stream_options={"include_usage": True}, on the last chunk
+                metrics.record_usage(model, getattr(chunk, "usage", None))
+                yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"  # the client went away mid-stream
+            raise
+        finally:
+            try:
+                # Hands the HTTP connection back to the pool now rather than when the stream is collected
+                stream.close()
+            finally:
+                self._release()
+                metrics.record_stage(stage, time.perf_counter() - started)
+                metrics.OPENAI_CALLS.inc(stage=stage, outcome=outcome)
+
+    def call(self, create, kwargs, stage):
+        self._acquire()
+        started = time.perf_counter()
+        try:
+            result = self._with_retry(create, kwargs)
+        except BaseException:
+            self._release()
+            metrics.record_stage(stage, time.perf_counter() - started)
+            metrics.OPENAI_CALLS.inc(stage=stage, outcome="error")
+            raise
+        if kwargs.get("stream"):
+            return self._release_after(result, stage, kwargs.get("model"), started)
+        self._release()
+        metrics.record_stage(stage, time.perf_counter() - started)
+        metrics.OPENAI_CALLS.inc(stage=stage, outcome="ok")
+        metrics.record_usage(kwargs.get("model"), getattr(result, "usage", None))
+        return result
+
+
+def _build_client(api_key):
+    import httpx
+    from openai import OpenAI, DefaultHttpxClient, Timeout
+
+    http_client = DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+        ),
+        # openai's own Timeout: it matches the HTTP stack DefaultHttpxClient is built on
+        timeout=Timeout(OPENAI_TIMEOUT, connect=OPENAI_CONNECT_TIMEOUT)
+    )
+    # Retries are handled by PooledOpenAI (jittered, shared concurrency budget)
+    return OpenAI(api_key=api_key, http_client=http_client, max_retries=0)
+
+
+def create_openai_client(api_key):
+    """Builds the process-wide pooled client (keep-alive connections shared by all requests)."""
+    return PooledOpenAI(lambda: _build_client(api_key))
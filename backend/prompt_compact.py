@@ -0,0 +1,110 @@
+import os
+import re
+import json
+
+# Max tokens for the rules block of a report prompt (0 = no limit)
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "12000"))
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # not installed, or the encoding could not be fetched: fall back to an estimate
+    _ENCODING = None
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+PRIORITY_ORDER = ["קריטי", "גבוה", "בינוני", "נמוך"]
+
+
+def priority_rank(priority):
+    """0 for the most important priority; unknown priorities sort last."""
+    return PRIORITY_ORDER.index(priority) if priority in PRIORITY_ORDER else len(PRIORITY_ORDER)
+
+
+def count_tokens(text):
+    """Token count with tiktoken when installed, otherwise ~3 characters per token (Hebrew-heavy text)."""
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return (len(text) + 2) // 3
+
+
+def _clean(text):
+    return _WHITESPACE_RE.sub(" ", str(text)).strip()
+
+
+def encode_rules(rules):
+    """
+    Compact text encoding of matched rules for the model. applies_when is
+    dropped (matching already happened), identical actions are listed once
+    and referenced by number, and each rule is one line keyed by its ID.
+    """
+    action_ids = {}
+    action_lines = []
+    rule_lines = []
+    for rule in rules:
+        refs = []
+        for action in rule.get("actions") or []:
+            action = _clean(action)
+            if action not in action_ids:
+                action_ids[action] = f"A{len(action_ids) + 1}"
+                action_lines.append(f"{action_ids[action]}: {action}")
+            refs.append(action_ids[action])
+        rule_lines.append(" | ".join([
+            str(rule.get("id")),
+            _clean(rule.get("title", "")),
+            _clean(rule.get("category", "")),
+            _clean(rule.get("priority", "")),
+            _clean(rule.get("estimated_cost", "")),
+            ",".join(refs),
+        ]))
+    return (
+        "פעולות (מזהה: פעולה):\n" + "\n".join(action_lines) + "\n\n"
+        "דרישות (מזהה | כותרת | קטגוריה | עדיפות | עלות משוערת | פעולות):\n" + "\n".join(rule_lines)
+    )
+
+
+def fit_rules_to_budget(rules, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Drops the lowest-priority rules (latest first among equals) until the
+    encoded rules fit in `budget` tokens. Returns (kept rules in original order, dropped rules).
+    """
+    if not budget or count_tokens(encode_rules(rules)) <= budget:
+        return list(rules), []
+
+    drop_order = sorted(range(len(rules)), key=lambda i: (-priority_rank(rules[i].get("priority")), -i))
+
+    def kept_after(k):
+        dropped = set(drop_order[:k])
+        return [r for i, r in enumerate(rules) if i not in dropped]
+
+    # Smallest number of dropped rules that fits (token count shrinks as rules are dropped)
+    lo, hi = 1, len(rules)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if count_tokens(encode_rules(kept_after(mid))) <= budget:
+            hi = mid
+        else:
+            lo = mid + 1
+    dropped = set(drop_order[:lo])
+    return kept_after(lo), [r for i, r in enumerate(rules) if i in dropped]
+
+
+def uncompacted_tokens(matched):
+    """Tokens the rules would take as the old indent=2 JSON dump (for comparison only, not cheap)."""
+    return count_tokens(json.dumps(matched, ensure_ascii=False, indent=2))
+
+
+def compact_prompt_rules(matched, budget=PROMPT_TOKEN_BUDGET):
+    """
+    Prepares matched rules for a report prompt.
+    Returns (kept rules, stats) with the prompt's token count and the trimmed rule IDs.
+    """
+    kept, dropped = fit_rules_to_budget(matched, budget)
+    stats = {
+        "tokens_after": count_tokens(encode_rules(kept)),
+        "token_budget": budget,
+        "tokens_estimated": _ENCODING is None,
+        "rules_in_prompt": len(kept),
+        "rules_trimmed": [r.get("id") for r in dropped],
+    }
+    return kept, stats
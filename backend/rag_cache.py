@@ -0,0 +1,59 @@
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+from backend.cache import build_cache, canonical_hash
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+RAG_CACHE_DB = os.getenv("RAG_CACHE_DB", os.path.join(BACKEND_DIR, "cache_db", "rag_cache.sqlite3"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _encode_vector(vector):
+    return np.asarray(vector, dtype=np.float32).tobytes()
+
+
+def _decode_vector(raw):
+    return np.frombuffer(raw, dtype=np.float32)
+
+
+# normalized question -> embedding (float32)
+EMBEDDING_CACHE = build_cache(
+    "embedding_cache",
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+    db_path=RAG_CACHE_DB or None,
+    disk_max_entries=int(os.getenv("EMBEDDING_CACHE_DB_SIZE", "50000")),
+    encode=_encode_vector,
+    decode=_decode_vector,
+)
+
+# (question, retrieved chunk IDs, model) -> answer
+ANSWER_CACHE = build_cache(
+    "answer_cache",
+    max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+    db_path=RAG_CACHE_DB or None,
+    disk_max_entries=int(os.getenv("ANSWER_CACHE_DB_SIZE", "20000")),
+)
+
+
+def normalize_question(question):
+    """Case, whitespace, punctuation and niqqud insensitive form of a question."""
+    text = unicodedata.normalize("NFKC", question).lower()
+    text = "".join(
+        " " if unicodedata.category(ch).startswith("P") else ch
+        for ch in text
+        if unicodedata.category(ch) != "Mn"
+    )
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+
+def embedding_cache_key(question, model):
+    return canonical_hash("embedding", model, normalize_question(question))
+
+
+def answer_cache_key(question, chunk_ids, model, prompt_version):
+    return canonical_hash("answer", normalize_question(question), list(chunk_ids), model, prompt_version)
@@ -0,0 +1,55 @@
+import os
+
+from backend.cache import build_cache, canonical_hash
+
+# Sent to the model instead of the business name, which writes it into the
+# report wherever the name belongs: a report is then a template for every
+# business with the same profile, and the name is never searched for in model text
+NAME_PLACEHOLDER = "{{business_name}}"
+
+REPORT_CACHE = build_cache(
+    "report_cache",
+    max_entries=int(os.getenv("REPORT_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("REPORT_CACHE_TTL", str(7 * 24 * 3600))),
+    db_path=os.getenv("REPORT_CACHE_DB") or None,
+    disk_max_entries=int(os.getenv("REPORT_CACHE_DB_SIZE", "20000")),
+)
+
+
+def report_cache_key(user, matched_ids, model, prompt_version):
+    """Cache key for a report: everything the prompt depends on except the business name."""
+    profile = {k: v for k, v in user.items() if k != "business_name"}
+    return canonical_hash(profile, list(matched_ids), model, prompt_version)
+
+
+def _replace_strings(value, old, new):
+    if isinstance(value, str):
+        return value.replace(old, new)
+    if isinstance(value, list):
+        return [_replace_strings(v, old, new) for v in value]
+    if isinstance(value, dict):
+        return {k: _replace_strings(v, old, new) for k, v in value.items()}
+    return value
+
+
+def template_user(user):
+    """The profile as the report prompts see it: business name replaced by NAME_PLACEHOLDER."""
+    return dict(user, business_name=NAME_PLACEHOLDER)
+
+
+def fill_business_name(template, business_name):
+    """Fills the business name into a report (or section) written with NAME_PLACEHOLDER."""
+    return _replace_strings(template, NAME_PLACEHOLDER, (business_name or "").strip())
+
+
+def get_cached_report(key, business_name):
+    """Returns the cached AI part of a report with `business_name` filled in, or None."""
+    template = REPORT_CACHE.get(key)
+    if template is None:
+        return None
+    return fill_business_name(template, business_name)
+
+
+def store_report(key, template):
+    """Caches the AI part of a report, as the model wrote it (with NAME_PLACEHOLDER)."""
+    REPORT_CACHE.set(key, template)
@@ -0,0 +1,131 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from backend import metrics
+from backend.prompt_compact import encode_rules, priority_rank
+from backend.openai_pool import OPENAI_MAX_CONCURRENCY
+from backend.report_cache import NAME_PLACEHOLDER
+
+# Shared by every report in the process: sized like the OpenAI concurrency cap, so
+# that cap (not this pool) is what limits concurrent reports. Threads start on demand.
+REPORT_FANOUT_WORKERS = int(os.getenv("REPORT_FANOUT_WORKERS", str(OPENAI_MAX_CONCURRENCY)))
+# Max rules per requirements sub-request (large categories are split)
+REPORT_FANOUT_BATCH = int(os.getenv("REPORT_FANOUT_BATCH", "20"))
+
+SUMMARY_SECTIONS = ["executive_summary", "recommendations", "estimated_cost", "estimated_time"]
+# Same key order as the single-call report
+SECTION_ORDER = ["executive_summary", "recommendations", "requirements_by_priority", "estimated_cost", "estimated_time"]
+
+# Threads become greenlets under the gevent worker
+_EXECUTOR = ThreadPoolExecutor(max_workers=REPORT_FANOUT_WORKERS, thread_name_prefix="report-fanout")
+
+
+def split_by_category(matched, batch_size=REPORT_FANOUT_BATCH):
+    """Groups rules by category (first-seen order) and splits large groups into batches."""
+    groups = {}
+    for rule in matched:
+        groups.setdefault(rule.get("category") or "אחר", []).append(rule)
+    batches = []
+    for category, rules in groups.items():
+        for i in range(0, len(rules), batch_size):
+            batches.append((category, rules[i:i + batch_size]))
+    return batches
+
+
+def _profile_line(user):
+    return (
+        f'עסק בשם "{user["business_name"]}" (בכל מקום שבו מוזכר שם העסק, כתוב בדיוק {NAME_PLACEHOLDER} במקום השם). '
+        f'סוג העסק: {user["business_type"]}, שטח: {user["area_sqm"] or "לא צויין"} מ"ר, '
+        f'מקומות ישיבה: {user["seating_capacity"] or "לא צויין"}.'
+    )
+
+
+def build_requirements_prompt(user, category, rules):
+    return f"""
+    {_profile_line(user)}
+
+    דרישות רגולטוריות בקטגוריה "{category}":
+    {encode_rules(rules)}
+
+    החזר את התשובה אך ורק כ־JSON תקין עם המבנה הבא, עם פריט אחד לכל דרישה:
+    {{
+    "requirements_by_priority": [
+        {{ "category": "{category}", "title": "...", "priority": "...", "actions": ["..."], "estimated_cost": "...", "estimated_time": "..." }}
+    ]
+    }}
+    """
+
+
+def build_summary_prompt(user, matched):
+    rule_lines = "\n".join(
+        f'- [{r.get("id")}] {r.get("title")} ({r.get("category")}, {r.get("priority")}, {r.get("estimated_cost")})'
+        for r in matched
+    )
+    return f"""
+    צור תקציר לדוח רישוי ל{_profile_line(user)}
+
+    רשימת הדרישות הרגולטוריות שנמצאו:
+    {rule_lines}
+
+    החזר את התשובה אך ורק כ־JSON תקין עם המבנה הבא:
+    {{
+    "executive_summary": "תקציר מנהלים...",
+    "recommendations": {{
+        "before_opening": ["שלב 1: ...", "שלב 2: ..."],
+        "during_setup": ["שלב 3: ..."],
+        "after_opening": ["שלב 4: ..."]
+    }},
+    "estimated_cost": "...",
+    "estimated_time": "..."
+    }}
+    """
+
+
+def _complete_json(client, model, prompt):
+    response = client.chat.completions.create(
+        model=model,
+        messages=[{"role": "user", "content": prompt}],
+        response_format={"type": "json_object"}
+    )
+    with metrics.span("json_parse"):
+        return json.loads(response.choices[0].message.content)
+
+
+def iter_fanout_sections(client, model, user, matched):
+    """
+    Generates the report as one summary call plus one call per category batch,
+    all in parallel. Yields summary sections as soon as the summary call
+    returns, and "requirements_by_priority" (merged, sorted by priority) once
+    every batch is done.
+    """
+    summary_future = metrics.submit_traced(_EXECUTOR, _complete_json, client, model,
+                                           build_summary_prompt(user, matched))
+    batch_futures = [
+        metrics.submit_traced(_EXECUTOR, _complete_json, client, model,
+                              build_requirements_prompt(user, category, rules))
+        for category, rules in split_by_category(matched)
+    ]
+
+    requirements = []
+    try:
+        for future in as_completed([summary_future] + batch_futures):
+            result = future.result()
+            if future is summary_future:
+                for name in SUMMARY_SECTIONS:
+                    if name in result:
+                        yield name, result[name]
+            else:
+                requirements.extend(result.get("requirements_by_priority", []))
+    finally:
+        for future in batch_futures + [summary_future]:
+            future.cancel()
+
+    requirements.sort(key=lambda item: priority_rank(item.get("priority")))
+    yield "requirements_by_priority", requirements
+
+
+def generate_fanout_report(client, model, user, matched):
+    """Non-streaming fan-out report, with keys in the same order as the single-call report."""
+    sections = dict(iter_fanout_sections(client, model, user, matched))
+    return {name: sections[name] for name in SECTION_ORDER if name in sections}
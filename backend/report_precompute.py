@@ -0,0 +1,405 @@
+import os
+import sys
+import json
+import math
+import time
+import random
+import threading
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.matching import BOOLEAN_FIELDS, DEFAULT_FOOD_TYPE, RuleIndex, compile_conditions
+from backend.report_cache import NAME_PLACEHOLDER, fill_business_name, report_cache_key
+from backend.log import get_logger
+
+logger = get_logger("precomputed")
+
+# Output of the precompute job, read by /api/generate-report
+PRECOMPUTED_REPORTS_PATH = os.getenv(
+    "PRECOMPUTED_REPORTS_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "precomputed_reports.json")
+)
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "4"))
+
+# Class value for a business/food type that no rule lists: all such values match alike
+OTHER = "*"
+
+
+def _boundaries(limits, lower):
+    """
+    First whole number on the far side of each threshold: a value x fails a
+    min_area m when x < m (boundary ceil(m)), and fails a max_area or seating
+    limit M when x > M (boundary floor(M) + 1). Boundaries <= 0 split nothing.
+    """
+    bounds = {math.ceil(limit) if lower else math.floor(limit) + 1 for limit in limits}
+    return sorted(b for b in bounds if b > 0)
+
+
+class ProfileSpace:
+    """
+    Equivalence classes of /api/generate-report profiles for one rule set:
+    two profiles in the same class match exactly the same rules. Business and
+    food types not listed by any rule collapse into OTHER, and area/seating
+    only matter between the whole-number boundaries the rules' thresholds
+    create. Profiles are the output of build_user_profile (bools, whole
+    numbers or None).
+    """
+
+    def __init__(self, business_types, food_types, area_bounds, seating_bounds):
+        self.business_types = list(business_types)
+        self.food_types = list(food_types)
+        self.area_bounds = list(area_bounds)
+        self.seating_bounds = list(seating_bounds)
+        self._business_types = set(self.business_types)
+        self._food_types = set(self.food_types)
+
+    @classmethod
+    def from_rules(cls, rules):
+        """Raises matching.IrregularRule if a rule's conditions can't be reasoned about."""
+        business_types, food_types = [], []
+        min_areas, max_areas, seating = [], [], []
+        for rule in rules:
+            compiled = compile_conditions(rule)
+            for value in sorted(compiled["sets"]["business_type"] or [], key=str):
+                if value not in business_types:
+                    business_types.append(value)
+            for value in sorted(compiled["sets"]["food_type"] or [], key=str):
+                if value not in food_types:
+                    food_types.append(value)
+            if compiled["min_area"] is not None:
+                min_areas.append(compiled["min_area"])
+            if compiled["max_area"] is not None:
+                max_areas.append(compiled["max_area"])
+            if compiled["seating"] is not None:
+                seating.append(compiled["seating"])
+        area_bounds = sorted(set(_boundaries(min_areas, lower=True) + _boundaries(max_areas, lower=False)))
+        return cls(business_types, food_types, area_bounds, _boundaries(seating, lower=False))
+
+    def to_dict(self):
+        return {
+            "business_types": self.business_types,
+            "food_types": self.food_types,
+            "area_bounds": self.area_bounds,
+            "seating_bounds": self.seating_bounds,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["business_types"], data["food_types"], data["area_bounds"], data["seating_bounds"])
+
+    def __len__(self):
+        business = len(self.business_types) + 1
+        food = len(self.food_types) + 1
+        area = len(self.area_bounds) + 2 if self.area_bounds else 1
+        seating = len(self.seating_bounds) + 2 if self.seating_bounds else 1
+        return business * food * 2 ** len(BOOLEAN_FIELDS) * area * seating
+
+    @staticmethod
+    def _range_key(value, bounds):
+        if not bounds:
+            return OTHER
+        return "-" if value is None else str(bisect_right(bounds, value))
+
+    def class_key(self, user):
+        """Class of a profile, or None for values outside the build_user_profile shape."""
+        flags = [user.get(field) for field in BOOLEAN_FIELDS]
+        numbers = [user.get("area_sqm"), user.get("seating_capacity")]
+        if not all(isinstance(f, bool) for f in flags):
+            return None
+        if not all(n is None or (isinstance(n, int) and not isinstance(n, bool) and n >= 0) for n in numbers):
+            return None
+        business_type = user.get("business_type")
+        food_type = user.get("food_type", DEFAULT_FOOD_TYPE)
+        try:
+            business_type = business_type if business_type in self._business_types else OTHER
+            food_type = food_type if food_type in self._food_types else OTHER
+        except TypeError:  # unhashable
+            return None
+        return "|".join([
+            str(business_type),
+            str(food_type),
+            "".join("1" if f else "0" for f in flags),
+            self._range_key(numbers[0], self.area_bounds),
+            self._range_key(numbers[1], self.seating_bounds),
+        ])
+
+    @staticmethod
+    def _ranges(bounds):
+        """[(representative value, prompt label)] for each class of a numeric field."""
+        if not bounds:
+            return [(None, None)]
+        ranges = [(None, None)]
+        edges = [0] + bounds
+        for i, low in enumerate(edges):
+            if i == len(edges) - 1:
+                label = f"{low} ומעלה"
+            elif low == 0:
+                label = f"עד {edges[i + 1] - 1}"
+            else:
+                label = f"{low}-{edges[i + 1] - 1}"
+            ranges.append((low, label))
+        return ranges
+
+    def classes(self):
+        """
+        Yields (class key, profile, prompt profile) for every class. `profile`
+        is a representative for matching; the prompt profile describes the
+        whole class (area/seating as ranges) and uses the name placeholder.
+        """
+        other_business = "לא מוגדר" if "לא מוגדר" not in self._business_types else "__other__"
+        other_food = DEFAULT_FOOD_TYPE if DEFAULT_FOOD_TYPE not in self._food_types else "__other__"
+        for business_type in self.business_types + [other_business]:
+            for food_type in self.food_types + [other_food]:
+                for bits in range(2 ** len(BOOLEAN_FIELDS)):
+                    flags = {f: bool(bits >> i & 1) for i, f in enumerate(BOOLEAN_FIELDS)}
+                    for area, area_label in self._ranges(self.area_bounds):
+                        for seats, seats_label in self._ranges(self.seating_bounds):
+                            profile = {
+                                "business_name": NAME_PLACEHOLDER,
+                                "business_type": business_type,
+                                "area_sqm": area,
+                                "seating_capacity": seats,
+                                "food_type": food_type,
+                                **flags,
+                            }
+                            prompt_profile = dict(profile, area_sqm=area_label, seating_capacity=seats_label)
+                            yield self.class_key(profile), profile, prompt_profile
+
+    def random_profile(self, rng):
+        """A build_user_profile-shaped profile that probes every boundary."""
+        def number(bounds):
+            if rng.random() < 0.2:
+                return None
+            if bounds and rng.random() < 0.6:
+                return max(0, rng.choice(bounds) + rng.choice([-1, 0, 1]))
+            return rng.randint(0, 1000)
+
+        return {
+            "business_name": "בדיקה",
+            "business_type": rng.choice(self.business_types + ["לא מוגדר", "pizzeria"]),
+            "area_sqm": number(self.area_bounds),
+            "seating_capacity": number(self.seating_bounds),
+            "food_type": rng.choice(self.food_types + [DEFAULT_FOOD_TYPE, "אחר"]),
+            **{f: rng.random() < 0.5 for f in BOOLEAN_FIELDS},
+        }
+
+
+def build_class_table(rules, version):
+    """
+    Matches every class of the rule set's profile space. Returns the
+    precompute document without reports: {"rules_version", "space",
+    "classes": {key: {"matched": [ids], "report": None}}, "reports": {}}.
+    """
+    space = ProfileSpace.from_rules(rules)
+    index = RuleIndex(rules, version=version)
+    classes = {}
+    for key, profile, _ in space.classes():
+        classes[key] = {"matched": [r.get("id") for r in index.match(profile)], "report": None}
+    return {"rules_version": version, "space": space.to_dict(), "classes": classes, "reports": {}}
+
+
+def verify_class_table(rules, table, count=5000, seed=0):
+    """Returns the random profiles whose matched rules differ from their class's precomputed set."""
+    space = ProfileSpace.from_dict(table["space"])
+    index = RuleIndex(rules)
+    rng = random.Random(seed)
+    mismatches = []
+    for _ in range(count):
+        user = space.random_profile(rng)
+        entry = table["classes"].get(space.class_key(user))
+        if entry is None or entry["matched"] != [r.get("id") for r in index.match(user)]:
+            mismatches.append(user)
+    return mismatches
+
+
+class PrecomputedReports:
+    """
+    Read side of the precompute job: maps a profile to its class's
+    pre-generated report template. The file is re-read when it changes
+    (checked at most every `check_interval` seconds); reports are only used
+    for the rules version, model and prompt version they were generated with.
+    """
+
+    def __init__(self, path=PRECOMPUTED_REPORTS_PATH, check_interval=30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._next_check = 0.0
+        self._table = None
+        self._space = None
+        self.hits = 0
+        self.misses = 0
+
+    def _current(self):
+        if time.monotonic() < self._next_check:
+            return self._table
+        with self._lock:
+            self._next_check = time.monotonic() + self.check_interval
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self._mtime, self._table, self._space = None, None, None
+                return None
+            if mtime != self._mtime:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        table = json.load(f)
+                    self._space = ProfileSpace.from_dict(table["space"])
+                    self._table = table
+                    logger.info("📦 Loaded %d precomputed reports for %d profile classes (rules %s)",
+                                len(table["reports"]), len(table["classes"]), table["rules_version"])
+                except (OSError, ValueError, KeyError) as e:
+                    logger.error("Error loading precomputed reports from %s: %s", self.path, e)
+                    self._table, self._space = None, None
+                self._mtime = mtime
+            return self._table
+
+    def lookup(self, user, rules_version, model, prompt_version):
+        """Returns the AI part of the report for the profile's class with its name filled in, or None."""
+        table = self._current()
+        report = None
+        if table is not None and table["rules_version"] == rules_version:
+            entry = table["classes"].get(self._space.class_key(user))
+            report = table["reports"].get(entry["report"]) if entry and entry["report"] else None
+            if report and (report["model"] != model or report["prompt_version"] != prompt_version):
+                report = None
+        if report is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return fill_business_name(report["ai_data"], user["business_name"])
+
+    def stats(self):
+        table = self._current()
+        total = self.hits + self.misses
+        return {
+            "loaded": table is not None,
+            "rules_version": table["rules_version"] if table else None,
+            "classes": len(table["classes"]) if table else 0,
+            "reports": len(table["reports"]) if table else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+def save_table(table, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def generate_reports(table, rules, path, limit=None, workers=PRECOMPUTE_WORKERS):
+    """
+    Pre-generates the AI report of every class with a known business type,
+    through the same prompt pipeline as /api/generate-report. Classes with
+    the same prompt share one report. Reports already in `table` for the
+    same key are kept, and the file is saved after each report, so an
+    interrupted run resumes. `limit` caps new reports, most shared first.
+    """
+    from backend import app as api  # heavy: only needed when generating
+
+    by_id = {r.get("id"): r for r in rules}
+    space = ProfileSpace.from_dict(table["space"])
+    jobs = {}
+    for key, _, prompt_profile in space.classes():
+        entry = table["classes"][key]
+        if prompt_profile["business_type"] not in space.business_types or not entry["matched"]:
+            continue
+        matched = [by_id[i] for i in entry["matched"]]
+        prompt_rules, _ = api.compact_prompt_rules(matched)
+        mode = api.choose_report_mode({}, prompt_rules)
+        prompt_version = f"{api.REPORT_PROMPT_VERSION}:{mode}:{api.PROMPT_TOKEN_BUDGET}"
+        report_id = report_cache_key(prompt_profile, entry["matched"], api.CHAT_MODEL, prompt_version)
+        entry["report"] = report_id
+        job = jobs.setdefault(report_id, {"profile": prompt_profile, "rules": prompt_rules, "mode": mode,
+                                          "prompt_version": prompt_version, "classes": 0})
+        job["classes"] += 1
+
+    todo = [(report_id, job) for report_id, job in jobs.items() if report_id not in table["reports"]]
+    todo.sort(key=lambda item: -item[1]["classes"])
+    if limit is not None:
+        todo = todo[:limit]
+    print(f"📝 {len(jobs)} distinct reports, {len(jobs) - len(todo)} already generated or skipped, "
+          f"generating {len(todo)} ({workers} at a time)", flush=True)
+    save_table(table, path)
+
+    def generate(job):
+        return api.build_ai_report(job["profile"], job["rules"], job["mode"])
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(generate, job): (report_id, job) for report_id, job in todo}
+        for n, future in enumerate(as_completed(futures), start=1):
+            report_id, job = futures[future]
+            try:
+                ai_data = future.result()
+            except Exception as e:
+                failed += 1
+                print(f" Report {report_id[:12]} failed: {e}", flush=True)
+                continue
+            table["reports"][report_id] = {
+                "model": api.CHAT_MODEL,
+                "prompt_version": job["prompt_version"],
+                "ai_data": ai_data,
+            }
+            save_table(table, path)
+            print(f"   {n}/{len(todo)} reports ({job['classes']} classes)", flush=True)
+    return failed
+
+
+def main(argv):
+    """python backend/report_precompute.py classes|reports [output path] [max new reports]"""
+    command = argv[0] if argv else "classes"
+    path = argv[1] if len(argv) > 1 else PRECOMPUTED_REPORTS_PATH
+    limit = int(argv[2]) if len(argv) > 2 else None
+    if command not in ("classes", "reports"):
+        print(main.__doc__)
+        return 2
+
+    from backend.rule_store import RuleStore
+    from backend.rule_pack import RULES_PACK_PATH
+
+    ruleset = RuleStore(os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_rules"),
+                        pack_path=RULES_PACK_PATH).get()
+    rules = list(ruleset.rules)
+    started = time.perf_counter()
+    table = build_class_table(rules, ruleset.version)
+    space = ProfileSpace.from_dict(table["space"])
+    distinct = len({tuple(entry["matched"]) for entry in table["classes"].values()})
+    print(f"🧮 {len(table['classes'])} profile classes ({len(space.area_bounds)} area and "
+          f"{len(space.seating_bounds)} seating boundaries), {distinct} distinct matched-rule sets, "
+          f"{time.perf_counter() - started:.2f}s", flush=True)
+
+    mismatches = verify_class_table(rules, table)
+    if mismatches:
+        print(f" {len(mismatches)} random profiles don't match their class, e.g. {mismatches[0]}", flush=True)
+        return 1
+
+    # Keep reports generated earlier for the same rules
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous.get("rules_version") == ruleset.version:
+            table["reports"] = previous.get("reports", {})
+            for key, entry in previous.get("classes", {}).items():
+                if key in table["classes"]:
+                    table["classes"][key]["report"] = entry.get("report")
+
+    if command == "reports":
+        failed = generate_reports(table, rules, path, limit)
+        if failed:
+            print(f" {failed} reports failed; run again to retry them", flush=True)
+            return 1
+    save_table(table, path)
+    print(f"Wrote {path} ({len(table['reports'])} reports)", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
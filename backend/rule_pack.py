@@ -0,0 +1,476 @@
+import os
+import re
+import sys
+import json
+import mmap
+import math
+import struct
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backend.matching import BOOLEAN_FIELDS
+from backend.rule_store import parse_rules_file, rules_version
+
+# Compiled rule set shared by every worker: built from json_rules/*.json, memory-mapped read-only
+RULES_PACK_PATH = os.getenv("RULES_PACK_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rules.pack"))
+
+MAGIC = b"RLPK"
+FORMAT_VERSION = 1
+# magic, format version, reserved, rule count, source version (rules_version of the JSON files)
+_HEADER = struct.Struct("<4sHHI16s")
+_SECTION = struct.Struct("<QQ")  # offset, length
+SECTIONS = ["meta", "string_offsets", "string_data", "business_types", "food_types",
+            "categories", "priorities", "records", "actions", "lists"]
+_ALIGN = 8
+
+NO_STRING = 0xFFFFFFFF
+MAX_ENUM_VALUES = 64  # business/food types are stored as uint64 bitmasks
+MAX_LIST_LENGTH = 255
+
+# applies_when fields with a packed representation, then the rule's optional estimated_cost.
+# Each has a 2-bit state in "presence".
+LIST_FIELDS = ["business_type", "food_type"] + BOOLEAN_FIELDS
+PACKED_FIELDS = LIST_FIELDS + ["min_area", "max_area", "seating_capacity"]
+_COST_STATE = len(PACKED_FIELDS)
+ABSENT, NULL, VALUE = 0, 1, 2
+
+RULE_FIELDS = ["id", "title", "category", "applies_when", "actions", "priority", "estimated_cost"]
+_SEATING_TEXT_RE = re.compile(r"^\s*עד\s*\d+\s*$")
+
+RECORD_DTYPE = np.dtype([
+    ("id", "<u4"),
+    ("title", "<u4"),
+    ("cost", "<u4"),
+    ("extra", "<u4"),           # JSON of keys not packed below, or NO_STRING
+    ("actions_start", "<u4"),
+    ("actions_count", "<u4"),
+    ("lists_start", "<u4"),     # LIST_FIELDS values in their original order: [length, codes...] per present list
+    ("lists_count", "<u4"),
+    ("presence", "<u4"),        # 2-bit ABSENT/NULL/VALUE state per PACKED_FIELDS entry, then cost
+    ("seating_text", "<u4"),    # original "עד N" text, or NO_STRING for a plain number
+    ("business_types", "<u8"),  # bit i = business_types[i]
+    ("food_types", "<u8"),
+    ("min_area", "<f8"),
+    ("max_area", "<f8"),
+    ("seating", "<i4"),
+    ("category", "u1"),
+    ("priority", "u1"),
+    ("booleans", "u1"),         # per BOOLEAN_FIELDS entry: bit 2i allows True, bit 2i+1 allows False
+    ("number_flags", "u1"),     # bit 0: min_area is an int, bit 1: max_area is an int
+])
+
+
+def _nan_key(value):
+    """NaN (an unset area bound) never equals itself, so condition keys use None instead."""
+    return None if value != value else value
+
+
+class RulePackError(ValueError):
+    """Raised for rules that can't be packed and for unreadable pack files."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def validate_rule(rule):
+    """Returns the problems that keep a rule out of the pack (empty list = valid)."""
+    if not isinstance(rule, dict):
+        return ["rule is not an object"]
+    errors = []
+    for field in ["id", "title", "category", "priority"]:
+        if not isinstance(rule.get(field), str) or not rule.get(field):
+            errors.append(f"{field} must be a non-empty string")
+    actions = rule.get("actions")
+    if not isinstance(actions, list) or not all(isinstance(a, str) for a in actions):
+        errors.append("actions must be a list of strings")
+    if rule.get("estimated_cost") is not None and not isinstance(rule["estimated_cost"], str):
+        errors.append("estimated_cost must be a string or null")
+
+    cond = rule.get("applies_when")
+    if not isinstance(cond, dict):
+        return errors + ["applies_when must be an object"]
+    for field in ["business_type", "food_type"]:
+        values = cond.get(field)
+        if values is not None and not (isinstance(values, list) and all(isinstance(v, str) and v for v in values)):
+            errors.append(f"applies_when.{field} must be a list of strings or null")
+    for field in BOOLEAN_FIELDS:
+        if field in cond and not (isinstance(cond[field], list) and all(isinstance(v, bool) for v in cond[field])):
+            errors.append(f"applies_when.{field} must be a list of true/false")
+    for field in LIST_FIELDS:
+        if isinstance(cond.get(field), list) and len(cond[field]) > MAX_LIST_LENGTH:
+            errors.append(f"applies_when.{field} has more than {MAX_LIST_LENGTH} values")
+    for field in ["min_area", "max_area"]:
+        value = cond.get(field)
+        if value is not None and not (_is_number(value) and value >= 0):
+            errors.append(f"applies_when.{field} must be a non-negative number or null")
+    if _is_number(cond.get("min_area")) and _is_number(cond.get("max_area")) and cond["max_area"] \
+            and cond["min_area"] > cond["max_area"]:
+        errors.append("applies_when.min_area is greater than max_area")
+    seating = cond.get("seating_capacity")
+    if seating is not None and not (
+            (isinstance(seating, int) and not isinstance(seating, bool) and 0 <= seating < 2 ** 31)
+            or (isinstance(seating, str) and _SEATING_TEXT_RE.match(seating))):
+        errors.append('applies_when.seating_capacity must be a whole number, "עד N" or null')
+    return errors
+
+
+def validate_rules(rules):
+    """Returns ["<rule id or #position>: problem"] for every invalid rule and duplicate ID."""
+    errors = []
+    seen = set()
+    for position, rule in enumerate(rules):
+        label = rule.get("id") if isinstance(rule, dict) and isinstance(rule.get("id"), str) else f"#{position}"
+        errors.extend(f"{label}: {problem}" for problem in validate_rule(rule))
+        if isinstance(rule, dict) and isinstance(rule.get("id"), str):
+            if rule["id"] in seen:
+                errors.append(f"{label}: duplicate id")
+            seen.add(rule["id"])
+    enums = {
+        "business_type": {v for r in rules for v in r["applies_when"].get("business_type") or []},
+        "food_type": {v for r in rules for v in r["applies_when"].get("food_type") or []},
+        "category": {r["category"] for r in rules},
+        "priority": {r["priority"] for r in rules},
+    } if not errors else {}
+    for field, values in enums.items():
+        limit = MAX_ENUM_VALUES if field.endswith("type") else 256
+        if len(values) > limit:
+            errors.append(f"too many distinct {field} values ({len(values)} > {limit})")
+    return errors
+
+
+class _Enum:
+    """Codes in first-seen order."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def code(self, value):
+        return self.codes.setdefault(value, len(self.codes))
+
+    def mask(self, values):
+        mask = 0
+        for value in values:
+            mask |= 1 << self.code(value)
+        return mask
+
+
+def encode_rules(rules, version, files):
+    """Encodes validated rules into the pack's bytes."""
+    strings = {}
+
+    def string_id(text):
+        return strings.setdefault(text, len(strings))
+
+    business_types, food_types, categories, priorities = _Enum(), _Enum(), _Enum(), _Enum()
+    records = np.zeros(len(rules), dtype=RECORD_DTYPE)
+    actions = []
+    lists = []
+    list_enums = {"business_type": business_types, "food_type": food_types}
+
+    for position, rule in enumerate(rules):
+        cond = rule["applies_when"]
+        record = records[position]
+        record["id"] = string_id(rule["id"])
+        record["title"] = string_id(rule["title"])
+        record["category"] = categories.code(rule["category"])
+        record["priority"] = priorities.code(rule["priority"])
+        record["actions_start"] = len(actions)
+        record["actions_count"] = len(rule["actions"])
+        actions.extend(string_id(a) for a in rule["actions"])
+        record["lists_start"] = len(lists)
+        for field in LIST_FIELDS:
+            values = cond.get(field)
+            if isinstance(values, list):
+                lists.append(len(values))
+                enum = list_enums.get(field)
+                lists.extend(enum.code(v) if enum else int(not v) for v in values)  # True = 0, False = 1
+        record["lists_count"] = len(lists) - record["lists_start"]
+
+        presence = 0
+        for i, field in enumerate(PACKED_FIELDS):
+            state = ABSENT if field not in cond else (NULL if cond[field] is None else VALUE)
+            presence |= state << (2 * i)
+        cost = rule.get("estimated_cost")
+        presence |= (ABSENT if "estimated_cost" not in rule else (NULL if cost is None else VALUE)) << (2 * _COST_STATE)
+        record["presence"] = presence
+        record["cost"] = string_id(cost) if cost is not None else NO_STRING
+
+        record["business_types"] = business_types.mask(cond.get("business_type") or [])
+        record["food_types"] = food_types.mask(cond.get("food_type") or [])
+        booleans = 0
+        for i, field in enumerate(BOOLEAN_FIELDS):
+            values = cond.get(field) or []
+            booleans |= (True in values) << (2 * i) | (False in values) << (2 * i + 1)
+        record["booleans"] = booleans
+
+        number_flags = 0
+        for bit, field in enumerate(["min_area", "max_area"]):
+            value = cond.get(field)
+            record[field] = value if value is not None else math.nan
+            number_flags |= isinstance(value, int) << bit
+        record["number_flags"] = number_flags
+        seating = cond.get("seating_capacity")
+        if isinstance(seating, str):
+            record["seating"] = int(seating.replace("עד", "").strip())
+            record["seating_text"] = string_id(seating)
+        else:
+            record["seating"] = seating if seating is not None else -1
+            record["seating_text"] = NO_STRING
+
+        extra = {}
+        rule_extra = {k: v for k, v in rule.items() if k not in RULE_FIELDS}
+        cond_extra = {k: v for k, v in cond.items() if k not in PACKED_FIELDS}
+        if rule_extra:
+            extra["rule"] = rule_extra
+        if cond_extra:
+            extra["applies_when"] = cond_extra
+        record["extra"] = string_id(json.dumps(extra, ensure_ascii=False)) if extra else NO_STRING
+
+    def enum_ids(enum):
+        return np.array([string_id(v) for v in enum.codes], dtype="<u4")
+
+    # Enum values are interned too, so build their arrays before the string table is frozen
+    enum_arrays = [enum_ids(business_types), enum_ids(food_types), enum_ids(categories), enum_ids(priorities)]
+    # Offsets count code points, so the loader decodes the whole table once and slices it
+    offsets = np.zeros(len(strings) + 1, dtype="<u4")
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+
+    payloads = [
+        json.dumps({"files": list(files)}, ensure_ascii=False).encode("utf-8"),
+        offsets.tobytes(),
+        "".join(strings).encode("utf-8"),
+        *(a.tobytes() for a in enum_arrays),
+        records.tobytes(),
+        np.array(actions, dtype="<u4").tobytes(),
+        np.array(lists, dtype="u1").tobytes(),
+    ]
+
+    position = _HEADER.size + _SECTION.size * len(SECTIONS)
+    table = []
+    body = bytearray()
+    for payload in payloads:
+        padding = -(position + len(body)) % _ALIGN
+        body.extend(b"\0" * padding)
+        table.append(_SECTION.pack(position + len(body), len(payload)))
+        body.extend(payload)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(rules), version.encode("ascii")[:16])
+    return header + b"".join(table) + bytes(body)
+
+
+class RulePack:
+    """
+    Read-only view of a compiled rule pack. The file is memory-mapped, so
+    every worker shares one copy of it in the page cache; the condition
+    columns (`records`) are NumPy views straight over the mapping. Strings
+    are decoded on first use and interned.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < _HEADER.size + _SECTION.size * len(SECTIONS):
+            raise RulePackError(f"{path} is too short to be a rule pack")
+        magic, format_version, _, count, version = _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise RulePackError(f"{path} is not a version {FORMAT_VERSION} rule pack")
+        self.version = version.rstrip(b"\0").decode("ascii")
+
+        self._sections = {}
+        for i, name in enumerate(SECTIONS):
+            offset, length = _SECTION.unpack_from(self._map, _HEADER.size + i * _SECTION.size)
+            if offset + length > len(self._map):
+                raise RulePackError(f"{path} is truncated")
+            self._sections[name] = (offset, length)
+
+        self.files = tuple(json.loads(self._bytes("meta").decode("utf-8"))["files"])
+        self._offsets = self._array("string_offsets", "<u4")
+        self._strings = None
+        self._extras = {}
+        self._conditions = {}
+        self.records = self._array("records", RECORD_DTYPE)
+        self.actions = self._array("actions", "<u4")
+        self.lists = self._array("lists", "u1")
+        if len(self.records) != count:
+            raise RulePackError(f"{path} has {len(self.records)} records, expected {count}")
+        self.business_types = [self.string(i) for i in self._array("business_types", "<u4")]
+        self.food_types = [self.string(i) for i in self._array("food_types", "<u4")]
+        self.categories = [self.string(i) for i in self._array("categories", "<u4")]
+        self.priorities = [self.string(i) for i in self._array("priorities", "<u4")]
+
+    def __len__(self):
+        return len(self.records)
+
+    def _bytes(self, name):
+        offset, length = self._sections[name]
+        return self._map[offset:offset + length]
+
+    def _array(self, name, dtype):
+        offset, length = self._sections[name]
+        dtype = np.dtype(dtype)
+        return np.frombuffer(self._map, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+
+    def string(self, string_id):
+        if self._strings is None:
+            text = self._bytes("string_data").decode("utf-8")
+            offsets = self._offsets.tolist()
+            self._strings = [sys.intern(text[start:end]) for start, end in zip(offsets, offsets[1:])]
+        return self._strings[string_id]
+
+    def _extra(self, string_id):
+        """Parsed extra keys; rules with the same extras share one parse (rules are read-only)."""
+        if string_id == NO_STRING:
+            return {}
+        cached = self._extras.get(string_id)
+        if cached is None:
+            cached = self._extras[string_id] = json.loads(self.string(string_id))
+        return cached
+
+    def _decode(self, record, actions, lists):
+        """Rebuilds a rules.json dict from a record tuple (RECORD_DTYPE field order)."""
+        (id_, title, cost, extra_id, actions_start, actions_count, cursor, lists_count, presence, seating_text,
+         _, _, min_area, max_area, seating, category, priority, _, number_flags) = record
+        extra = self._extra(extra_id)
+
+        # Rules with identical conditions share one applies_when dict
+        key = (presence, tuple(lists[cursor:cursor + lists_count]), _nan_key(min_area), _nan_key(max_area),
+               seating, seating_text, number_flags, extra_id)
+        cond = self._conditions.get(key)
+        if cond is None:
+            cond = self._conditions[key] = self._decode_conditions(key, extra, lists, cursor)
+
+        rule = {
+            "id": self.string(id_),
+            "title": self.string(title),
+            "category": self.categories[category],
+            "applies_when": cond,
+            "actions": [self.string(i) for i in actions[actions_start:actions_start + actions_count]],
+            "priority": self.priorities[priority],
+        }
+        cost_state = presence >> (2 * _COST_STATE) & 3
+        if cost_state != ABSENT:
+            rule["estimated_cost"] = self.string(cost) if cost_state == VALUE else None
+        if "rule" in extra:
+            rule.update(extra["rule"])
+        return rule
+
+    def _decode_conditions(self, key, extra, lists, cursor):
+        presence, _, min_area, max_area, seating, seating_text, number_flags, _ = key
+        cond = {}
+        for i, field in enumerate(PACKED_FIELDS):
+            state = presence >> (2 * i) & 3
+            if state == ABSENT:
+                continue
+            if state == NULL:
+                cond[field] = None
+            elif i < len(LIST_FIELDS):
+                length = lists[cursor]
+                codes = lists[cursor + 1:cursor + 1 + length]
+                cursor += 1 + length
+                if field == "business_type":
+                    cond[field] = [self.business_types[c] for c in codes]
+                elif field == "food_type":
+                    cond[field] = [self.food_types[c] for c in codes]
+                else:
+                    cond[field] = [c == 0 for c in codes]
+            elif field == "min_area":
+                cond[field] = int(min_area) if number_flags & 1 else min_area
+            elif field == "max_area":
+                cond[field] = int(max_area) if number_flags & 2 else max_area
+            else:
+                cond[field] = self.string(seating_text) if seating_text != NO_STRING else seating
+        if "applies_when" in extra:
+            cond.update(extra["applies_when"])
+        return cond
+
+    def rule(self, position):
+        """Decodes one rule back into its rules.json dict."""
+        record = self.records[position].tolist()
+        return self._decode(record, self.actions.tolist(), self.lists.tolist())
+
+    def rules(self):
+        """Decodes every rule (columns are converted in bulk, which is much faster than per field)."""
+        actions = self.actions.tolist()
+        lists = self.lists.tolist()
+        return [self._decode(record, actions, lists) for record in self.records.tolist()]
+
+
+def read_rule_files(data_dir):
+    """[(name, raw bytes)] of the *.json rule files, in RuleStore order."""
+    if not os.path.isdir(data_dir):
+        return []
+    names = sorted(n for n in os.listdir(data_dir) if n.endswith(".json") and os.path.isfile(os.path.join(data_dir, n)))
+    files = []
+    for name in names:
+        with open(os.path.join(data_dir, name), "rb") as f:
+            files.append((name, f.read()))
+    return files
+
+
+def build_rule_pack(data_dir, path=RULES_PACK_PATH):
+    """
+    Validates json_rules/*.json and compiles them into `path` (written
+    atomically). Raises RulePackError listing every invalid rule; nothing is
+    written in that case. Returns the opened RulePack.
+    """
+    raws = read_rule_files(data_dir)
+    rules = []
+    for name, raw in raws:
+        try:
+            rules.extend(parse_rules_file(json.loads(raw.decode("utf-8"))))
+        except ValueError as e:
+            raise RulePackError(f"{name}: {e}")
+    errors = validate_rules(rules)
+    if errors:
+        raise RulePackError(f"{len(errors)} invalid rules:\n" + "\n".join(f"  - {e}" for e in errors))
+
+    data = encode_rules(rules, rules_version(raws), [name for name, _ in raws])
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    pack = RulePack(path)
+    decoded = pack.rules()
+    for original, loaded in zip(rules, decoded):
+        if original != loaded:
+            raise RulePackError(f"{original['id']}: does not round-trip through the pack")
+    return pack
+
+
+def main(argv):
+    """python backend/rule_pack.py build|check [json_rules dir] [output path]"""
+    command = argv[0] if argv else "build"
+    data_dir = argv[1] if len(argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_rules")
+    path = argv[2] if len(argv) > 2 else RULES_PACK_PATH
+
+    if command == "check":
+        rules = []
+        for _, raw in read_rule_files(data_dir):
+            rules.extend(parse_rules_file(json.loads(raw.decode("utf-8"))))
+        errors = validate_rules(rules)
+        for error in errors:
+            print(f"  - {error}")
+        print(f"{len(rules)} rules, {len(errors)} problems")
+        return 1 if errors else 0
+    if command != "build":
+        print(main.__doc__)
+        return 2
+
+    try:
+        pack = build_rule_pack(data_dir, path)
+    except RulePackError as e:
+        print(f" Rule pack not built: {e}", flush=True)
+        return 1
+    print(f"📦 Packed {len(pack)} rules (version {pack.version}) into {path} "
+          f"({os.path.getsize(path):,} bytes, {len(pack.business_types)} business types, "
+          f"{len(pack.categories)} categories)", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
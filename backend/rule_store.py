@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from backend.log import get_logger
+
+logger = get_logger("rules")
+
+
+class RuleSet:
+    """
+    Immutable snapshot of every rule loaded from the json_rules directory.
+    `version` is a short content hash, so two workers that loaded the same
+    files report the same version.
+    """
+
+    __slots__ = ("rules", "version", "loaded_at", "files")
+
+    def __init__(self, rules, version, files):
+        object.__setattr__(self, "rules", tuple(rules))
+        object.__setattr__(self, "version", version)
+        object.__setattr__(self, "files", tuple(files))
+        object.__setattr__(self, "loaded_at", time.time())
+
+    def __setattr__(self, name, value):
+        raise AttributeError("RuleSet is immutable")
+
+    def __len__(self):
+        return len(self.rules)
+
+    def __iter__(self):
+        return iter(self.rules)
+
+
+EMPTY_VERSION = "empty"
+# Signature entry of the compiled rule pack (not a file name, so it never collides)
+_PACK_ENTRY = "\0rules.pack"
+
+
+def rules_version(files):
+    """Short content hash of [(name, raw bytes)] rule files; EMPTY_VERSION when there are none."""
+    digest = hashlib.sha256()
+    for name, raw in files:
+        digest.update(name.encode("utf-8"))
+        digest.update(raw)
+    return digest.hexdigest()[:12] if files else EMPTY_VERSION
+
+
+def parse_rules_file(data):
+    """Accepts either {"rules": [...]} or a bare list of rules."""
+    if isinstance(data, dict) and "rules" in data:
+        return data["rules"]
+    if isinstance(data, list):
+        return data
+    return []
+
+
+class RuleStore:
+    """
+    Loads the rule files once and swaps in a new RuleSet only when a file
+    was added, removed or modified. The directory is stat'ed at most once
+    every `check_interval` seconds, so the hot path is a timestamp compare.
+    With `pack_path`, rules come from the compiled pack (see rule_pack.py)
+    whenever it was built from the current files.
+    """
+
+    def __init__(self, data_dir, check_interval=2.0, pack_path=None):
+        self.data_dir = data_dir
+        self.pack_path = pack_path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature = None
+        self._next_check = 0.0
+        self._current = RuleSet([], EMPTY_VERSION, [])
+        self._listeners = []
+        self.reload(force=True)
+
+    def _scan(self):
+        """Returns a cheap (name, mtime_ns, size) signature of the rule files."""
+        entries = []
+        if os.path.isdir(self.data_dir):
+            with os.scandir(self.data_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        st = entry.stat()
+                        entries.append((entry.name, st.st_mtime_ns, st.st_size))
+        if self.pack_path and os.path.exists(self.pack_path):
+            st = os.stat(self.pack_path)
+            entries.append((_PACK_ENTRY, st.st_mtime_ns, st.st_size))
+        return tuple(sorted(entries))
+
+    def _load(self, signature):
+        raws = []
+        for name, _, _ in signature:
+            if name == _PACK_ENTRY:
+                continue
+            with open(os.path.join(self.data_dir, name), "rb") as f:
+                raws.append((name, f.read()))
+        version = rules_version(raws)
+
+        if self.pack_path and os.path.exists(self.pack_path):
+            # The compiled pack skips JSON parsing; it is used only if built from these exact files
+            from backend.rule_pack import RulePack
+
+            pack = RulePack(self.pack_path)
+            if not raws or pack.version == version:
+                return RuleSet(pack.rules(), pack.version, pack.files)
+            logger.warning("Rule pack %s is stale (built from %s, files are %s); loading JSON",
+                           self.pack_path, pack.version, version)
+
+        rules = []
+        for _, raw in raws:
+            rules.extend(parse_rules_file(json.loads(raw.decode("utf-8"))))
+        return RuleSet(rules, version, [name for name, _ in raws])
+
+    def add_listener(self, callback):
+        """Registers callback(ruleset), called after every successful swap."""
+        self._listeners.append(callback)
+        callback(self._current)
+
+    def reload(self, force=False):
+        """Re-reads the rule files if their signature changed. Returns the current RuleSet."""
+        with self._lock:
+            signature = self._scan()
+            self._next_check = time.monotonic() + self.check_interval
+            if not force and signature == self._signature:
+                return self._current
+            try:
+                ruleset = self._load(signature)
+            except (OSError, ValueError) as e:
+                # Keep serving the previous rule set (e.g. a file is mid-write)
+                logger.error("Error reloading rules from %s: %s", self.data_dir, e)
+                return self._current
+            self._signature = signature
+            if ruleset.version != self._current.version:
+                self._current = ruleset
+                logger.info("📜 Loaded %d rules (version %s)", len(ruleset), ruleset.version)
+                for callback in self._listeners:
+                    callback(ruleset)
+            return self._current
+
+    def get(self):
+        """Returns the current RuleSet, reloading first if the check interval elapsed."""
+        if time.monotonic() >= self._next_check:
+            return self.reload()
+        return self._current
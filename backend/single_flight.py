@@ -0,0 +1,157 @@
+import os
+import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows: coalescing stays within the process
+    fcntl = None
+
+from backend import metrics
+from backend.log import get_logger
+
+logger = get_logger("single_flight")
+
+# Lock files that coordinate identical calls across gunicorn workers ("" = per-process only)
+SINGLE_FLIGHT_DIR = os.getenv("SINGLE_FLIGHT_DIR", os.path.join(tempfile.gettempdir(), "licensing-single-flight")) or None
+# Longest a worker waits for another worker's identical call before making its own
+SINGLE_FLIGHT_WAIT = float(os.getenv("SINGLE_FLIGHT_WAIT", "120"))
+# Lock files unused for this long are removed
+LOCK_FILE_MAX_AGE = 3600
+PRUNE_EVERY = 256
+
+SINGLE_FLIGHT_CALLS = metrics.Counter(
+    "licensing_single_flight_total", "Coalesced calls by role (leader = made the upstream call)", ["flight", "role"]
+)
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution of fn.
+
+    Within a process the first caller (the leader) runs fn and the others wait
+    for its result. With a lock_dir, the leader also holds an flock on a
+    per-key file while fn runs; a leader in another worker that finds the
+    lock taken waits for it, then tries recheck() (the shared cache) before
+    running fn itself. Calls without a recheck stay per-process, since the
+    other worker's result could not be picked up anyway. The lock is polled,
+    so gevent workers never block.
+    """
+
+    def __init__(self, name, lock_dir=None, wait=SINGLE_FLIGHT_WAIT):
+        self.name = name
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.wait = wait
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._locks_taken = 0
+        self.counts = {"leader": 0, "follower": 0, "worker_follower": 0}
+
+    def _count(self, role):
+        with self._lock:
+            self.counts[role] += 1
+        SINGLE_FLIGHT_CALLS.inc(flight=self.name, role=role)
+
+    def do(self, key, fn, recheck=None):
+        """Returns (result, shared): shared is True when another call's result was reused."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            self._count("follower")
+            return future.result(), True
+
+        try:
+            result, shared = self._lead(key, fn, recheck)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return result, shared
+
+    def _lead(self, key, fn, recheck):
+        if self.lock_dir is None or recheck is None:
+            self._count("leader")
+            return fn(), False
+        with self._worker_lock(key) as waited:
+            if waited and recheck is not None:
+                result = recheck()
+                if result is not None:
+                    self._count("worker_follower")
+                    return result, True
+            self._count("leader")
+            return fn(), False
+
+    @contextmanager
+    def _worker_lock(self, key):
+        """Holds the key's lock file; yields whether another worker held it first."""
+        path = os.path.join(self.lock_dir, f"{self.name}-{key[:40]}.lock")
+        try:
+            os.makedirs(self.lock_dir, exist_ok=True)
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError as e:
+            logger.warning("Single-flight lock %s unavailable (%s); not coalescing across workers", path, e)
+            yield False
+            return
+
+        waited = False
+        try:
+            deadline = time.monotonic() + self.wait
+            delay = 0.01
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if time.monotonic() >= deadline:
+                        logger.warning("Waited %ss for %s; calling without the lock", self.wait, path)
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.1)
+            os.utime(fd)
+            yield waited
+        finally:
+            os.close(fd)  # releases the flock
+        self._maybe_prune()
+
+    def _maybe_prune(self):
+        with self._lock:
+            self._locks_taken += 1
+            if self._locks_taken % PRUNE_EVERY:
+                return
+        cutoff = time.time() - LOCK_FILE_MAX_AGE
+        try:
+            names = os.listdir(self.lock_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.startswith(f"{self.name}-"):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.stat(path).st_mtime >= cutoff:
+                    continue
+                fd = os.open(path, os.O_RDWR)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.unlink(path)
+            except OSError:
+                pass  # in use
+            finally:
+                os.close(fd)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "in_flight": len(self._calls), "cross_worker": self.lock_dir is not None}
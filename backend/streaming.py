@@ -0,0 +1,125 @@
+import json
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # tell nginx not to buffer this response
+}
+
+
+def sse_event(event, data):
+    """Formats one server-sent event with a JSON payload."""
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def iter_completion_text(stream):
+    """Yields the text deltas of a streamed chat completion."""
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+class JsonSectionParser:
+    """
+    Incrementally parses a streamed JSON object and yields each top-level
+    (key, value) pair as soon as its value is complete, so e.g.
+    "executive_summary" can be sent before "requirements_by_priority" is done.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.state = "start"
+        self.key = None
+        self.result = {}
+        self._pending = ""  # text received since the last failed value parse
+
+    def _skip_ws(self):
+        while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+            self.pos += 1
+
+    def _next_non_ws(self, index):
+        while index < len(self.buf) and self.buf[index] in " \t\r\n":
+            index += 1
+        return index
+
+    def feed(self, text):
+        """Adds streamed text; returns the (key, value) pairs completed by it."""
+        self.buf += text
+        self._pending += text
+        sections = []
+        while self.state != "end":
+            self._skip_ws()
+            if self.pos >= len(self.buf):
+                break
+            if self.state == "start":
+                if self.buf[self.pos] != "{":
+                    raise ValueError("Streamed response is not a JSON object")
+                self.pos += 1
+                self.state = "key"
+            elif self.state == "key":
+                ch = self.buf[self.pos]
+                if ch == "}":
+                    self.pos += 1
+                    self.state = "end"
+                    break
+                if ch == ",":
+                    self.pos += 1
+                    continue
+                if ch != '"':
+                    raise ValueError("Malformed JSON object in streamed response")
+                try:
+                    key, end = self.decoder.raw_decode(self.buf, self.pos)
+                except ValueError:
+                    break  # key still streaming
+                colon = self._next_non_ws(end)
+                if colon >= len(self.buf):
+                    break
+                if self.buf[colon] != ":" or not isinstance(key, str):
+                    raise ValueError("Malformed JSON object in streamed response")
+                self.key = key
+                self.pos = colon + 1
+                self.state = "value"
+                self._pending = self.buf[self.pos:]
+            elif self.state == "value":
+                # Containers can only complete once a closing bracket arrived
+                if self.buf[self.pos] in "{[" and not any(c in self._pending for c in "}]"):
+                    break
+                try:
+                    value, end = self.decoder.raw_decode(self.buf, self.pos)
+                except ValueError:
+                    self._pending = ""
+                    break
+                # Only a following "," or "}" ends the value: "1500." or "-3e" at the
+                # end of a chunk decodes as a number that is still growing
+                after = self._next_non_ws(end)
+                if after >= len(self.buf):
+                    break
+                if self.buf[after] not in ",}":
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        break
+                    raise ValueError("Malformed JSON object in streamed response")
+                self.result[self.key] = value
+                sections.append((self.key, value))
+                self.buf = self.buf[end:]
+                self.pos = 0
+                self.state = "key"
+        return sections
+
+    def close(self):
+        """Returns the full parsed object; raises if the stream ended early."""
+        if self.state != "end":
+            raise ValueError("Streamed JSON response ended before the object was complete")
+        return self.result
+
+
+def iter_json_sections(text_chunks, parser=None):
+    """Yields top-level (key, value) pairs of a JSON object streamed as text chunks."""
+    parser = parser or JsonSectionParser()
+    for text in text_chunks:
+        yield from parser.feed(text)
+    parser.close()
@@ -0,0 +1,293 @@
+import os
+import sys
+import json
+import uuid
+import threading
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+CHROMA_DB_PATH = os.path.join(BACKEND_DIR, "chroma_db")
+NUMPY_INDEX_PATH = os.getenv("NUMPY_INDEX_PATH", os.path.join(BACKEND_DIR, "vector_index"))
+COLLECTION_NAME = "rag_index"
+
+# "chroma" (default) or "numpy"
+RAG_BACKEND = os.getenv("RAG_BACKEND", "chroma")
+
+
+class ChromaVectorStore:
+    """ChromaDB PersistentClient collection (cosine space)."""
+
+    name = "chroma"
+
+    def __init__(self, path=CHROMA_DB_PATH, collection_name=COLLECTION_NAME):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=path)
+        self.collection = self.client.get_or_create_collection(
+            name=collection_name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def count(self):
+        return self.collection.count()
+
+    def query(self, embedding, top_k=5, ids=None):
+        """Returns [{"id", "chunk", "score"}] best first; score is cosine similarity. `ids` restricts the search."""
+        return self.query_many([embedding], top_k=top_k, ids=ids)[0]
+
+    def query_many(self, embeddings, top_k=5, ids=None):
+        """query() for several embeddings in one collection query; one result list per embedding."""
+        if ids is not None and not ids:
+            return [[] for _ in embeddings]
+        results = self.collection.query(
+            query_embeddings=np.asarray(embeddings, dtype=np.float32).tolist(),
+            n_results=top_k,
+            # Every chunk's metadata carries its ID (see add_items_to_store)
+            where={"id": {"$in": sorted(ids)}} if ids is not None else None
+        )
+        batches = []
+        for q in range(len(embeddings)):
+            ids = results["ids"][q] if results["ids"] else []
+            distances = results["distances"][q] if results.get("distances") else None
+            # ChromaDB returns cosine distance; similarity = 1 - distance
+            batches.append([
+                {
+                    "id": ids[i],
+                    "chunk": results["documents"][q][i],
+                    "score": 1 - distances[i] if distances is not None else None
+                }
+                for i in range(len(ids))
+            ])
+        return batches
+
+    def get_ids(self):
+        return set(self.collection.get(include=[]).get("ids", []))
+
+    def get_documents(self):
+        """Returns (ids, documents, metadatas) without embeddings."""
+        results = self.collection.get(include=["documents", "metadatas"])
+        return results["ids"], results["documents"], results["metadatas"]
+
+    def get_embeddings(self, ids):
+        """Returns {id: embedding} for the given IDs that exist."""
+        if not ids:
+            return {}
+        results = self.collection.get(ids=list(ids), include=["embeddings"])
+        return dict(zip(results["ids"], results["embeddings"]))
+
+    def revision(self):
+        """Changes when the stored chunks change (best effort: the chunk count)."""
+        return self.collection.count()
+
+    def get_all(self):
+        """Returns (ids, embeddings, documents, metadatas) of the whole collection."""
+        results = self.collection.get(include=["embeddings", "documents", "metadatas"])
+        return results["ids"], results["embeddings"], results["documents"], results["metadatas"]
+
+    def add(self, ids, embeddings, documents, metadatas):
+        self.collection.add(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def update_metadatas(self, ids, metadatas):
+        """Replaces the metadata of stored chunks, keeping their embeddings."""
+        if ids:
+            self.collection.update(ids=list(ids), metadatas=list(metadatas))
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=list(ids))
+
+
+class NumpyVectorStore:
+    """
+    Brute-force cosine index: L2-normalized float16 vectors in a .npy file,
+    memory-mapped read-only so every worker shares the same page cache, plus a
+    JSON sidecar with ids/documents/metadatas. Writes go to a new vectors file
+    and the sidecar is swapped atomically, so readers never see a torn index.
+    """
+
+    name = "numpy"
+
+    def __init__(self, path=NUMPY_INDEX_PATH):
+        self.path = path
+        self.meta_path = os.path.join(path, "index.json")
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._matrix = None
+        self._meta = {"ids": [], "documents": [], "metadatas": [], "vectors": None}
+        self._positions = {}
+        self._load()
+
+    def _load(self):
+        """(Re)loads the index if the sidecar changed on disk."""
+        try:
+            mtime = os.stat(self.meta_path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        with self._lock:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(os.path.join(self.path, meta["vectors"]), mmap_mode="r")
+            positions = {chunk_id: p for p, chunk_id in enumerate(meta["ids"])}
+            self._meta, self._matrix, self._positions, self._mtime = meta, matrix, positions, mtime
+
+    def count(self):
+        self._load()
+        return len(self._meta["ids"])
+
+    def query(self, embedding, top_k=5, ids=None):
+        """Returns [{"id", "chunk", "score"}] best first; score is cosine similarity. `ids` restricts the search."""
+        return self.query_many([embedding], top_k=top_k, ids=ids)[0]
+
+    def query_many(self, embeddings, top_k=5, ids=None):
+        """query() for several embeddings as one matrix product; one result list per embedding."""
+        self._load()
+        matrix, meta, positions = self._matrix, self._meta, self._positions
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if matrix is None or not len(meta["ids"]):
+            return [[] for _ in range(len(queries))]
+        if queries.shape[1] != matrix.shape[1]:
+            raise ValueError(
+                f"Query embedding has {queries.shape[1]} dims but the index has {matrix.shape[1]}; rebuild the index"
+            )
+        # Only the rows of the allowed chunks are read and scored
+        rows = None
+        if ids is not None:
+            rows = np.fromiter(sorted(positions[i] for i in ids if i in positions), dtype=np.int64)
+            if not len(rows):
+                return [[] for _ in range(len(queries))]
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+        # float16 on disk/in memory, float32 accumulation; (chunks, questions)
+        vectors = matrix if rows is None else matrix[rows]
+        scores = np.asarray(vectors, dtype=np.float32) @ queries.T
+        k = min(top_k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1, axis=0)[:k]
+        batches = []
+        for q in range(queries.shape[0]):
+            column = scores[:, q]
+            ranked = top[:, q][np.argsort(-column[top[:, q]])]
+            chunk_positions = ranked if rows is None else rows[ranked]
+            batches.append([
+                {"id": meta["ids"][p], "chunk": meta["documents"][p], "score": float(column[i])}
+                for i, p in zip(ranked, chunk_positions)
+            ])
+        return batches
+
+    def get_ids(self):
+        self._load()
+        return set(self._meta["ids"])
+
+    def get_documents(self):
+        self._load()
+        meta = self._meta
+        return list(meta["ids"]), list(meta["documents"]), list(meta["metadatas"])
+
+    def get_embeddings(self, ids):
+        """Returns {id: embedding} for the given IDs that exist (normalized vectors)."""
+        self._load()
+        positions = self._positions
+        return {
+            i: np.asarray(self._matrix[positions[i]], dtype=np.float32)
+            for i in ids if i in positions
+        }
+
+    def revision(self):
+        """Changes on every write (each write has its own vectors file)."""
+        self._load()
+        return self._meta["vectors"]
+
+    def get_all(self):
+        self._load()
+        meta = self._meta
+        embeddings = [] if self._matrix is None else np.asarray(self._matrix, dtype=np.float32)
+        return list(meta["ids"]), embeddings, list(meta["documents"]), list(meta["metadatas"])
+
+    def _write(self, ids, embeddings, documents, metadatas):
+        os.makedirs(self.path, exist_ok=True)
+        if len(ids):
+            matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = (matrix / np.where(norms == 0, 1.0, norms)).astype(np.float16)
+
+        vectors_name = f"vectors-{uuid.uuid4().hex[:12]}.npy"
+        np.save(os.path.join(self.path, vectors_name), matrix)
+        meta = {
+            "ids": list(ids),
+            "documents": list(documents),
+            "metadatas": list(metadatas),
+            "vectors": vectors_name,
+            "dim": int(matrix.shape[1]) if len(ids) else 0,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self.meta_path)
+
+        # Old vectors files stay readable for mapped readers until they re-open
+        for name in os.listdir(self.path):
+            if name.startswith("vectors-") and name != vectors_name:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                except OSError:
+                    pass
+        self._mtime = None
+        self._load()
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        current_ids, current_emb, current_docs, current_meta = self.get_all()
+        rows = {i: (e, d, m) for i, e, d, m in zip(current_ids, current_emb, current_docs, current_meta)}
+        for i, e, d, m in zip(ids, embeddings, documents, metadatas):
+            rows[i] = (np.asarray(e, dtype=np.float32), d, m)
+        self._write(list(rows), [r[0] for r in rows.values()], [r[1] for r in rows.values()], [r[2] for r in rows.values()])
+
+    add = upsert
+
+    def update_metadatas(self, ids, metadatas):
+        """Replaces the metadata of stored chunks, keeping their embeddings."""
+        updates = dict(zip(ids, metadatas))
+        if not updates:
+            return
+        current_ids, current_emb, current_docs, current_meta = self.get_all()
+        self._write(current_ids, current_emb, current_docs,
+                    [updates.get(i, m) for i, m in zip(current_ids, current_meta)])
+
+    def delete(self, ids):
+        ids = set(ids)
+        if not ids:
+            return
+        current = zip(*self.get_all())
+        kept = [row for row in current if row[0] not in ids]
+        self._write([r[0] for r in kept], [r[1] for r in kept], [r[2] for r in kept], [r[3] for r in kept])
+
+
+def open_vector_store(backend=RAG_BACKEND):
+    """Opens the configured retrieval backend."""
+    if backend == "numpy":
+        return NumpyVectorStore()
+    if backend == "chroma":
+        return ChromaVectorStore()
+    raise ValueError(f"Unknown RAG_BACKEND: {backend}")
+
+
+def export_chroma_to_numpy():
+    """Copies the ChromaDB collection into the NumPy index (no re-embedding)."""
+    ids, embeddings, documents, metadatas = ChromaVectorStore().get_all()
+    target = NumpyVectorStore()
+    target._write(ids, embeddings, documents, metadatas)
+    print(f"Exported {len(ids)} chunks to {target.path}")
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["export-numpy"]:
+        export_chroma_to_numpy()
+    else:
+        print("Usage: python backend/vector_store.py export-numpy")
+        sys.exit(1)
@@ -0,0 +1,218 @@
+"""
+Local stand-in for the OpenAI API, for benchmarks that must not spend credits.
+
+- POST /v1/embeddings: deterministic embeddings. Each word maps to a fixed
+  random vector and a text is the normalized sum of its words, so texts that
+  share words are close, as with real embeddings.
+- POST /v1/chat/completions: a canned Hebrew report (JSON mode) or answer,
+  after a configurable latency; supports stream=true.
+
+Run standalone and point the app at it with OPENAI_BASE_URL:
+    python benchmarks/fake_openai.py --port 8089 --chat-latency 0.8
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=sk-fake python backend/app.py
+"""
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+_WORD_RE = re.compile(r"[^\W_]+")
+
+REPORT = {
+    "executive_summary": "העסק נדרש לעמוד בדרישות בטיחות אש, תברואה ורישוי לפני הפתיחה. "
+                         "יש להגיש תכניות חתומות, להתקין מערכת כיבוי ולהסדיר פינוי פסולת.",
+    "recommendations": {
+        "before_opening": ["שלב 1: הגשת תכנית עסק חתומה", "שלב 2: התקנת מערכת כיבוי אש במטבח"],
+        "during_setup": ["שלב 3: הסדרת מפריד שומן ופינוי פסולת"],
+        "after_opening": ["שלב 4: בדיקה תקופתית של מתקן הגז"],
+    },
+    "requirements_by_priority": [
+        {"category": "בטיחות אש", "title": "מערכת כיבוי אש", "priority": "קריטי",
+         "actions": ["התקנת מערכת כיבוי אוטומטית מעל הכיריים"], "estimated_cost": "5,000-15,000 ₪",
+         "estimated_time": "2-4 שבועות"},
+        {"category": "בריאות ותברואה", "title": "כיור לשטיפת ידיים", "priority": "גבוה",
+         "actions": ["התקנת כיור נפרד לשטיפת ידיים באזור ההכנה"], "estimated_cost": "1,000-3,000 ₪",
+         "estimated_time": "שבוע"},
+    ],
+    "estimated_cost": "10,000-30,000 ₪",
+    "estimated_time": "1-3 חודשים",
+}
+ANSWER = ("לפי סעיף 6.7.4, עסק המשתמש בגז לבישול נדרש להתקין מערכת כיבוי אש אוטומטית במנדף, "
+          "ולבצע בדיקה תקופתית על ידי בודק מוסמך.")
+
+
+@lru_cache(maxsize=65536)
+def _word_vector(word, dim):
+    seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "big")
+    return np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+
+
+def embed_text(text, dim=EMBEDDING_DIM):
+    """Deterministic embedding of `text`: the normalized sum of its words' fixed random vectors."""
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in _WORD_RE.findall(str(text).lower()):
+        vector += _word_vector(word, dim)
+    norm = np.linalg.norm(vector)
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return vector / norm
+
+
+def _count_tokens(text):
+    return max(1, len(str(text)) // 4)
+
+
+class FakeOpenAI:
+    """Settings and counters shared by the request handlers."""
+
+    def __init__(self, chat_latency=0.5, embed_latency=0.02, jitter=0.2, dim=EMBEDDING_DIM):
+        self.chat_latency = chat_latency
+        self.embed_latency = embed_latency
+        self.jitter = jitter
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.calls = {"embeddings": 0, "chat": 0}
+
+    def delay(self, base):
+        if base > 0:
+            time.sleep(base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def count(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] += 1
+
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+        disable_nagle_algorithm = True  # headers and body are separate writes; avoid the 40ms delayed-ACK stall
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/stats"):
+                self._send_json(200, dict(fake.calls))
+            else:
+                self._send_json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                return self._send_json(400, {"error": {"message": "invalid JSON"}})
+            if self.path.endswith("/embeddings"):
+                return self._embeddings(body)
+            if self.path.endswith("/chat/completions"):
+                return self._chat(body)
+            self._send_json(404, {"error": {"message": f"unknown endpoint {self.path}"}})
+
+        def _embeddings(self, body):
+            fake.count("embeddings")
+            inputs = body.get("input")
+            inputs = [inputs] if isinstance(inputs, str) else list(inputs or [])
+            fake.delay(fake.embed_latency)
+            tokens = sum(_count_tokens(text) for text in inputs)
+            self._send_json(200, {
+                "object": "list",
+                "model": body.get("model", "text-embedding-3-small"),
+                "data": [
+                    {"object": "embedding", "index": i, "embedding": embed_text(text, fake.dim).tolist()}
+                    for i, text in enumerate(inputs)
+                ],
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            })
+
+        def _chat(self, body):
+            fake.count("chat")
+            json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+            content = json.dumps(REPORT, ensure_ascii=False) if json_mode else ANSWER
+            prompt_tokens = sum(_count_tokens(m.get("content", "")) for m in body.get("messages", []))
+            usage = {"prompt_tokens": prompt_tokens, "completion_tokens": _count_tokens(content),
+                     "total_tokens": prompt_tokens + _count_tokens(content)}
+            base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "gpt-4o-mini")}
+
+            if not body.get("stream"):
+                fake.delay(fake.chat_latency)
+                return self._send_json(200, {
+                    **base,
+                    "object": "chat.completion",
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+
+            # Streamed: time to first token is a fifth of the latency, the rest is spread over the chunks
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            pieces = [content[i:i + 24] for i in range(0, len(content), 24)]
+            fake.delay(fake.chat_latency * 0.2)
+            for piece in pieces:
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                fake.delay(fake.chat_latency * 0.8 / len(pieces))
+            done = {**base, "object": "chat.completion.chunk",
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(done)}\n\n".encode("utf-8"))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}
+                self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def start_fake_openai(port=0, chat_latency=0.5, embed_latency=0.02, jitter=0.2, dim=EMBEDDING_DIM):
+    """Starts the server on a daemon thread. Returns (server, base_url, FakeOpenAI settings)."""
+    fake = FakeOpenAI(chat_latency, embed_latency, jitter, dim)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-openai", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1", fake
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API for benchmarks")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="seconds per chat completion")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="seconds per embeddings request")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative latency jitter (0.2 = +/-20%%)")
+    args = parser.parse_args(argv)
+
+    server, url, _ = start_fake_openai(args.port, args.chat_latency, args.embed_latency, args.jitter)
+    print(f"Fake OpenAI listening on {url} (chat {args.chat_latency}s, embeddings {args.embed_latency}s)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,99 @@
+"""
+Measures how long `import backend.app` takes in a fresh interpreter: what a
+gunicorn worker (without --preload), a test run or a CLI script pays before
+doing anything.
+
+    python benchmarks/import_time.py                  # median of 5 runs + slowest packages
+    python benchmarks/import_time.py --runs 10 --max-ms 400
+
+Fails (exit 1) when the median is over --max-ms, or when the import pulls in
+a module that should only load on first use (the OpenAI SDK, ChromaDB).
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+
+# Loaded on first use, never by the import itself
+LAZY_MODULES = ["openai", "chromadb", "httpx"]
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import backend.app
+elapsed = time.perf_counter() - start
+print("import_ms", elapsed * 1000)
+print("loaded", *[m for m in {lazy!r} if m in sys.modules])
+"""
+
+
+def run_probe(env):
+    proc = subprocess.run(
+        [sys.executable, "-c", PROBE.format(lazy=LAZY_MODULES)],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode:
+        raise SystemExit(f"❌ import backend.app failed:\n{proc.stderr}")
+    stdout = proc.stdout
+    # The app's own log lines share stdout with the results
+    results = {line.split()[0]: line.split()[1:] for line in stdout.splitlines()
+               if line.startswith(("import_ms", "loaded"))}
+    return float(results["import_ms"][0]), results["loaded"]
+
+
+def slowest_packages(env, top):
+    """Import time per top-level package (summed self times), from -X importtime."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import backend.app"],
+        cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0) + int(self_us) / 1000
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Time `import backend.app` in fresh interpreters")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest packages to list")
+    parser.add_argument("--max-ms", type=float, help="fail if the median import time is above this")
+    args = parser.parse_args(argv)
+
+    env = {**os.environ, "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+    times = []
+    eager = set()
+    for _ in range(args.runs):
+        ms, loaded = run_probe(env)
+        times.append(ms)
+        eager.update(loaded)
+
+    median = statistics.median(times)
+    print(f"⏱️ import backend.app: median {median:.0f}ms, min {min(times):.0f}ms, max {max(times):.0f}ms "
+          f"({args.runs} runs)")
+    print("\nslowest packages:")
+    for name, ms in slowest_packages(env, args.top):
+        print(f"  {ms:8.1f}ms  {name}")
+
+    failed = False
+    if eager:
+        print(f"\n❌ Imported eagerly: {', '.join(sorted(eager))}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"\n❌ Median {median:.0f}ms is over --max-ms {args.max_ms:.0f}")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
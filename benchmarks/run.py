@@ -0,0 +1,399 @@
+"""
+Benchmarks rule matching, retrieval and the report/RAG endpoints against a
+local fake OpenAI server, so no credits are spent and chat latency is fixed.
+
+    python benchmarks/run.py                                   # everything, concurrency 1,4,16
+    python benchmarks/run.py --scenarios match-index,rag --requests 500
+    python benchmarks/run.py --gunicorn --concurrency 1,32,128 --chat-latency 1.5
+    python benchmarks/run.py --compare benchmarks/results/<older>.json
+    python benchmarks/run.py --scenarios match-batch,match-batch-ndjson --concurrency 1 --batch-max-ms 5000
+
+Scenarios:
+    match-linear     load_rules() + rule_matches over every rule (in process)
+    match-index      the compiled RuleIndex.match (in process)
+    retrieve         retrieve_relevant_chunks (in process, fake embeddings)
+    generate-report  POST /api/generate-report (app in a subprocess)
+    rag              POST /api/rag (app in a subprocess)
+    rag-batch        POST /api/rag/batch with --batch-size questions per request
+    match-batch      POST /api/match-batch, a JSON list of --batch-profiles profiles
+    match-batch-ndjson  the same batch as an NDJSON body (one profile per line)
+
+The app gets a temporary numpy vector index built from regulations.docx with
+the fake embeddings. Report/RAG caches and precomputed reports are off unless
+--cache is given. Results are saved as JSON to benchmarks/results/.
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(BENCH_DIR)
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+for path in (PROJECT_ROOT, BENCH_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from workload import profiles, questions  # noqa: E402
+
+IN_PROCESS_SCENARIOS = ["match-linear", "match-index", "retrieve"]
+HTTP_SCENARIOS = ["generate-report", "rag", "rag-batch", "match-batch", "match-batch-ndjson"]
+MATCH_BATCH_SCENARIOS = ["match-batch", "match-batch-ndjson"]
+SCENARIOS = IN_PROCESS_SCENARIOS + HTTP_SCENARIOS
+WARMUP_REQUESTS = 5
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout, proc=None):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"process exited with code {proc.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def bench_env(args, workdir, openai_url):
+    """Environment for the app (this process and the server subprocess)."""
+    env = {
+        "OPENAI_BASE_URL": openai_url,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "RAG_BACKEND": "numpy",
+        "NUMPY_INDEX_PATH": os.path.join(workdir, "vector_index"),
+        "RAG_CACHE_DB": os.path.join(workdir, "rag_cache.sqlite3") if args.cache else "",
+        "REPORT_CACHE_DB": "",
+        "PRECOMPUTED_REPORTS_PATH": os.path.join(workdir, "precomputed_reports.json"),
+        "RAG_LEXICAL_CHECK_INTERVAL": "3600",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    }
+    if not args.cache:
+        env.update({"REPORT_CACHE_SIZE": "0", "EMBEDDING_CACHE_SIZE": "0", "ANSWER_CACHE_SIZE": "0"})
+    return env
+
+
+def build_index(index_path):
+    """Chunks regulations.docx and stores it in a numpy index with fake embeddings (and rule links)."""
+    from fake_openai import embed_text
+    from backend.vector_store import NumpyVectorStore
+    from backend.chunk_rules import RuleLinker
+    from backend.build_rag_index import DOCX_PATH, extract_docx, split_into_sections, sections_to_items, load_ruleset
+
+    items = list(sections_to_items(split_into_sections(extract_docx(DOCX_PATH))))
+    linker = RuleLinker(load_ruleset().rules)
+    NumpyVectorStore(index_path).upsert(
+        ids=[item["id"] for item in items],
+        embeddings=[embed_text(item["chunk"]) for item in items],
+        documents=[item["chunk"] for item in items],
+        metadatas=[dict(item.get("metadata", {}), id=item["id"], **linker.metadata(item["chunk"])) for item in items],
+    )
+    return len(items)
+
+
+def run_load(fn, payloads, concurrency):
+    """Calls fn(payload) for every payload from `concurrency` threads; returns latencies and errors."""
+    latencies = [None] * len(payloads)
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        start = time.perf_counter()
+        try:
+            fn(payloads[i])
+        except Exception as e:
+            with lock:
+                errors.append(f"{type(e).__name__}: {e}")
+            return
+        latencies[i] = time.perf_counter() - start
+
+    for payload in payloads[:WARMUP_REQUESTS]:
+        with contextlib.suppress(Exception):
+            fn(payload)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(len(payloads))))
+    wall = time.perf_counter() - start
+    return [t for t in latencies if t is not None], errors, wall
+
+
+def summarize(scenario, concurrency, latencies, errors, wall):
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "rps": round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+    }
+    for name, q in [("p50_ms", 50), ("p95_ms", 95), ("p99_ms", 99)]:
+        result[name] = round(float(np.percentile(ms, q)), 3) if len(ms) else None
+    result["mean_ms"] = round(float(ms.mean()), 3) if len(ms) else None
+    if errors:
+        result["first_error"] = errors[0][:300]
+    return result
+
+
+def in_process_target(scenario):
+    """Imports the app in this process and returns (fn, payload kind) for the scenario."""
+    from backend import app as backend_app
+    from backend.matching import rule_matches
+
+    if scenario == "match-linear":
+        def fn(data):
+            user = backend_app.build_user_profile(data)
+            return [r for r in backend_app.load_rules() if rule_matches(r, user)]
+        return fn, "profile"
+    if scenario == "match-index":
+        def fn(data):
+            return backend_app.get_rule_index().match(backend_app.build_user_profile(data))
+        return fn, "profile"
+
+    def fn(question):
+        chunks = backend_app.retrieve_relevant_chunks(question)
+        if not chunks:
+            raise RuntimeError("no chunks retrieved")
+        return chunks
+    return fn, "question"
+
+
+def json_body(data):
+    return {"content": json.dumps(data, ensure_ascii=False).encode(), "headers": {"Content-Type": "application/json"}}
+
+
+def ndjson_body(items):
+    lines = "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+    return {"content": lines.encode(), "headers": {"Content-Type": "application/x-ndjson"}}
+
+
+HTTP_TARGETS = {
+    # scenario: (path, payload kind, request body as httpx.post arguments)
+    "generate-report": ("/api/generate-report", "profile", json_body),
+    "rag": ("/api/rag", "question", lambda payload: json_body({"question": payload})),
+    "rag-batch": ("/api/rag/batch", "question-batch", lambda payload: json_body({"questions": payload})),
+    "match-batch": ("/api/match-batch", "profile-batch", json_body),
+    "match-batch-ndjson": ("/api/match-batch", "profile-batch", ndjson_body),
+}
+
+
+def http_target(scenario, base_url, concurrency):
+    import httpx
+
+    client = httpx.Client(base_url=base_url, timeout=120,
+                          limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+    path, kind, body = HTTP_TARGETS[scenario]
+
+    def fn(request_args):
+        resp = client.post(path, **request_args)
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}: {resp.text[:200]}")
+        return resp
+
+    # Bodies are encoded up front, so the client's JSON encoding is not timed
+    return fn, client, kind, body
+
+
+def start_server(args, env, workdir):
+    """Starts the app (werkzeug threaded, or gunicorn) in a subprocess; returns (proc, base_url)."""
+    port = free_port()
+    if args.gunicorn:
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "backend/gunicorn.conf.py",
+               "-b", f"127.0.0.1:{port}", "backend.app:app"]
+    else:
+        cmd = [sys.executable, "-c",
+               f"from backend.app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    proc = subprocess.Popen(cmd, cwd=PROJECT_ROOT, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for(base_url + "/", timeout=120, proc=proc)
+    except RuntimeError as e:
+        proc.kill()
+        raise RuntimeError(f"app failed to start ({e}), see {log.name}")
+    return proc, base_url
+
+
+def git_revision():
+    def git(*cmd):
+        try:
+            return subprocess.run(["git", *cmd], cwd=PROJECT_ROOT, capture_output=True, text=True,
+                                  timeout=30).stdout.strip()
+        except (OSError, subprocess.SubprocessError):
+            return ""
+
+    return {"commit": git("rev-parse", "--short", "HEAD") or None,
+            "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+
+def print_table(results):
+    print(f"\n{'scenario':<18} {'conc':>5} {'reqs':>6} {'err':>4} {'rps':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'mean ms':>9}", flush=True)
+    for r in results:
+        cells = [f"{r[k]:>9.2f}" if r[k] is not None else f"{'-':>9}" for k in ["p50_ms", "p95_ms", "p99_ms", "mean_ms"]]
+        print(f"{r['scenario']:<18} {r['concurrency']:>5} {r['requests']:>6} {r['errors']:>4} {r['rps']:>9.1f} "
+              + " ".join(cells), flush=True)
+
+
+def compare(old_path, results):
+    """Prints p50/p95/rps changes against an earlier results file (negative latency change = faster)."""
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    before = {(r["scenario"], r["concurrency"]): r for r in old["results"]}
+    print(f"\nCompared with {old_path} (commit {old['meta'].get('commit')}):", flush=True)
+    print(f"{'scenario':<18} {'conc':>5} {'p50':>9} {'p95':>9} {'rps':>9}", flush=True)
+
+    def change(new, prev):
+        if new is None or not prev:
+            return f"{'-':>9}"
+        return f"{(new - prev) / prev * 100:>+8.1f}%"
+
+    for r in results:
+        prev = before.get((r["scenario"], r["concurrency"]))
+        if prev is None:
+            continue
+        print(f"{r['scenario']:<18} {r['concurrency']:>5} {change(r['p50_ms'], prev['p50_ms'])} "
+              f"{change(r['p95_ms'], prev['p95_ms'])} {change(r['rps'], prev['rps'])}", flush=True)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Benchmark matching, retrieval and the API endpoints")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated: {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario and concurrency level")
+    parser.add_argument("--match-requests", type=int, default=5000, help="requests for the matching scenarios")
+    parser.add_argument("--batch-size", type=int, default=10, help="questions per rag-batch request")
+    parser.add_argument("--batch-profiles", type=int, default=100_000, help="profiles per match-batch request")
+    parser.add_argument("--batch-requests", type=int, default=3, help="requests for the match-batch scenarios")
+    parser.add_argument("--batch-max-ms", type=float, help="fail if a match-batch scenario's p50 is above this")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="fake chat completion latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="fake embeddings latency (s)")
+    parser.add_argument("--url", help="benchmark an already running app instead of starting one")
+    parser.add_argument("--gunicorn", action="store_true", help="serve the app with gunicorn instead of werkzeug")
+    parser.add_argument("--cache", action="store_true", help="keep the report/embedding/answer caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<time>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    procs = []
+    results = []
+    try:
+        openai_port = free_port()
+        procs.append(subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "fake_openai.py"), "--port", str(openai_port),
+             "--chat-latency", str(args.chat_latency), "--embed-latency", str(args.embed_latency)],
+            stdout=subprocess.DEVNULL))
+        openai_url = f"http://127.0.0.1:{openai_port}/v1"
+        wait_for(openai_url + "/stats", timeout=30, proc=procs[0])
+
+        env = bench_env(args, workdir, openai_url)
+        os.environ.update(env)  # before the app modules are imported
+        chunks = build_index(env["NUMPY_INDEX_PATH"])
+        print(f"📚 Benchmark index: {chunks} chunks in {workdir}", flush=True)
+
+        base_url = args.url
+        if any(s in HTTP_SCENARIOS for s in args.scenarios) and not base_url:
+            proc, base_url = start_server(args, env, workdir)
+            procs.append(proc)
+            print(f"🚀 App on {base_url} ({'gunicorn' if args.gunicorn else 'werkzeug'})", flush=True)
+
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                client = body = None
+                if scenario in HTTP_SCENARIOS:
+                    fn, client, kind, body = http_target(scenario, base_url, concurrency)
+                    n = args.batch_requests if scenario in MATCH_BATCH_SCENARIOS else args.requests
+                else:
+                    fn, kind = in_process_target(scenario)
+                    n = args.match_requests if scenario.startswith("match") else args.requests
+                if kind == "profile":
+                    payloads = profiles(n, args.seed)
+                elif kind == "question-batch":
+                    flat = questions(n * args.batch_size, args.seed)
+                    payloads = [flat[i:i + args.batch_size] for i in range(0, len(flat), args.batch_size)]
+                elif kind == "profile-batch":
+                    payloads = [profiles(args.batch_profiles, args.seed + i) for i in range(n)]
+                else:
+                    payloads = questions(n, args.seed)
+                if body is not None:
+                    payloads = [body(payload) for payload in payloads]
+                try:
+                    latencies, errors, wall = run_load(fn, payloads, concurrency)
+                finally:
+                    if client is not None:
+                        client.close()
+                result = summarize(scenario, concurrency, latencies, errors, wall)
+                results.append(result)
+                print(f"  {scenario} x{concurrency}: {result['rps']} req/s, p50 {result['p50_ms']} ms, "
+                      f"p99 {result['p99_ms']} ms, {result['errors']} errors", flush=True)
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            with contextlib.suppress(subprocess.TimeoutExpired):
+                proc.wait(timeout=10)
+
+    print_table(results)
+    meta = {
+        **git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "server": "external" if args.url else ("gunicorn" if args.gunicorn else "werkzeug"),
+        "chat_latency": args.chat_latency,
+        "embed_latency": args.embed_latency,
+        "cache": args.cache,
+        "seed": args.seed,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{meta['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Results saved to {output}", flush=True)
+
+    if args.compare:
+        compare(args.compare, results)
+
+    failed = any(r["errors"] for r in results)
+    if args.batch_max_ms is not None:
+        for r in results:
+            if r["scenario"] in MATCH_BATCH_SCENARIOS and (r["p50_ms"] is None or r["p50_ms"] > args.batch_max_ms):
+                print(f"❌ {r['scenario']} x{r['concurrency']}: p50 {r['p50_ms']} ms is over --batch-max-ms "
+                      f"{args.batch_max_ms:.0f}", flush=True)
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
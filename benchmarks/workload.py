@@ -0,0 +1,58 @@
+"""
+Synthetic, reproducible request payloads for the benchmarks: questionnaire
+profiles shaped like the frontend's, and Hebrew regulation questions.
+"""
+import random
+
+BUSINESS_TYPES = ["restaurant", "cafe", "bar", "bakery", "food_truck", "catering"]
+BUSINESS_NAMES = ["מסעדת הים", "קפה השכונה", "בר הנמל", "מאפיית הבוקר", "אוכל על גלגלים", "קייטרינג אירועים"]
+
+TOPICS = [
+    "כיבוי אש", "מערכת גז", "מנדף במטבח", "מפריד שומן", "פינוי פסולת", "תאורת חירום",
+    "יציאות חירום", "שטיפת ידיים", "קירור מזון", "הגשת משקאות משכרים", "שילוט", "נגישות",
+    "מים ושפכים", "הדברה", "אחסון חומרי ניקוי", "משלוחי מזון", "בשר טרי", "תפוסת קהל",
+]
+TEMPLATES = [
+    "מה הדרישות לגבי {topic}?",
+    "האם עסק עם {topic} צריך אישור מיוחד?",
+    "אילו בדיקות נדרשות עבור {topic} לפני פתיחת העסק?",
+    "מה הנוהל לגבי {topic} במסעדה של {area} מ\"ר?",
+    "מי אחראי על {topic} ומה הקנס אם לא עומדים בדרישה?",
+]
+SECTION_TEMPLATES = [
+    "מה נאמר בסעיף {section}?",
+    "תסביר לי את סעיף {section}",
+]
+SECTIONS = ["4.2", "5.1.3", "6.7.4", "3.1", "7.2.1", "8.4"]
+
+
+def random_profile(rng):
+    """A questionnaire submission like the frontend sends (area/seating as strings)."""
+    index = rng.randrange(len(BUSINESS_TYPES))
+    return {
+        "business_name": BUSINESS_NAMES[index],
+        "business_type": BUSINESS_TYPES[index],
+        "area_sqm": str(rng.choice([rng.randint(15, 80), rng.randint(80, 250), rng.randint(250, 600)])),
+        "seating_capacity": str(rng.choice([0, rng.randint(1, 50), rng.randint(50, 300)])),
+        "has_gas": rng.random() < 0.6,
+        "serves_meat": rng.random() < 0.5,
+        "has_delivery": rng.random() < 0.4,
+        "has_alcohol": rng.random() < 0.3,
+    }
+
+
+def random_question(rng):
+    """A Hebrew question about the regulations; one in six asks for a section by number."""
+    if rng.random() < 1 / 6:
+        return rng.choice(SECTION_TEMPLATES).format(section=rng.choice(SECTIONS))
+    return rng.choice(TEMPLATES).format(topic=rng.choice(TOPICS), area=rng.randint(20, 300))
+
+
+def profiles(n, seed=0):
+    rng = random.Random(seed)
+    return [random_profile(rng) for _ in range(n)]
+
+
+def questions(n, seed=0):
+    rng = random.Random(seed)
+    return [random_question(rng) for _ in range(n)]
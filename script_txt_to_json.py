@@ -1,11 +1,24 @@
 import os
+import sys
 import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from docx import Document
 from openai import OpenAI
 
+from backend.dedupe_rules import dedupe_rules
+
 # 📌 ודא שיש לך משתנה סביבה OPENAI_API_KEY
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+MODEL = "gpt-4.1"
+# לשנות בכל שינוי בפרומפט, כדי שלא ישתמשו בתוצאות שמורות ישנות
+PROMPT_VERSION = "rules-v1"
+# מספר הקריאות המקבילות ל-OpenAI
+MAX_WORKERS = int(os.getenv("RULES_EXTRACT_WORKERS", "4"))
+# תוצאה של כל חלק נשמרת כאן, כך שהרצה חוזרת מדלגת על חלקים שהסתיימו
+CHECKPOINT_DIR = os.getenv("RULES_CHECKPOINT_DIR", "rules_checkpoints")
+
 # ⚙️ פרטי המשתמש – דוגמה ברורה
 user_input = {
     "business_name": "מאפיית חלום",
@@ -64,7 +77,7 @@ def extract_text_from_docx(docx_path):
 
     return "\n".join(full_text)
 
-def convert_rules_with_ai(text, start_id=1):
+def convert_rules_with_ai(text):
     """שולח חלק טקסט ל-ChatGPT ומחזיר JSON"""
     prompt = f"""
 אתה מקבל קטע מתוך קובץ עם חוקים ודרישות.
@@ -118,7 +131,7 @@ def convert_rules_with_ai(text, start_id=1):
     """
 
     response = client.chat.completions.create(
-        model="gpt-4.1",
+        model=MODEL,
         messages=[{"role": "user", "content": prompt}],
         response_format={"type": "json_object"}
     )
@@ -130,9 +143,46 @@ def split_text(text, chunk_size=5000):
     """פיצול הטקסט לחתיכות קטנות יותר"""
     return [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
 
+def checkpoint_path(index, chunk):
+    """קובץ התוצאה של חלק: לפי מיקומו ולפי hash של הטקסט, המודל והפרומפט"""
+    digest = hashlib.sha256(f"{MODEL}\n{PROMPT_VERSION}\n{chunk}".encode("utf-8")).hexdigest()[:12]
+    return os.path.join(CHECKPOINT_DIR, f"chunk_{index:04d}_{digest}.json")
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, data):
+    """כתיבה אטומית – קובץ חלקי לא יישאר אם התהליך נפל באמצע"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+def process_chunk(index, chunk):
+    path = checkpoint_path(index, chunk)
+    ai_data = convert_rules_with_ai(chunk)
+    rules = ai_data.get("rules", [])
+    save_checkpoint(path, {"rules": rules})
+    return rules
+
+def merge_rules(results):
+    """מאחד לפי סדר החלקים וממספר R0001, R0002... – אותו קלט תמיד נותן אותם מזהים"""
+    all_rules = []
+    for index in sorted(results):
+        all_rules.extend(results[index])
+    for n, rule in enumerate(all_rules, start=1):
+        rule["id"] = f"R{n:04d}"
+    return {"rules": all_rules}
+
 if __name__ == "__main__":
     docx_file = "18-07-2022_4.2A.docx"
     output_file = "rules.json"
+    # מיפוי מזהי החוקים לפני האיחוד -> אחרי האיחוד
+    id_map_file = "rules.id_map.json"
 
     print("📂 קורא את הקובץ...")
     text = extract_text_from_docx(docx_file)
@@ -140,29 +190,44 @@ if __name__ == "__main__":
     chunks = split_text(text, chunk_size=5000)
     print(f" הקובץ פוצל ל-{len(chunks)} חלקים")
 
-    #  עיבוד רק חצי קובץ
-    half_index = max(1, len(chunks) // 2)
-    chunks = chunks[:half_index]
-    print(f"📂 מעבד רק {len(chunks)} חלקים (חצי קובץ)")
-
-    all_rules = {"rules": []}
-    current_id = 1
-
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    results = {}
+    todo = []
     for i, chunk in enumerate(chunks, start=1):
-        print(f"🤖 שולח ל-ChatGPT חלק {i}/{len(chunks)}...")
-        try:
-            ai_data = convert_rules_with_ai(chunk, start_id=current_id)
-
-            rules = ai_data.get("rules", [])
-            for j, rule in enumerate(rules, start=0):
-                rule["id"] = f"R{current_id + j:04d}"
-            current_id += len(rules)
-
-            all_rules["rules"].extend(rules)
-        except Exception as e:
-            print(f" שגיאה בחלק {i}: {e}")
+        saved = load_checkpoint(checkpoint_path(i, chunk))
+        if saved is not None:
+            results[i] = saved.get("rules", [])
+        else:
+            todo.append((i, chunk))
+    print(f"💾 {len(results)} חלקים כבר עובדו, נשארו {len(todo)} (עד {MAX_WORKERS} במקביל)")
+
+    failed = []
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(process_chunk, i, chunk): i for i, chunk in todo}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+                print(f"🤖 חלק {i}/{len(chunks)} הסתיים ({len(results[i])} חוקים)")
+            except Exception as e:
+                failed.append(i)
+                print(f" שגיאה בחלק {i}: {e}")
+
+    if failed:
+        print(f" {len(failed)} חלקים נכשלו ({sorted(failed)}). הרץ שוב כדי להשלים – חלקים שהסתיימו לא יישלחו שוב.")
+        sys.exit(1)
+
+    all_rules = merge_rules(results)
+
+    # חלקים חופפים מחלצים את אותו חוק כמה פעמים – מאחדים כפילויות בלי לשנות את תוצאות ההתאמה
+    deduped, id_map, stats = dedupe_rules(all_rules["rules"])
+    print(f"🧹 איחוד כפילויות: {stats['rules_before']} -> {stats['rules_after']} חוקים "
+          f"({stats['exact_duplicates']} זהים, {stats['near_duplicates']} דומים)")
+    all_rules = {"rules": deduped}
 
     with open(output_file, "w", encoding="utf-8") as f:
         json.dump(all_rules, f, ensure_ascii=False, indent=2)
+    with open(id_map_file, "w", encoding="utf-8") as f:
+        json.dump(id_map, f, ensure_ascii=False, indent=2)
 
-    print(f"קובץ JSON נוצר בהצלחה: {output_file}")
+    print(f"קובץ JSON נוצר בהצלחה: {output_file} ({len(all_rules['rules'])} חוקים)")
@@ -0,0 +1,60 @@
+import os
+import random
+
+import pytest
+
+from backend.matching import (DEFAULT_FOOD_TYPE, RuleIndex, rule_matches, random_profile, random_rule,
+                              _outcome, _thresholds)
+from backend.rule_store import RuleStore
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend", "json_rules")
+BUSINESS_TYPES = ["cafe", "food_truck", "restaurant", "bar", "bakery", "catering"]
+FOOD_TYPES = ["בשר", "חלב", "פרווה", DEFAULT_FOOD_TYPE]
+
+
+def verify_equivalence(rules, profiles):
+    """
+    Returns the profiles on which RuleIndex and rule_matches disagree.
+    A profile on which the linear scan raises must make the index raise the same error type.
+    """
+    index = RuleIndex(rules)
+    mismatches = []
+    for user in profiles:
+        expected = _outcome(lambda: [r for r in rules if rule_matches(r, user)])
+        if _outcome(lambda: index.match(user)) != expected:
+            mismatches.append(user)
+    return mismatches
+
+
+def generated_profiles(rng, rules, count=3000):
+    thresholds = _thresholds(rules)
+    return [random_profile(rng, BUSINESS_TYPES, FOOD_TYPES, thresholds) for _ in range(count)]
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_index_matches_linear_scan_on_real_rules(seed):
+    rules = list(RuleStore(RULES_DIR).get().rules)
+    assert verify_equivalence(rules, generated_profiles(random.Random(seed), rules)) == []
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_index_matches_linear_scan_on_synthetic_rules(seed):
+    rng = random.Random(seed)
+    rules = [random_rule(rng, i, BUSINESS_TYPES, FOOD_TYPES) for i in range(2000)]
+    assert verify_equivalence(rules, generated_profiles(rng, rules)) == []
+
+
+def test_index_matches_linear_scan_on_real_profiles():
+    rules = list(RuleStore(RULES_DIR).get().rules)
+    profiles = [
+        {"business_name": "פיצה", "business_type": "restaurant", "area_sqm": 80, "seating_capacity": 40,
+         "has_gas": True, "serves_meat": True, "has_delivery": True, "has_alcohol": False, "food_type": "בשר"},
+        {"business_name": "קפה", "business_type": "cafe", "area_sqm": 25, "seating_capacity": 10,
+         "has_gas": False, "serves_meat": False, "has_delivery": False, "has_alcohol": False},
+        {"business_name": "משאית", "business_type": "food_truck", "area_sqm": None, "seating_capacity": None,
+         "has_gas": True, "serves_meat": True, "has_delivery": False, "has_alcohol": False},
+        {"business_name": "בר", "business_type": "bar", "area_sqm": 300, "seating_capacity": 250,
+         "has_gas": False, "serves_meat": False, "has_delivery": False, "has_alcohol": True, "food_type": "חלב"},
+    ]
+    assert all(RuleIndex(rules).match(user) for user in profiles)
+    assert verify_equivalence(rules, profiles) == []
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from backend.streaming import JsonSectionParser, iter_json_sections
+
+SAMPLES = [
+    {"executive_summary": "תקציר", "estimated_cost": 1500.75, "estimated_time": "3 חודשים"},
+    {"count": -3e2, "ratio": 0.5, "ok": True, "none": None, "n": 12},
+    {"recommendations": {"before_opening": ["שלב 1", "שלב 2"]}, "total": 1500, "tail": [1, 2.5, -3]},
+    {"a": '}{][,:\\"', "b": [{"c": -0.0}], "d": 10, "e": False},
+]
+
+
+def splits(text):
+    """Every way to cut `text` into three chunks (empty chunks included)."""
+    for i in range(len(text) + 1):
+        for j in range(i, len(text) + 1):
+            yield [text[:i], text[i:j], text[j:]]
+
+
+@pytest.mark.parametrize("obj", SAMPLES)
+def test_sections_survive_every_split_point(obj):
+    text = json.dumps(obj, ensure_ascii=False)
+    for chunks in splits(text):
+        assert list(iter_json_sections(chunks)) == list(obj.items()), chunks
+
+
+def test_sections_are_emitted_before_the_object_ends():
+    parser = JsonSectionParser()
+    assert parser.feed('{"summary": "done", "total": 15') == [("summary", "done")]
+    assert parser.feed("00.5, ") == [("total", 1500.5)]
+    assert parser.feed('"rest": [1]}') == [("rest", [1])]
+    assert parser.close() == {"summary": "done", "total": 1500.5, "rest": [1]}
+
+
+@pytest.mark.parametrize("text", ['{"a": 1 2}', '{"a": "x" "b"}', '{"a": 1, 2: 3}', '{"a": 1.}'])
+def test_malformed_objects_raise(text):
+    with pytest.raises(ValueError):
+        list(iter_json_sections([text]))